@@ -78,8 +78,8 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
     
-    def update_streak(self):
-        """Update daily streak"""
+    def update_streak(self, commit=True):
+        """Update daily streak; ``commit=False`` leaves saving to the caller"""
         from datetime import date, timedelta
         
         today = date.today()
@@ -95,7 +95,8 @@ class UserProfile(models.Model):
             self.longest_streak = self.streak_days
             
         self.last_activity_date = today
-        self.save()
+        if commit:
+            self.save()
 
 class Achievement(models.Model):
     """User achievements system"""
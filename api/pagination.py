@@ -0,0 +1,33 @@
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from leaderboards.pagination import PAGE_SIZE, page_size, queryset_page
+
+CURSOR_PARAM = 'cursor'
+PAGE_SIZE_PARAM = 'page_size'
+
+
+def cursor_link(request, cursor):
+    """Absolute URL of the page starting after ``cursor``, or None"""
+    if cursor is None:
+        return None
+    return replace_query_param(request.build_absolute_uri(), CURSOR_PARAM, cursor)
+
+
+class RankCursorPagination(BasePagination):
+    """Keyset pagination of a leaderboard table on ``(rank_field, user_id)``"""
+    rank_field = 'rank'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        rank_field = getattr(view, 'rank_field', self.rank_field)
+        size = page_size(request.query_params.get(PAGE_SIZE_PARAM), PAGE_SIZE)
+        self.page = queryset_page(queryset, request.query_params.get(CURSOR_PARAM), size, rank_field)
+        return self.page.entries
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': cursor_link(self.request, self.page.next_cursor),
+            'results': data,
+        })
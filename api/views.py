@@ -1,13 +1,24 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ParseError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
 from django.db.models import Count, Avg, Sum
 from accounts.models import User, UserProfile
 from quizzes.models import Quiz, QuizAttempt
 from eco_tasks.models import EcoTask, UserTask
-from leaderboards.models import GlobalLeaderboard
+from leaderboards.models import GlobalLeaderboard, LeaderboardType, LeaderboardSeason
+from leaderboards.metrics import SCOPE_FIELDS, get_partition
+from leaderboards.periods import period_bounds
+from leaderboards.ranking import (
+    around_user, ensure_board, ensure_global, ensure_season, local_board_type,
+)
+from leaderboards.archive import rank_history
+from leaderboards.pagination import board_page, page_size
+from leaderboards.sketches import HISTOGRAM_BINS, board_distribution
+from .pagination import CURSOR_PARAM, PAGE_SIZE_PARAM, RankCursorPagination, cursor_link
 from rewards.models import EcoTokenTransaction
 
 User = get_user_model()
@@ -29,16 +40,22 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
 
 class QuizViewSet(viewsets.ReadOnlyModelViewSet):
     """API endpoint for quiz data"""
-    queryset = Quiz.objects.filter(is_active=True)
+    queryset = Quiz.objects.filter(is_active=True).select_related('stats')
     permission_classes = [IsAuthenticated]
     
     def get_serializer_class(self):
         from rest_framework import serializers
         
         class QuizSerializer(serializers.ModelSerializer):
+            # Read from the quiz's QuizStats row, loaded with the quiz
+            questions_count = serializers.IntegerField(source='get_questions_count', read_only=True)
+            average_score = serializers.FloatField(source='get_average_score', read_only=True)
+            completion_rate = serializers.FloatField(source='get_completion_rate', read_only=True)
+            
             class Meta:
                 model = Quiz
-                fields = ['id', 'title', 'description', 'difficulty', 'base_tokens_reward']
+                fields = ['id', 'title', 'description', 'difficulty', 'base_tokens_reward',
+                          'questions_count', 'average_score', 'completion_rate']
         
         return QuizSerializer
 
@@ -59,8 +76,10 @@ class TaskViewSet(viewsets.ReadOnlyModelViewSet):
 
 class LeaderboardViewSet(viewsets.ReadOnlyModelViewSet):
     """API endpoint for leaderboard data"""
-    queryset = GlobalLeaderboard.objects.all()
+    queryset = GlobalLeaderboard.objects.select_related('user')
     permission_classes = [IsAuthenticated]
+    pagination_class = RankCursorPagination
+    rank_field = 'global_rank'
     
     def get_serializer_class(self):
         from rest_framework import serializers
@@ -73,6 +92,143 @@ class LeaderboardViewSet(viewsets.ReadOnlyModelViewSet):
                 fields = ['global_rank', 'username', 'total_score']
         
         return LeaderboardSerializer
+    
+    AROUND_ME_DEFAULT = 10
+    AROUND_ME_MAX = 50
+    DISTRIBUTION_MAX_BINS = 50
+    
+    @staticmethod
+    def _int_param(params, name, default=None):
+        try:
+            return int(params.get(name, default))
+        except (TypeError, ValueError):
+            raise ParseError(f'{name} must be an integer')
+    
+    def _board_key(self, request):
+        """Resolve the board named by the query string to its backend key.
+        
+        None when the board does not exist for this user, e.g. a city board
+        for a user without a city.
+        """
+        params = request.query_params
+        user = request.user
+        
+        if params.get('season'):
+            season = get_object_or_404(LeaderboardSeason, id=self._int_param(params, 'season'), is_active=True)
+            return ensure_season(season)
+        
+        if params.get('location_type'):
+            location_type = params['location_type']
+            leaderboard_type = local_board_type(location_type, params.get('period', 'all_time'))
+            if leaderboard_type is None:
+                return None
+            partition = params.get('location_value') or get_partition(leaderboard_type, user)
+        elif params.get('type'):
+            leaderboard_type = get_object_or_404(LeaderboardType, id=self._int_param(params, 'type'), is_active=True)
+            partition = get_partition(leaderboard_type, user)
+        else:
+            return ensure_global()
+        
+        if SCOPE_FIELDS[leaderboard_type.scope] and not partition:
+            return None
+        period_start, period_end = period_bounds(leaderboard_type.period)
+        return ensure_board(leaderboard_type, period_start, period_end, partition or '')
+    
+    @action(detail=False)
+    def board(self, request):
+        """One page of a board, picked with the same parameters as ``around-me``.
+        
+        Follow ``next`` for the following page; every page costs the same
+        however deep it is.
+        """
+        key = self._board_key(request)
+        if key is None:
+            return Response({'next': None, 'results': []})
+        size = page_size(request.query_params.get(PAGE_SIZE_PARAM))
+        page = board_page(key, request.query_params.get(CURSOR_PARAM), size)
+        
+        return Response({
+            'next': cursor_link(request, page.next_cursor),
+            'results': [
+                {
+                    'rank': entry.rank,
+                    'score': entry.score,
+                    'user_id': entry.user.pk,
+                    'username': entry.user.username,
+                } for entry in page.entries
+            ],
+        })
+    
+    HISTORY_DEFAULT = 100
+    HISTORY_MAX = 1000
+    
+    @action(detail=False)
+    def history(self, request):
+        """The current user's rank in each archived period of one board.
+        
+        ``type`` names the LeaderboardType; ``limit`` caps the number of most
+        recent periods returned. Served from the archive files, not the database.
+        """
+        if not request.query_params.get('type'):
+            raise ParseError('type is required')
+        leaderboard_type = get_object_or_404(LeaderboardType, id=self._int_param(request.query_params, 'type'))
+        limit = self._int_param(request.query_params, 'limit', self.HISTORY_DEFAULT)
+        limit = max(1, min(limit, self.HISTORY_MAX))
+        
+        partition = get_partition(leaderboard_type, request.user) or ''
+        points = rank_history(leaderboard_type, request.user.pk, partition, limit)
+        return Response({
+            'leaderboard_type': leaderboard_type.pk,
+            'periods': [
+                {
+                    'period_start': point.period_start,
+                    'period_end': point.period_end,
+                    'rank': point.rank,
+                    'score': point.score,
+                } for point in points
+            ],
+        })
+    
+    @action(detail=False, url_path='around-me')
+    def around_me(self, request):
+        """Entries just above and below the current user on one board.
+        
+        Pick the board with ``type`` (LeaderboardType id), ``location_type`` and
+        ``location_value`` (local board), or ``season``; defaults to the global
+        board. ``count`` sets how many entries to return on each side.
+        """
+        count = self._int_param(request.query_params, 'count', self.AROUND_ME_DEFAULT)
+        count = max(1, min(count, self.AROUND_ME_MAX))
+        
+        key = self._board_key(request)
+        entries = around_user(key, request.user, count) if key else []
+        
+        return Response({
+            'user_rank': next((e.rank for e in entries if e.user.pk == request.user.pk), None),
+            'entries': [
+                {
+                    'rank': entry.rank,
+                    'score': entry.score,
+                    'user_id': entry.user.pk,
+                    'username': entry.user.username,
+                    'is_current_user': entry.user.pk == request.user.pk,
+                } for entry in entries
+            ],
+        })
+    
+    @action(detail=False)
+    def distribution(self, request):
+        """Approximate score distribution of one board and the user's "top X%".
+        
+        Takes the same board parameters as ``around-me``; ``bins`` sets the
+        number of histogram buckets.
+        """
+        bins = self._int_param(request.query_params, 'bins', HISTOGRAM_BINS)
+        bins = max(1, min(bins, self.DISTRIBUTION_MAX_BINS))
+        
+        key = self._board_key(request)
+        data = board_distribution(key, request.user, bins) if key else None
+        return Response(data or {'count': 0, 'percentiles': {}, 'histogram': [], 'top_percent': None})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
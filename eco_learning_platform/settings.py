@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     'eco_tasks',
     'leaderboards',
     'chatbot',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -171,3 +172,20 @@ CORS_ALLOWED_ORIGINS = [
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Leaderboards
+# Sorted-set store the leaderboards are served from. RedisBackend needs the
+# 'redis' package and a server speaking the Redis protocol. InProcessBackend
+# keeps the sets in each process and is only correct with a single one, so
+# it is the default for development only.
+LEADERBOARD_BACKEND = config(
+    'LEADERBOARD_BACKEND',
+    default='leaderboards.backends.InProcessBackend' if DEBUG else 'leaderboards.backends.RedisBackend',
+)
+LEADERBOARD_REDIS_URL = config('LEADERBOARD_REDIS_URL', default='redis://localhost:6379/0')
+# Directory holding the columnar archive of closed leaderboard periods
+LEADERBOARD_ARCHIVE_DIR = config('LEADERBOARD_ARCHIVE_DIR', default=str(BASE_DIR / 'leaderboard_archive'))
+# Re-rank users from the background job queue (manage.py runworker) instead
+# of right after each request's transaction commits; needs a shared backend
+# such as RedisBackend and is ignored with the in-process one
+LEADERBOARD_ASYNC_UPDATES = config('LEADERBOARD_ASYNC_UPDATES', default=False, cast=bool)
@@ -11,6 +11,8 @@ from .models import (
 )
 from rewards.views import award_tokens
 from accounts.models import UserProfile
+from leaderboards.activity import record_activity
+from leaderboards.ranking import TASK_METRICS, schedule_user_update
 
 def task_categories(request):
     """Display all task categories"""
@@ -164,6 +166,11 @@ def submit_task(request, task_id):
         messages.success(request, "Task submitted for review!")
     
     user_task.save()
+    
+    if user_task.status == 'completed':
+        record_activity(request.user, user_task.completed_at, tasks_completed=1)
+        schedule_user_update(request.user, TASK_METRICS)
+    
     return redirect('eco_tasks:my_tasks')
 
 @login_required
@@ -0,0 +1,15 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'last_error')
+    readonly_fields = ('created_at', 'locked_at', 'last_error')
+    actions = ['requeue']
+
+    @admin.action(description='Re-queue selected jobs')
+    def requeue(self, request, queryset):
+        queryset.exclude(status='running').update(status='queued', attempts=0, run_at=timezone.now())
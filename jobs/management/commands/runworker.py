@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from jobs.worker import POLL_INTERVAL, THREADS, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs on a thread pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=THREADS,
+            help='Jobs run at the same time',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=POLL_INTERVAL,
+            help='Seconds to wait before looking for new jobs when idle',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once no job is runnable instead of waiting for more',
+        )
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1:
+            raise CommandError('--threads must be at least 1')
+
+        counts = {'done': 0, 'retry': 0, 'dead': 0}
+        try:
+            for result in run_worker(options['threads'], options['poll_interval'], options['burst']):
+                counts[result.outcome] += 1
+                line = f'{result.task} #{result.job_id}: {result.outcome} in {result.seconds:.2f}s'
+                self.stdout.write(line if result.outcome == 'done' else self.style.WARNING(line))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping after running jobs finish')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker stopped: {counts['done']} done, {counts['retry']} retried, {counts['dead']} dead"
+        ))
@@ -0,0 +1,37 @@
+from django.db import models
+from django.utils import timezone
+
+class Job(models.Model):
+    """A queued call of a registered task, run by ``manage.py runworker``"""
+    
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('dead', 'Dead'),  # Out of attempts, kept for inspection
+    ]
+    
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0)  # Higher runs first
+    
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)  # Not before; pushed back on retry
+    
+    # Claim held by a worker while the job runs
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-priority', 'run_at', 'id']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -0,0 +1,127 @@
+"""
+Database-backed job queue.
+
+Functions decorated with ``@task`` can be queued with ``enqueue`` (or the
+``enqueue`` attribute the decorator adds). A job is a ``Job`` row, so
+queuing it inside a transaction makes it durable exactly when that
+transaction commits, with no broker to run. Workers claim queued jobs with a
+conditional UPDATE, which works the same on every database. Successful jobs
+are deleted. A failed job is retried with exponential backoff until
+``max_attempts`` is used up, then left ``dead`` with its last traceback.
+Jobs whose worker died are re-queued once their lease expires, so a task
+may run more than once and should be idempotent.
+"""
+import traceback
+from datetime import timedelta
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+MAX_ATTEMPTS = 5
+
+# Retry delays double from BACKOFF_BASE up to BACKOFF_MAX seconds
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+
+# Seconds a claimed job may run before another worker may take it over
+LEASE_SECONDS = 600
+
+_registry = {}
+
+
+def task(func=None, *, name=None, priority=0, max_attempts=MAX_ATTEMPTS):
+    """Register ``func`` as a task; ``func.enqueue(*args, **kwargs)`` queues a call"""
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        _registry[task_name] = func
+
+        def enqueue_call(*args, **kwargs):
+            return enqueue(task_name, args, kwargs, priority=priority, max_attempts=max_attempts)
+
+        func.task_name = task_name
+        func.enqueue = enqueue_call
+        return func
+
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def discover_tasks():
+    """Import the ``tasks`` module of every installed app"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(task_name, args=(), kwargs=None, priority=0, run_at=None, max_attempts=MAX_ATTEMPTS):
+    """Queue a call of a registered task; arguments must be JSON serializable"""
+    if task_name not in _registry:
+        raise ValueError(f'Unknown task: {task_name}')
+    return Job.objects.create(
+        task=task_name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that failed ``attempts`` times"""
+    return min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+
+
+def claim(worker_id, limit):
+    """Claim up to ``limit`` runnable jobs for ``worker_id``, highest priority first"""
+    now = timezone.now()
+    candidates = Job.objects.filter(status='queued', run_at__lte=now).order_by(
+        '-priority', 'run_at', 'id'
+    ).values_list('pk', flat=True)[:limit * 2]
+
+    claimed = []
+    for pk in candidates:
+        # Loses quietly to any worker that claimed the row first
+        if Job.objects.filter(pk=pk, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        ):
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('-priority', 'run_at', 'id'))
+
+
+def run_job(job):
+    """Run one claimed job; returns 'done', 'retry' or 'dead'"""
+    mine = Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by)
+    func = get_task(job.task)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task: {job.task}')
+        func(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts or func is None:
+            mine.update(status='dead', locked_by='', last_error=error)
+            return 'dead'
+        mine.update(
+            status='queued', locked_by='', locked_at=None, last_error=error,
+            run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+        )
+        return 'retry'
+    mine.delete()
+    return 'done'
+
+
+def requeue_stale(lease=LEASE_SECONDS):
+    """Release jobs held past their lease by a worker that stopped; returns jobs released"""
+    expired = Job.objects.filter(
+        status='running', locked_at__lt=timezone.now() - timedelta(seconds=lease),
+    )
+    dead = expired.filter(attempts__gte=F('max_attempts')).update(
+        status='dead', locked_by='', last_error='Worker lease expired',
+    )
+    return dead + expired.update(status='queued', locked_by='', locked_at=None)
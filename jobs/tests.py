@@ -0,0 +1,106 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+from .queue import backoff, claim, enqueue, requeue_stale, run_job, task
+
+calls = []
+
+
+@task
+def record_call(value):
+    calls.append(value)
+
+
+@task(priority=5)
+def urgent_call(value):
+    calls.append(value)
+
+
+@task(max_attempts=2)
+def failing_call():
+    raise RuntimeError('always fails')
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_stores_the_call(self):
+        job = record_call.enqueue(7)
+        self.assertEqual((job.task, job.args, job.kwargs, job.status), ('jobs.tests.record_call', [7], {}, 'queued'))
+        with self.assertRaises(ValueError):
+            enqueue('jobs.tests.missing')
+
+    def test_claim_order_and_exclusivity(self):
+        later = record_call.enqueue('later')
+        enqueue(record_call.task_name, ['future'], run_at=timezone.now() + timedelta(hours=1))
+        first = urgent_call.enqueue('first')
+
+        jobs = claim('worker-a', 5)
+        self.assertEqual([job.pk for job in jobs], [first.pk, later.pk])
+        self.assertTrue(all(job.status == 'running' and job.attempts == 1 for job in jobs))
+        # Claimed jobs are not handed to another worker
+        self.assertEqual(claim('worker-b', 5), [])
+        self.assertEqual(claim('worker-a', 1), [])
+
+    def test_claim_respects_limit(self):
+        for i in range(3):
+            record_call.enqueue(i)
+        self.assertEqual(len(claim('worker-a', 2)), 2)
+        self.assertEqual(len(claim('worker-b', 2)), 1)
+
+    def test_successful_job_is_deleted(self):
+        record_call.enqueue('done')
+        job, = claim('worker-a', 1)
+        self.assertEqual(run_job(job), 'done')
+        self.assertEqual(calls, ['done'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_retries_then_dies(self):
+        failing_call.enqueue()
+        job, = claim('worker-a', 1)
+        self.assertEqual(run_job(job), 'retry')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('queued', ''))
+        self.assertIn('always fails', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=backoff(1) - 5))
+        self.assertEqual(claim('worker-a', 1), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        job, = claim('worker-a', 1)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(run_job(job), 'dead')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'dead')
+
+    def test_unknown_task_is_dead_at_once(self):
+        Job.objects.create(task='jobs.tests.removed')
+        job, = claim('worker-a', 1)
+        self.assertEqual(run_job(job), 'dead')
+        self.assertIn('Unknown task', Job.objects.get(pk=job.pk).last_error)
+
+    def test_job_taken_over_is_left_alone(self):
+        record_call.enqueue('twice')
+        job, = claim('worker-a', 1)
+        Job.objects.filter(pk=job.pk).update(locked_by='worker-b')
+        self.assertEqual(run_job(job), 'done')
+        # Only the worker holding the claim may delete the job
+        self.assertEqual(Job.objects.get(pk=job.pk).locked_by, 'worker-b')
+
+    def test_requeue_stale(self):
+        record_call.enqueue('stale')
+        failing_call.enqueue()
+        self.assertEqual(len(claim('worker-a', 2)), 2)
+        Job.objects.filter(task='jobs.tests.failing_call').update(attempts=2)
+        self.assertEqual(requeue_stale(), 0)
+
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=queue.LEASE_SECONDS + 1))
+        self.assertEqual(requeue_stale(), 2)
+        statuses = dict(Job.objects.values_list('task', 'status'))
+        self.assertEqual(statuses, {'jobs.tests.record_call': 'queued', 'jobs.tests.failing_call': 'dead'})
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual([backoff(n) for n in (1, 2, 3)], [10, 20, 40])
+        self.assertEqual(backoff(50), queue.BACKOFF_MAX)
@@ -0,0 +1,73 @@
+"""
+Worker loop behind ``manage.py runworker``.
+
+One process claims jobs in batches sized to its idle threads and runs them
+on a thread pool. Each thread uses its own database connection, closed when
+its job finishes. Expired leases are released every ``LEASE_CHECK`` seconds,
+so jobs held by a crashed worker get picked up again.
+"""
+import os
+import socket
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.db import close_old_connections, connection
+
+from .queue import LEASE_SECONDS, claim, discover_tasks, requeue_stale, run_job
+
+THREADS = 4
+POLL_INTERVAL = 1.0
+LEASE_CHECK = 60
+
+# Outcome of one job run
+JobResult = namedtuple('JobResult', ['job_id', 'task', 'outcome', 'seconds'])
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def _run(job):
+    close_old_connections()
+    started = time.monotonic()
+    try:
+        outcome = run_job(job)
+    finally:
+        connection.close()
+    return JobResult(job.pk, job.task, outcome, time.monotonic() - started)
+
+
+def run_worker(threads=THREADS, poll_interval=POLL_INTERVAL, burst=False, lease=LEASE_SECONDS):
+    """Run queued jobs until interrupted, yielding a ``JobResult`` per job.
+
+    With ``burst`` the worker stops once no job is runnable.
+    """
+    discover_tasks()
+    name = worker_id()
+    running = set()
+    last_lease_check = 0.0
+
+    # Leaving the pool waits for claimed jobs; unclaimed ones stay queued
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='jobs') as pool:
+        while True:
+            if time.monotonic() - last_lease_check >= LEASE_CHECK:
+                requeue_stale(lease)
+                last_lease_check = time.monotonic()
+
+            idle = threads - len(running)
+            if idle:
+                running.update(pool.submit(_run, job) for job in claim(name, idle))
+
+            if not running:
+                if burst:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            # Block until a job finishes, but keep polling while threads are idle
+            timeout = poll_interval if len(running) < threads else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.discard(future)
+                yield future.result()
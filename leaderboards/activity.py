@@ -0,0 +1,110 @@
+"""
+Per-user, per-day activity counters.
+
+Period boards (daily to yearly) sum a handful of ``UserActivityDay`` buckets
+instead of scanning token transactions, quiz attempts and user tasks by date,
+so their cost no longer grows with the size of the raw history. Buckets are
+keyed by local date, matching the boundaries from ``periods.period_bounds``.
+"""
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import User
+from .models import UserActivityDay
+from .metrics import EARNING_TRANSACTION_TYPES
+
+CHUNK_SIZE = 500
+
+ACTIVITY_FIELDS = ('tokens_earned', 'quizzes_completed', 'quiz_score_total', 'tasks_completed')
+
+
+def record_activity(user, when=None, **counts):
+    """Add ``counts`` (e.g. ``tasks_completed=1``) to the user's bucket for the day of ``when``"""
+    unknown = set(counts) - set(ACTIVITY_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown activity counters: {', '.join(sorted(unknown))}")
+    counts = {field: value for field, value in counts.items() if value}
+    if not counts:
+        return
+
+    day = timezone.localdate(when)
+    updates = {field: F(field) + value for field, value in counts.items()}
+    buckets = UserActivityDay.objects.filter(user=user, day=day)
+    if buckets.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            UserActivityDay.objects.create(user=user, day=day, **counts)
+    except IntegrityError:
+        # Another request created today's bucket first
+        buckets.update(**updates)
+
+
+def recent_days(days, when=None):
+    """Filter kwargs selecting the last ``days`` buckets up to and including today"""
+    today = timezone.localdate(when)
+    return {'activity_days__day__gt': today - timedelta(days=days)}
+
+
+def _daily(queryset, date_field, **aggregates):
+    tz = timezone.get_current_timezone()
+    return queryset.annotate(day=TruncDate(date_field, tzinfo=tz)).values(
+        'user_id', 'day'
+    ).annotate(**aggregates).order_by()
+
+
+def _history(user_ids):
+    """Recompute the buckets of some users from the raw history"""
+    from rewards.models import EcoTokenTransaction
+    from quizzes.models import QuizAttempt
+    from eco_tasks.models import UserTask
+
+    buckets = {}
+
+    def bucket(row):
+        key = (row['user_id'], row['day'])
+        if key not in buckets:
+            buckets[key] = UserActivityDay(user_id=row['user_id'], day=row['day'])
+        return buckets[key]
+
+    for row in _daily(EcoTokenTransaction.objects.filter(
+        user_id__in=user_ids, transaction_type__in=EARNING_TRANSACTION_TYPES,
+    ), 'created_at', amount=Sum('amount')):
+        bucket(row).tokens_earned = max(row['amount'] or 0, 0)
+
+    for row in _daily(QuizAttempt.objects.filter(
+        user_id__in=user_ids, is_completed=True, completed_at__isnull=False,
+    ), 'completed_at', count=Count('pk'), total=Sum('score')):
+        entry = bucket(row)
+        entry.quizzes_completed = row['count']
+        entry.quiz_score_total = row['total'] or 0.0
+
+    for row in _daily(UserTask.objects.filter(
+        user_id__in=user_ids, status='completed', completed_at__isnull=False,
+    ), 'completed_at', count=Count('pk')):
+        bucket(row).tasks_completed = row['count']
+
+    return list(buckets.values())
+
+
+def backfill_activity(chunk_size=CHUNK_SIZE):
+    """Rebuild every user's buckets from history; yields ``(users, buckets)`` per chunk.
+
+    Idempotent: each chunk of users has its buckets replaced in one
+    transaction, so it can be re-run at any time.
+    """
+    user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+    last = 0
+    while True:
+        chunk = list(user_ids.filter(pk__gt=last)[:chunk_size])
+        if not chunk:
+            break
+        buckets = _history(chunk)
+        with transaction.atomic():
+            UserActivityDay.objects.filter(user_id__in=chunk).delete()
+            UserActivityDay.objects.bulk_create(buckets, batch_size=1000)
+        last = chunk[-1]
+        yield len(chunk), len(buckets)
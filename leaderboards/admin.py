@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
-    LeaderboardType, LeaderboardEntry, GlobalLeaderboard, LocalLeaderboard,
-    LeaderboardReward, UserLeaderboardReward, LeaderboardSeason, SeasonParticipant
+    LeaderboardType, LeaderboardEntry, LeaderboardSnapshot, GlobalLeaderboard, LocalLeaderboard,
+    LeaderboardReward, UserLeaderboardReward, LeaderboardSeason, SeasonParticipant, UserActivityDay
 )
 
 @admin.register(LeaderboardType)
@@ -18,6 +18,14 @@ class LeaderboardEntryAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'leaderboard_type__name')
     readonly_fields = ('created_at', 'updated_at')
 
+@admin.register(LeaderboardSnapshot)
+class LeaderboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('leaderboard_type', 'partition', 'period_start', 'period_end', 'entry_count', 'frozen_at')
+    list_filter = ('leaderboard_type__period', 'leaderboard_type')
+    search_fields = ('leaderboard_type__name', 'partition')
+    exclude = ('user_ids', 'ranks', 'scores')
+    readonly_fields = ('frozen_at',)
+
 @admin.register(GlobalLeaderboard)
 class GlobalLeaderboardAdmin(admin.ModelAdmin):
     list_display = ('user', 'global_rank', 'total_score', 'total_achievements', 'last_updated')
@@ -78,3 +86,10 @@ class SeasonParticipantAdmin(admin.ModelAdmin):
     list_filter = ('season', 'rewards_claimed', 'joined_at')
     search_fields = ('user__username', 'season__name')
     readonly_fields = ('joined_at', 'last_activity')
+
+@admin.register(UserActivityDay)
+class UserActivityDayAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'tokens_earned', 'quizzes_completed', 'tasks_completed')
+    list_filter = ('day',)
+    search_fields = ('user__username',)
+    date_hierarchy = 'day'
@@ -0,0 +1,228 @@
+"""
+Columnar archive of closed leaderboard periods.
+
+Each board partition gets one append-only file under
+``settings.LEADERBOARD_ARCHIVE_DIR``. Every closed period is appended as a
+segment holding fixed-width little-endian columns copied from its
+``LeaderboardSnapshot``: user ids (int64, ascending), scores (float64) and
+ranks (uint32). Reads go through ``mmap``, so a user's rank series is a
+binary search per segment without touching the database, and old
+``LeaderboardEntry`` rows can be pruned once their period is archived.
+
+Layout: an 8-byte magic, then per segment a 24-byte header
+``(period_start, period_end, count, reserved)`` followed by the columns,
+padded to 8 bytes. A segment cut short by a crash is ignored by readers and
+overwritten by the next append.
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import quote
+from django.conf import settings
+from django.db import transaction
+
+from .models import LeaderboardEntry, LeaderboardSnapshot
+from .periods import period_bounds
+from .snapshots import freeze_period
+
+MAGIC = b'LBARCH1\x00'
+SEGMENT = struct.Struct('<qqII')
+
+# Periods kept in the database after archiving (the last closed one is still
+# read by rank carry-over and reward payouts)
+KEEP_PERIODS = 2
+
+# Open archive maps kept per process
+MAP_CACHE_SIZE = 32
+
+# One archived result of a user
+HistoryPoint = namedtuple('HistoryPoint', ['period_start', 'period_end', 'rank', 'score'])
+
+_maps = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def archive_dir():
+    return getattr(settings, 'LEADERBOARD_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'leaderboard_archive'))
+
+
+def archive_path(leaderboard_type, partition=''):
+    name = quote(partition, safe='') if partition else '_all'
+    return os.path.join(archive_dir(), f'type_{leaderboard_type.pk}', f'{name}.lba')
+
+
+def _timestamp(value):
+    return int(value.timestamp())
+
+
+def _datetime(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def _segment_size(count):
+    size = SEGMENT.size + count * (8 + 8 + 4)
+    return size + (-size % 8)
+
+
+def _segments(data):
+    """``(offset, period_start, period_end, count)`` of every complete segment"""
+    offset = len(MAGIC)
+    if data[:offset] != MAGIC:
+        return
+    while offset + SEGMENT.size <= len(data):
+        start, end, count, _ = SEGMENT.unpack_from(data, offset)
+        if offset + _segment_size(count) > len(data):
+            break
+        yield offset, start, end, count
+        offset += _segment_size(count)
+
+
+def _column(data, offset, typecode, count):
+    view = memoryview(data)[offset:offset + count * array(typecode).itemsize]
+    if sys.byteorder == 'little':
+        return view.cast(typecode)
+    values = array(typecode, view.tobytes())
+    values.byteswap()
+    return values
+
+
+def _map(path):
+    """Cached read-only map of an archive file, remapped when it has grown"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    with _maps_lock:
+        cached = _maps.get(path)
+        if cached is not None and cached[0] == size:
+            _maps.move_to_end(path)
+            return cached[1]
+        if not size:
+            return None
+        with open(path, 'rb') as handle:
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        _maps[path] = (size, data)
+        while len(_maps) > MAP_CACHE_SIZE:
+            _maps.popitem(last=False)
+        return data
+
+
+def _append_offset(path, period_start):
+    """Where the next segment goes, or None if ``period_start`` is archived"""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return 0
+    with open(path, 'rb') as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(MAGIC)] != MAGIC:
+            return 0
+        end = len(MAGIC)
+        for offset, start, _, count in _segments(data):
+            if start == period_start:
+                return None
+            end = offset + _segment_size(count)
+        return end
+
+
+def append_snapshot(snapshot):
+    """Append one snapshot to its partition's file; False if already archived"""
+    path = archive_path(snapshot.leaderboard_type, snapshot.partition)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    start = _timestamp(snapshot.period_start)
+    end = _append_offset(path, start)
+    if end is None:
+        return False
+
+    body = (
+        SEGMENT.pack(start, _timestamp(snapshot.period_end), snapshot.entry_count, 0)
+        + bytes(snapshot.user_ids) + bytes(snapshot.scores) + bytes(snapshot.ranks)
+    )
+    body += b'\x00' * (-len(body) % 8)
+
+    with open(path, 'r+b' if end else 'wb') as handle:
+        # Drops a segment left incomplete by an interrupted append
+        handle.truncate(end)
+        handle.seek(end)
+        if not end:
+            handle.write(MAGIC)
+        handle.write(body)
+        handle.flush()
+        os.fsync(handle.fileno())
+    return True
+
+
+def archive_period(leaderboard_type, period_start, period_end):
+    """Archive every partition of one closed period; returns segments written"""
+    snapshots = LeaderboardSnapshot.objects.filter(
+        leaderboard_type=leaderboard_type, period_start=period_start,
+    )
+    if not snapshots.exists():
+        freeze_period(leaderboard_type, period_start, period_end)
+    return sum(append_snapshot(snapshot) for snapshot in snapshots.select_related('leaderboard_type'))
+
+
+def closed_periods(leaderboard_type, when=None):
+    """Start and end of every closed period with stored rows, oldest first"""
+    current_start, _ = period_bounds(leaderboard_type.period, when)
+    starts = set(LeaderboardSnapshot.objects.filter(
+        leaderboard_type=leaderboard_type, period_start__lt=current_start,
+    ).values_list('period_start', flat=True))
+    # Entries kept for reward payouts do not make an archived period pending again
+    starts.update(LeaderboardEntry.objects.filter(
+        leaderboard_type=leaderboard_type, period_start__lt=current_start,
+        userleaderboardreward__isnull=True,
+    ).values_list('period_start', flat=True).distinct())
+    return [period_bounds(leaderboard_type.period, start) for start in sorted(starts)]
+
+
+def archive_board(leaderboard_type, when=None, keep=KEEP_PERIODS):
+    """Archive the closed periods of a board and prune archived rows.
+
+    Returns ``(segments, pruned)``. Entries that reward payouts point at are
+    kept, as are the newest ``keep`` closed periods.
+    """
+    if leaderboard_type.period == 'all_time':
+        return 0, 0
+
+    periods = closed_periods(leaderboard_type, when)
+    segments = 0
+    for period_start, period_end in periods:
+        segments += archive_period(leaderboard_type, period_start, period_end)
+
+    pruned = 0
+    expired = [start for start, _ in periods[:max(len(periods) - keep, 0)]]
+    if expired:
+        with transaction.atomic():
+            pruned, _ = LeaderboardEntry.objects.filter(
+                leaderboard_type=leaderboard_type, period_start__in=expired,
+                userleaderboardreward__isnull=True,
+            ).delete()
+            LeaderboardSnapshot.objects.filter(
+                leaderboard_type=leaderboard_type, period_start__in=expired,
+            ).delete()
+    return segments, pruned
+
+
+def rank_history(leaderboard_type, user_id, partition='', limit=None):
+    """``HistoryPoint`` per archived period the user was ranked in, oldest first.
+
+    Reads only the archive file; ``limit`` keeps the most recent points.
+    """
+    data = _map(archive_path(leaderboard_type, partition))
+    if data is None:
+        return []
+
+    points = []
+    for offset, start, end, count in _segments(data):
+        columns = offset + SEGMENT.size
+        user_ids = _column(data, columns, 'q', count)
+        i = bisect_left(user_ids, user_id)
+        if i < count and user_ids[i] == user_id:
+            scores = _column(data, columns + count * 8, 'd', count)
+            ranks = _column(data, columns + count * 16, 'I', count)
+            points.append(HistoryPoint(_datetime(start), _datetime(end), ranks[i], scores[i]))
+    return points[-limit:] if limit else points
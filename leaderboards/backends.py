@@ -0,0 +1,632 @@
+"""
+Sorted-set backends the leaderboards are served from.
+
+A backend stores one sorted set per board key and answers rank and window
+queries in O(log n + k). ``InProcessBackend`` keeps ``RankIndex`` skip lists
+in memory; ``RedisBackend`` maps the same calls onto Redis sorted sets and
+works against any server speaking the Redis protocol. The SQL leaderboard
+tables are durable snapshots used to (re)load the sets.
+
+In-process sets are never reconciled between processes, so that backend is
+for development and single-process servers only; deployments running
+several workers must use a shared backend such as ``RedisBackend``.
+
+Members are integer ids; ranks are competition ranks, like SQL ``RANK()``.
+"""
+import random
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+
+class _Node:
+    __slots__ = ('key', 'member', 'score', 'forward', 'span')
+
+    def __init__(self, level, member=None, score=None):
+        self.member = member
+        self.score = score
+        self.key = (-score, member) if score is not None else None
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class RankIndex:
+    """Order-statistic index of members sorted by descending score.
+
+    Ties are broken by member so the order is total. Insert, remove and rank
+    lookups are O(log n); reading a window of k members is O(log n + k).
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self, items=None):
+        self._scores = {}
+        self.clear()
+        if items is not None:
+            self.load(items)
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, member):
+        return member in self._scores
+
+    def clear(self):
+        self._head = _Node(self.MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+        self._scores.clear()
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def load(self, items):
+        """Replace the contents with ``(member, score)`` pairs in O(n log n)"""
+        self.clear()
+        nodes = sorted(((-score, member) for member, score in items))
+        head = self._head
+        tails = [head] * self.MAX_LEVEL
+        tail_positions = [0] * self.MAX_LEVEL
+
+        for position, (negative_score, member) in enumerate(nodes, start=1):
+            level = self._random_level()
+            node = _Node(level, member, -negative_score)
+            for i in range(level):
+                tails[i].forward[i] = node
+                tails[i].span[i] = position - tail_positions[i]
+                tails[i] = node
+                tail_positions[i] = position
+            self._level = max(self._level, level)
+            self._scores[member] = node.score
+
+        self._length = len(nodes)
+        for i in range(self.MAX_LEVEL):
+            tails[i].span[i] = self._length - tail_positions[i]
+
+    def score(self, member):
+        return self._scores.get(member)
+
+    def add(self, member, score):
+        """Insert ``member`` or move it to ``score``; returns its previous score"""
+        previous = self._scores.get(member)
+        if previous == score:
+            return previous
+        if previous is not None:
+            self._delete((-previous, member))
+        self._insert(member, score)
+        self._scores[member] = score
+        return previous
+
+    def remove(self, member):
+        """Drop ``member``; returns its previous score or None"""
+        previous = self._scores.pop(member, None)
+        if previous is not None:
+            self._delete((-previous, member))
+        return previous
+
+    def _insert(self, member, score):
+        key = (-score, member)
+        update = [None] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self._head
+
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = self._length
+            self._level = level
+
+        new = _Node(level, member, score)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def _delete(self, key):
+        update = [None] * self.MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        target = node.forward[0]
+        for i in range(self._level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+
+    def _count_before(self, key):
+        """Number of members ordered strictly before ``key``"""
+        count = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                count += node.span[i]
+                node = node.forward[i]
+        return count
+
+    def position(self, member):
+        """0-based position of ``member`` in the total order, or None"""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return self._count_before((-score, member))
+
+    def rank_of_score(self, score):
+        """Competition rank a member with ``score`` holds (1 + members scoring higher)"""
+        return self._count_before((-score,)) + 1
+
+    def count_through(self, score, member):
+        """Number of members ordered at or before ``(score, member)``"""
+        # (-score, member, 0) sorts after (-score, member) and before any later key
+        return self._count_before((-score, member, 0))
+
+    def rank(self, member):
+        """Competition rank of ``member``, or None if it is not ranked"""
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return self.rank_of_score(score)
+
+    def _node_at(self, position):
+        traversed = 0
+        target = position + 1
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.forward[i] is not None and traversed + node.span[i] <= target:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if traversed == target:
+                return node
+        return None
+
+    def range(self, start, stop):
+        """``(member, score, rank)`` for positions [start, stop) in O(log n + k)"""
+        if start >= self._length or stop <= start:
+            return []
+        start = max(start, 0)
+        node = self._node_at(start)
+        rank = self.rank_of_score(node.score)
+        results = []
+        position = start
+        previous_score = node.score
+        while node is not None and position < stop:
+            if node.score != previous_score:
+                rank = position + 1
+                previous_score = node.score
+            results.append((node.member, node.score, rank))
+            node = node.forward[0]
+            position += 1
+        return results
+
+    def top(self, max_rank):
+        """Every member whose competition rank is at most ``max_rank``"""
+        results = self.range(0, max_rank)
+        if results:
+            # Members tied with the last one share its rank
+            last_score = results[-1][1]
+            node = self._node_at(len(results) - 1).forward[0]
+            while node is not None and node.score == last_score:
+                results.append((node.member, node.score, results[-1][2]))
+                node = node.forward[0]
+        return results
+
+
+class LeaderboardBackend:
+    """Interface of a leaderboard sorted-set store.
+
+    Subclasses implement the primitive operations; window helpers such as
+    ``top`` and ``around`` are built on ``position`` and ``range``.
+    ``shared`` says whether every process sees the same sets.
+    """
+
+    shared = False
+
+    def is_loaded(self, key):
+        raise NotImplementedError
+
+    def load(self, key, items, expire_at=None):
+        """Replace the set at ``key`` with ``(member, score)`` pairs"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        """Drop every set whose key starts with ``prefix``"""
+        raise NotImplementedError
+
+    def get_blob(self, key):
+        """Bytes stored at ``key`` by ``set_blob``, or None"""
+        raise NotImplementedError
+
+    def set_blob(self, key, data, expire_at=None):
+        """Store opaque bytes next to the sets, e.g. a board's score sketch"""
+        raise NotImplementedError
+
+    def append_blob(self, key, data, expire_at=None):
+        """Atomically append bytes to the blob at ``key``; returns its new length"""
+        raise NotImplementedError
+
+    def pop_blob(self, key):
+        """Atomically remove the blob at ``key`` and return it, or None"""
+        raise NotImplementedError
+
+    def add(self, key, member, score):
+        """Set ``member``'s score; returns the previous score or None"""
+        raise NotImplementedError
+
+    def incr(self, key, member, amount):
+        """Add ``amount`` to ``member``'s score; returns the new score"""
+        raise NotImplementedError
+
+    def remove(self, key, member):
+        """Drop ``member``; returns the previous score or None"""
+        raise NotImplementedError
+
+    def score(self, key, member):
+        raise NotImplementedError
+
+    def count(self, key):
+        raise NotImplementedError
+
+    def position(self, key, member):
+        """0-based position of ``member`` in descending order, or None"""
+        raise NotImplementedError
+
+    def rank_of_score(self, key, score):
+        """Competition rank held by ``score`` (1 + members scoring higher)"""
+        raise NotImplementedError
+
+    def range(self, key, start, stop):
+        """``(member, score, rank)`` for positions [start, stop)"""
+        raise NotImplementedError
+
+    def rank(self, key, member):
+        score = self.score(key, member)
+        if score is None:
+            return None
+        return self.rank_of_score(key, score)
+
+    def top(self, key, max_rank):
+        """Every member whose rank is at most ``max_rank``, ties included"""
+        rows = self.range(key, 0, max_rank)
+        if max_rank and len(rows) == max_rank:
+            last_score = rows[-1][1]
+            while True:
+                more = self.range(key, len(rows), len(rows) + max_rank)
+                tied = [row for row in more if row[1] == last_score]
+                rows.extend(tied)
+                if not tied or len(tied) < len(more):
+                    break
+        return rows
+
+    def around(self, key, member, count):
+        """Up to ``count`` members either side of ``member``, plus itself"""
+        position = self.position(key, member)
+        if position is None:
+            return []
+        return self.range(key, max(position - count, 0), position + count + 1)
+
+    def after(self, key, score, member, count):
+        """Up to ``count`` members ordered after ``(score, member)``.
+
+        A keyset cursor: pages resume after the last member shown even if
+        others moved in between. Resuming costs O(log n) while the cursor
+        member still holds ``score``; once it has moved, members tied with
+        it are skipped one page at a time.
+        """
+        if self.score(key, member) == score:
+            start = self.position(key, member) + 1
+            return self.range(key, start, start + count)
+
+        start = self.rank_of_score(key, score) - 1
+        rows = []
+        while len(rows) < count:
+            batch = self.range(key, start, start + count)
+            if not batch:
+                break
+            rows.extend(row for row in batch if not self._tied_before(row, score, member))
+            start += len(batch)
+        return rows[:count]
+
+    def _tied_before(self, row, score, member):
+        """Whether ``row`` is a member tied at ``score`` ordered before ``member``"""
+        return row[1] == score and row[0] <= member
+
+
+class InProcessBackend(LeaderboardBackend):
+    """Sorted sets held in this process as ``RankIndex`` skip lists.
+
+    Each process keeps its own copy, loaded from the database on first use
+    and only moved by that process, so with several workers each one serves
+    its own ranks. Use it with a single process only.
+    """
+
+    def __init__(self):
+        self._sets = {}
+        self._blobs = {}
+        self._expiry = {}
+        self._lock = threading.RLock()
+
+    def _get(self, key):
+        index = self._sets.get(key)
+        if index is None:
+            index = self._sets[key] = RankIndex()
+        return index
+
+    def _peek(self, key):
+        index = self._sets.get(key)
+        return index if index is not None else RankIndex()
+
+    def _purge_expired(self):
+        now = timezone.now()
+        for key in [k for k, expire_at in self._expiry.items() if expire_at <= now]:
+            self._sets.pop(key, None)
+            self._blobs.pop(key, None)
+            del self._expiry[key]
+
+    def is_loaded(self, key):
+        return key in self._sets
+
+    def load(self, key, items, expire_at=None):
+        index = RankIndex(items)
+        with self._lock:
+            self._purge_expired()
+            self._sets[key] = index
+            if expire_at is not None:
+                self._expiry[key] = expire_at
+
+    def delete(self, key):
+        with self._lock:
+            self._sets.pop(key, None)
+            self._blobs.pop(key, None)
+            self._expiry.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in [*self._sets, *self._blobs] if k.startswith(prefix)]:
+                self.delete(key)
+
+    def get_blob(self, key):
+        return self._blobs.get(key)
+
+    def set_blob(self, key, data, expire_at=None):
+        with self._lock:
+            self._purge_expired()
+            self._blobs[key] = data
+            if expire_at is not None:
+                self._expiry[key] = expire_at
+
+    def append_blob(self, key, data, expire_at=None):
+        with self._lock:
+            self._purge_expired()
+            blob = self._blobs[key] = self._blobs.get(key, b'') + data
+            if expire_at is not None:
+                self._expiry[key] = expire_at
+            return len(blob)
+
+    def pop_blob(self, key):
+        with self._lock:
+            self._expiry.pop(key, None)
+            return self._blobs.pop(key, None)
+
+    def add(self, key, member, score):
+        with self._lock:
+            return self._get(key).add(member, score)
+
+    def incr(self, key, member, amount):
+        with self._lock:
+            index = self._get(key)
+            score = (index.score(member) or 0) + amount
+            index.add(member, score)
+            return score
+
+    def remove(self, key, member):
+        with self._lock:
+            return self._get(key).remove(member)
+
+    def score(self, key, member):
+        return self._peek(key).score(member)
+
+    def count(self, key):
+        return len(self._peek(key))
+
+    def position(self, key, member):
+        with self._lock:
+            return self._peek(key).position(member)
+
+    def rank_of_score(self, key, score):
+        with self._lock:
+            return self._peek(key).rank_of_score(score)
+
+    def range(self, key, start, stop):
+        with self._lock:
+            return self._peek(key).range(start, stop)
+
+    def top(self, key, max_rank):
+        with self._lock:
+            return self._peek(key).top(max_rank)
+
+    def after(self, key, score, member, count):
+        with self._lock:
+            index = self._peek(key)
+            start = index.count_through(score, member)
+            return index.range(start, start + count)
+
+
+class RedisBackend(LeaderboardBackend):
+    """Sorted sets stored in Redis (or any server speaking its protocol).
+
+    Ties are ordered by member in reverse, the native ``ZREVRANGE`` order;
+    ranks are unaffected since tied members share one.
+    """
+
+    LOADED_SUFFIX = ':loaded'
+    LOAD_BATCH = 5000
+    shared = True
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImproperlyConfigured("RedisBackend requires the 'redis' package")
+            url = url or getattr(settings, 'LEADERBOARD_REDIS_URL', 'redis://localhost:6379/0')
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def is_loaded(self, key):
+        return bool(self.client.exists(key + self.LOADED_SUFFIX))
+
+    def load(self, key, items, expire_at=None):
+        # Build under a temporary key and swap it in so readers never see a partial set
+        staging = f'{key}:staging:{random.getrandbits(32)}'
+        batch = {}
+        for member, score in items:
+            batch[member] = score
+            if len(batch) >= self.LOAD_BATCH:
+                self.client.zadd(staging, batch)
+                batch = {}
+        if batch:
+            self.client.zadd(staging, batch)
+
+        pipe = self.client.pipeline()
+        if self.client.exists(staging):
+            pipe.rename(staging, key)
+        else:
+            pipe.delete(key)
+        pipe.set(key + self.LOADED_SUFFIX, 1)
+        if expire_at is not None:
+            pipe.expireat(key, expire_at)
+            pipe.expireat(key + self.LOADED_SUFFIX, expire_at)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(key, key + self.LOADED_SUFFIX)
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=prefix + '*', count=1000))
+        if keys:
+            self.client.delete(*keys)
+
+    def get_blob(self, key):
+        return self.client.get(key)
+
+    def set_blob(self, key, data, expire_at=None):
+        self.client.set(key, data, exat=expire_at)
+
+    def append_blob(self, key, data, expire_at=None):
+        pipe = self.client.pipeline()
+        pipe.append(key, data)
+        if expire_at is not None:
+            pipe.expireat(key, expire_at)
+        return pipe.execute()[0]
+
+    def pop_blob(self, key):
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.delete(key)
+        data, _ = pipe.execute()
+        return data
+
+    def add(self, key, member, score):
+        pipe = self.client.pipeline()
+        pipe.zscore(key, member)
+        pipe.zadd(key, {member: score})
+        previous, _ = pipe.execute()
+        return previous
+
+    def incr(self, key, member, amount):
+        return self.client.zincrby(key, amount, member)
+
+    def remove(self, key, member):
+        pipe = self.client.pipeline()
+        pipe.zscore(key, member)
+        pipe.zrem(key, member)
+        previous, _ = pipe.execute()
+        return previous
+
+    def score(self, key, member):
+        return self.client.zscore(key, member)
+
+    def _tied_before(self, row, score, member):
+        # ZREVRANGE orders tied members by reverse lexicographic member
+        return row[1] == score and str(row[0]) >= str(member)
+
+    def count(self, key):
+        return self.client.zcard(key)
+
+    def position(self, key, member):
+        return self.client.zrevrank(key, member)
+
+    def rank_of_score(self, key, score):
+        return self.client.zcount(key, f'({score}', '+inf') + 1
+
+    def range(self, key, start, stop):
+        if stop <= start:
+            return []
+        rows = self.client.zrevrange(key, start, stop - 1, withscores=True)
+        if not rows:
+            return []
+        results = []
+        rank = self.rank_of_score(key, rows[0][1])
+        previous_score = rows[0][1]
+        for position, (member, score) in enumerate(rows, start=start):
+            if score != previous_score:
+                rank = position + 1
+                previous_score = score
+            results.append((int(member), score, rank))
+        return results
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured backend (``settings.LEADERBOARD_BACKEND``)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'LEADERBOARD_BACKEND', 'leaderboards.backends.InProcessBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the backend in use, e.g. to point at a local stand-in server"""
+    global _backend
+    _backend = backend
+
+
+def period_expiry(period_end):
+    """Keep a period's set around for a day after it closes"""
+    return period_end + timedelta(days=1)
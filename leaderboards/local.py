@@ -0,0 +1,141 @@
+"""
+Sharded rebuild of ``LocalLeaderboard``.
+
+Each (location_type, location_value) board is independent, so a rebuild is
+split into one shard per country, city or school. Shards are ranked and
+written in their own short transaction, optionally fanned out over a
+process pool; a shard that fails leaves the others committed and can be
+rerun on its own.
+"""
+import multiprocessing
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.db import connections, transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import Rank
+from django.utils import timezone
+
+from .models import LocalLeaderboard
+from .metrics import SCOPE_FIELDS, eligible_users, score_queryset
+from .periods import period_bounds
+from .ranking import local_board_type
+
+LOCAL_SCOPES = [location_type for location_type, _ in LocalLeaderboard.LOCATION_TYPES]
+
+# Outcome of one shard; ``error`` is None when it succeeded
+ShardResult = namedtuple('ShardResult', ['location_value', 'rows', 'seconds', 'error'])
+
+
+def local_shards(location_type, period='all_time'):
+    """Location values with eligible users, largest first so the pool stays busy"""
+    leaderboard_type = local_board_type(location_type, period)
+    if leaderboard_type is None:
+        return []
+    field = SCOPE_FIELDS[location_type]
+    return list(eligible_users(leaderboard_type).values_list(field, flat=True).annotate(
+        users=Count('pk')
+    ).order_by('-users', field))
+
+
+def rebuild_shard(location_type, location_value, period='all_time', when=None):
+    """Rank one local board and write it; returns the number of rows written"""
+    leaderboard_type = local_board_type(location_type, period)
+    if leaderboard_type is None:
+        raise ValueError(f"No active {location_type} leaderboard for period {period}")
+    period_start, period_end = period_bounds(period, when)
+    started = timezone.now()
+
+    rows = score_queryset(leaderboard_type, period_start, period_end, location_value).annotate(
+        rank=Window(Rank(), order_by=F('score').desc())
+    ).filter(rank__lte=leaderboard_type.max_entries).values_list('pk', 'score', 'rank')
+
+    with transaction.atomic():
+        entries = LocalLeaderboard.objects.bulk_create([
+            LocalLeaderboard(
+                location_type=location_type,
+                location_value=location_value,
+                user_id=user_id,
+                rank=rank,
+                score=score,
+                period_type=period,
+                period_start=period_start,
+                period_end=period_end,
+            )
+            for user_id, score, rank in rows
+        ], update_conflicts=True,
+            unique_fields=['location_type', 'location_value', 'user', 'period_type', 'period_start'],
+            update_fields=['rank', 'score', 'period_end', 'last_updated'])
+
+        LocalLeaderboard.objects.filter(
+            location_type=location_type,
+            location_value=location_value,
+            period_type=period,
+            period_start=period_start,
+            last_updated__lt=started,
+        ).delete()
+
+    return len(entries)
+
+
+def _run_shard(location_type, location_value, period, when):
+    begin = time.monotonic()
+    try:
+        rows = rebuild_shard(location_type, location_value, period, when)
+        error = None
+    except Exception:
+        rows, error = 0, traceback.format_exc(limit=3)
+    return ShardResult(location_value, rows, time.monotonic() - begin, error)
+
+
+def _run_pool(location_type, shards, period, when, workers):
+    if workers <= 1:
+        for location_value in shards:
+            yield _run_shard(location_type, location_value, period, when)
+        return
+
+    # Children must open their own database connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(_run_shard, location_type, location_value, period, when)
+            for location_value in shards
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def rebuild_local(location_type, period='all_time', when=None, shards=None, workers=1, retries=1,
+                  prune=None):
+    """Rebuild local boards shard by shard; yields a ``ShardResult`` as each finishes.
+
+    Failed shards are retried up to ``retries`` more times once the first
+    pass is done; a shard still failing after that is yielded with its
+    error. When ``shards`` is None every location is rebuilt; with ``prune``
+    (the default for such full runs) boards of locations not in ``shards``
+    are removed.
+    """
+    if prune is None:
+        prune = shards is None
+    if shards is None:
+        shards = local_shards(location_type, period)
+
+    pending = list(shards)
+    for attempt in range(retries + 1):
+        failed = []
+        for result in _run_pool(location_type, pending, period, when, workers):
+            if result.error and attempt < retries:
+                failed.append(result.location_value)
+            else:
+                yield result
+        if not failed:
+            break
+        pending = failed
+
+    if prune:
+        period_start, _ = period_bounds(period, when)
+        LocalLeaderboard.objects.filter(
+            location_type=location_type, period_type=period, period_start=period_start,
+        ).exclude(location_value__in=shards).delete()
@@ -0,0 +1,52 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from leaderboards.archive import KEEP_PERIODS, archive_board
+from leaderboards.models import LeaderboardType
+
+
+class Command(BaseCommand):
+    help = 'Export closed leaderboard periods to the columnar archive and prune archived rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--board',
+            type=int,
+            action='append',
+            help='Only archive the LeaderboardType with this id (repeatable)',
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=KEEP_PERIODS,
+            help='Closed periods to keep in the database after archiving',
+        )
+        parser.add_argument(
+            '--date',
+            help='Archive as if it were this date (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        when = None
+        if options['date']:
+            try:
+                when = timezone.make_aware(datetime.strptime(options['date'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        boards = LeaderboardType.objects.exclude(period='all_time')
+        if options['board']:
+            boards = boards.filter(id__in=options['board'])
+
+        for leaderboard_type in boards:
+            begin = time.monotonic()
+            segments, pruned = archive_board(leaderboard_type, when, options['keep'])
+            self.stdout.write(
+                f'{leaderboard_type}: archived {segments} segments, '
+                f'pruned {pruned} entries in {time.monotonic() - begin:.2f}s'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Leaderboard archive complete'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from leaderboards.activity import CHUNK_SIZE, backfill_activity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-day activity counters used by period leaderboards from history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Users processed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        total_users = total_buckets = 0
+        for users, buckets in backfill_activity(options['chunk_size']):
+            total_users += users
+            total_buckets += buckets
+            self.stdout.write(f'{total_users} users processed')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Backfilled {total_buckets} activity buckets for {total_users} users')
+        )
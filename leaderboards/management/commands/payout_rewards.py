@@ -0,0 +1,36 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from leaderboards.payouts import CHUNK_SIZE, run_payouts
+
+
+class Command(BaseCommand):
+    help = 'Pay leaderboard rank rewards for closed periods and rewards of finished seasons'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Pay the periods closed as of this date (YYYY-MM-DD), e.g. to catch up a missed run',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Users paid per transaction',
+        )
+
+    def handle(self, *args, **options):
+        when = None
+        if options['date']:
+            try:
+                when = timezone.make_aware(datetime.strptime(options['date'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+
+        for label, paid, seconds in run_payouts(when, options['chunk_size']):
+            if paid is None:
+                self.stdout.write(f'{label} in {seconds:.2f}s')
+            else:
+                self.stdout.write(f'{label}: paid {paid} rewards in {seconds:.2f}s')
+
+        self.stdout.write(self.style.SUCCESS('Reward payout complete'))
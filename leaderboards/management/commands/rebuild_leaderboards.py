@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from leaderboards.models import LeaderboardType
+from leaderboards.metrics import ALL_TIME_EXPRESSIONS
+from leaderboards.rebuild import CHUNK_SIZE, rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Rebuild leaderboard entries, local and global leaderboards from current activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--board',
+            type=int,
+            action='append',
+            help='Only rebuild the LeaderboardType with this id (repeatable)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Rows fetched and written per batch',
+        )
+        parser.add_argument(
+            '--skip-global',
+            action='store_true',
+            help='Do not rebuild the global composite leaderboard',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes used to rebuild local leaderboard shards',
+        )
+        parser.add_argument(
+            '--weight',
+            action='append',
+            metavar='METRIC=WEIGHT',
+            help='Composite weight for the global leaderboard, overriding settings (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        weights = None
+        if options['weight']:
+            try:
+                weights = {
+                    metric: float(weight)
+                    for metric, weight in (item.split('=', 1) for item in options['weight'])
+                }
+            except ValueError:
+                raise CommandError('--weight must look like METRIC=WEIGHT, e.g. level=10')
+            unknown = set(weights) - set(ALL_TIME_EXPRESSIONS)
+            if unknown:
+                raise CommandError(f"Unknown metrics for --weight: {', '.join(sorted(unknown))}")
+
+        boards = LeaderboardType.objects.filter(is_active=True)
+        if options['board']:
+            boards = boards.filter(id__in=options['board'])
+
+        total_rows = 0
+        for label, rows, elapsed in rebuild_all(
+            boards,
+            chunk_size=options['chunk_size'],
+            include_global=not options['skip_global'],
+            weights=weights,
+            workers=options['workers'],
+        ):
+            total_rows += rows
+            self.stdout.write(f'{label}: {rows} rows in {elapsed:.2f}s')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt leaderboards ({total_rows} rows written)')
+        )
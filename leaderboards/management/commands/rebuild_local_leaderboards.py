@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from leaderboards.models import LeaderboardType
+from leaderboards.local import LOCAL_SCOPES, local_shards, rebuild_local
+
+
+class Command(BaseCommand):
+    help = 'Rebuild local leaderboards shard by shard (one shard per location), in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'location_type',
+            choices=LOCAL_SCOPES,
+            help='Kind of local leaderboard to rebuild',
+        )
+        parser.add_argument(
+            '--period',
+            default='all_time',
+            choices=[period for period, _ in LeaderboardType.PERIOD_CHOICES],
+            help='Leaderboard period to rebuild',
+        )
+        parser.add_argument(
+            '--shard',
+            action='append',
+            help='Only rebuild this location value, e.g. to retry a failed shard (repeatable)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes',
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=1,
+            help='Extra attempts for shards that fail',
+        )
+
+    def handle(self, *args, **options):
+        location_type = options['location_type']
+        period = options['period']
+        shards = options['shard'] or local_shards(location_type, period)
+        if not shards:
+            raise CommandError(f'No {location_type} leaderboard shards to rebuild for period {period}')
+
+        done = total_rows = 0
+        failed = []
+        for result in rebuild_local(
+            location_type,
+            period,
+            shards=shards,
+            workers=options['workers'],
+            retries=options['retries'],
+            prune=not options['shard'],
+        ):
+            done += 1
+            if result.error:
+                failed.append(result.location_value)
+                self.stderr.write(f'[{done}/{len(shards)}] {result.location_value}: FAILED\n{result.error}')
+            else:
+                total_rows += result.rows
+                self.stdout.write(
+                    f'[{done}/{len(shards)}] {result.location_value}: '
+                    f'{result.rows} rows in {result.seconds:.2f}s'
+                )
+
+        if failed:
+            retry = ' '.join(f'--shard "{value}"' for value in failed)
+            raise CommandError(
+                f'{len(failed)} shard(s) failed; retry them with: '
+                f'manage.py rebuild_local_leaderboards {location_type} --period {period} {retry}'
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {len(shards)} {location_type} leaderboards ({total_rows} rows written)')
+        )
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from leaderboards.models import LeaderboardType
+from leaderboards.snapshots import CHUNK_SIZE, rollover_board
+
+
+class Command(BaseCommand):
+    help = 'Freeze closed leaderboard periods and carry their ranks into the current period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--board',
+            type=int,
+            action='append',
+            help='Only roll over the LeaderboardType with this id (repeatable)',
+        )
+        parser.add_argument(
+            '--date',
+            help='Roll over as if it were this date (YYYY-MM-DD), e.g. to catch up a missed run',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Rows fetched and written per batch',
+        )
+
+    def handle(self, *args, **options):
+        when = None
+        if options['date']:
+            try:
+                when = timezone.make_aware(datetime.strptime(options['date'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+
+        boards = LeaderboardType.objects.filter(is_active=True).exclude(period='all_time')
+        if options['board']:
+            boards = boards.filter(id__in=options['board'])
+
+        for leaderboard_type in boards:
+            begin = time.monotonic()
+            frozen, carried = rollover_board(leaderboard_type, when, options['chunk_size'])
+            self.stdout.write(
+                f'{leaderboard_type}: froze {frozen} entries, '
+                f'carried {carried} ranks in {time.monotonic() - begin:.2f}s'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Leaderboard rollover complete'))
@@ -0,0 +1,129 @@
+from django.db.models import CharField, ExpressionWrapper, F, FloatField, Q, Sum, Value, Window
+from django.db.models.functions import Cast, Coalesce, NullIf, Rank
+from django.utils import timezone
+from accounts.models import User
+
+# User field that partitions each scope into independent boards
+SCOPE_FIELDS = {
+    'global': None,
+    'country': 'country',
+    'city': 'city',
+    'school': 'school_name',
+    'grade': 'grade_level',
+}
+
+# Metrics describing the user's current state rather than activity in a period
+SNAPSHOT_METRICS = ('level', 'streak_days', 'longest_streak')
+
+# Transaction types that count as earning tokens; 'bonus' prizes paid for a
+# rank would otherwise feed back into the next period's token boards
+EARNING_TRANSACTION_TYPES = ('earned',)
+
+ALL_TIME_EXPRESSIONS = {
+    'total_tokens': F('total_eco_tokens'),
+    'level': F('level'),
+    'quiz_score': F('profile__average_quiz_score'),
+    'tasks_completed': F('profile__tasks_completed'),
+    'streak_days': F('profile__streak_days'),
+    'longest_streak': F('profile__longest_streak'),
+    'quizzes_completed': F('profile__quizzes_completed'),
+}
+
+# UserActivityDay counter summed by period boards of each activity metric
+PERIOD_COUNTERS = {
+    'total_tokens': 'tokens_earned',
+    'quizzes_completed': 'quizzes_completed',
+    'tasks_completed': 'tasks_completed',
+}
+
+
+def metric_expression(metric, period='all_time', start=None, end=None):
+    """Build an annotation computing ``metric`` for each user.
+
+    All-time boards read the counters kept on ``User`` and ``UserProfile``;
+    period boards sum the ``UserActivityDay`` buckets of the days in
+    [start, end).
+    """
+    if period == 'all_time' or metric in SNAPSHOT_METRICS:
+        expression = ALL_TIME_EXPRESSIONS[metric]
+    elif metric in PERIOD_COUNTERS or metric == 'quiz_score':
+        days = Q(
+            activity_days__day__gte=timezone.localdate(start),
+            activity_days__day__lt=timezone.localdate(end),
+        )
+        if metric == 'quiz_score':
+            expression = ExpressionWrapper(
+                Sum('activity_days__quiz_score_total', filter=days)
+                / NullIf(Sum('activity_days__quizzes_completed', filter=days), 0),
+                output_field=FloatField(),
+            )
+        else:
+            expression = Sum(f'activity_days__{PERIOD_COUNTERS[metric]}', filter=days)
+    else:
+        raise ValueError(f"Unknown leaderboard metric: {metric}")
+
+    return Coalesce(Cast(expression, FloatField()), Value(0.0))
+
+
+def get_partition(leaderboard_type, user):
+    """Return the partition value ``user`` falls into for this board ('' for global)"""
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    return getattr(user, field) if field else ''
+
+
+def is_eligible(leaderboard_type, user):
+    """Check the board's filters against a single user"""
+    if not user.is_active or user.level < leaderboard_type.min_level:
+        return False
+    if leaderboard_type.school_type_filter and user.school_type != leaderboard_type.school_type_filter:
+        return False
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    return not field or bool(getattr(user, field))
+
+
+def eligible_users(leaderboard_type, partition=None):
+    """Users that may appear on the board, optionally limited to one partition"""
+    users = User.objects.filter(is_active=True, level__gte=leaderboard_type.min_level)
+    if leaderboard_type.school_type_filter:
+        users = users.filter(school_type=leaderboard_type.school_type_filter)
+
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    if field:
+        if partition is None:
+            users = users.exclude(**{field: ''})
+        else:
+            users = users.filter(**{field: partition})
+    return users
+
+
+def score_queryset(leaderboard_type, start, end, partition=None):
+    """Eligible users annotated with ``score``; users scoring 0 are not ranked"""
+    expression = metric_expression(leaderboard_type.metric, leaderboard_type.period, start, end)
+    return eligible_users(leaderboard_type, partition).annotate(score=expression).filter(score__gt=0)
+
+
+def ranked_queryset(leaderboard_type, start, end, max_rank=None):
+    """Rows of ``(user_id, score, rank, partition)`` ranked by the database.
+
+    Uses ``RANK()`` partitioned by the board's scope field; with ``max_rank``
+    the cut-off is applied in SQL so only the stored window is transferred.
+    """
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    rank = Window(
+        Rank(),
+        partition_by=[F(field)] if field else None,
+        order_by=F('score').desc(),
+    )
+    rows = score_queryset(leaderboard_type, start, end).annotate(rank=rank)
+    if max_rank is not None:
+        rows = rows.filter(rank__lte=max_rank)
+    return rows.values_list('pk', 'score', 'rank', field or Value('', output_field=CharField()))
+
+
+def user_score(leaderboard_type, user, start, end):
+    """Current score of one user on the board, 0 if they are not eligible"""
+    if not is_eligible(leaderboard_type, user):
+        return 0.0
+    expression = metric_expression(leaderboard_type.metric, leaderboard_type.period, start, end)
+    score = User.objects.filter(pk=user.pk).annotate(score=expression).values_list('score', flat=True).first()
+    return score or 0.0
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.CharField(blank=True, max_length=200)),
+                ('period_start', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('user_ids', models.BinaryField()),
+                ('ranks', models.BinaryField()),
+                ('scores', models.BinaryField()),
+                ('frozen_at', models.DateTimeField(auto_now_add=True)),
+                ('leaderboard_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='leaderboards.leaderboardtype')),
+            ],
+            options={
+                'ordering': ['leaderboard_type', '-period_start', 'partition'],
+                'unique_together': {('leaderboard_type', 'partition', 'period_start')},
+            },
+        ),
+    ]
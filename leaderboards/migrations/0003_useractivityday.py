@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('leaderboards', '0002_leaderboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('tokens_earned', models.PositiveIntegerField(default=0)),
+                ('quizzes_completed', models.PositiveIntegerField(default=0)),
+                ('quiz_score_total', models.FloatField(default=0.0)),
+                ('tasks_completed', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day', 'user'], name='leaderboard_day_22e2f3_idx')],
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
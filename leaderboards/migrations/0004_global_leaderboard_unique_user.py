@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:29
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_rows(apps, schema_editor):
+    """Keep only the newest GlobalLeaderboard row of each user"""
+    GlobalLeaderboard = apps.get_model('leaderboards', 'GlobalLeaderboard')
+    latest = GlobalLeaderboard.objects.values('user').annotate(latest=Max('pk')).values('latest')
+    GlobalLeaderboard.objects.exclude(pk__in=latest).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0003_useractivityday'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='globalleaderboard',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_global_leaderboard_user'),
+        ),
+    ]
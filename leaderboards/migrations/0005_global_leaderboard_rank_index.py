@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0004_global_leaderboard_unique_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='globalleaderboard',
+            index=models.Index(fields=['global_rank', 'user'], name='leaderboard_global__fb48dd_idx'),
+        ),
+    ]
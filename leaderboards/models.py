@@ -106,6 +106,37 @@ class LeaderboardEntry(models.Model):
             return f"↓{abs(change)}"
         return "="
 
+class LeaderboardSnapshot(models.Model):
+    """Frozen final ranking of one closed leaderboard period"""
+    
+    leaderboard_type = models.ForeignKey(LeaderboardType, on_delete=models.CASCADE, related_name='snapshots')
+    partition = models.CharField(max_length=200, blank=True)  # City, school, etc. ('' for global boards)
+    
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    
+    # Parallel packed little-endian arrays sorted by user id, which lookups bisect:
+    # user_ids int64, ranks uint32, scores float64 (get_entries re-sorts by rank)
+    entry_count = models.PositiveIntegerField(default=0)
+    user_ids = models.BinaryField()
+    ranks = models.BinaryField()
+    scores = models.BinaryField()
+    
+    frozen_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['leaderboard_type', 'partition', 'period_start']
+        ordering = ['leaderboard_type', '-period_start', 'partition']
+    
+    def __str__(self):
+        label = f"{self.leaderboard_type.name} {self.period_start:%Y-%m-%d}"
+        return f"{label} ({self.partition})" if self.partition else label
+    
+    def get_entries(self):
+        """Decode the snapshot into ``(user_id, rank, score)`` tuples"""
+        from .snapshots import unpack_snapshot
+        return unpack_snapshot(self)
+
 class GlobalLeaderboard(models.Model):
     """Global leaderboard aggregating all users"""
     
@@ -129,6 +160,12 @@ class GlobalLeaderboard(models.Model):
     
     class Meta:
         ordering = ['global_rank']
+        indexes = [
+            models.Index(fields=['global_rank', 'user']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='unique_global_leaderboard_user'),
+        ]
     
     def __str__(self):
         return f"Global #{self.global_rank} - {self.user.username}"
@@ -250,6 +287,17 @@ class LeaderboardSeason(models.Model):
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .seasons import invalidate_season_index
+        invalidate_season_index()
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from .seasons import invalidate_season_index
+        invalidate_season_index()
+        return result
+    
     def is_running(self):
         """Check if season is currently active"""
         now = timezone.now()
@@ -287,3 +335,30 @@ class SeasonParticipant(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.season.name}"
+
+class UserActivityDay(models.Model):
+    """Per-user, per-day activity counters that period leaderboards sum over"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_days')
+    day = models.DateField()
+    
+    tokens_earned = models.PositiveIntegerField(default=0)
+    quizzes_completed = models.PositiveIntegerField(default=0)
+    quiz_score_total = models.FloatField(default=0.0)
+    tasks_completed = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'day']
+        indexes = [
+            models.Index(fields=['day', 'user']),
+        ]
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.day}"
+    
+    @property
+    def average_quiz_score(self):
+        if not self.quizzes_completed:
+            return 0.0
+        return self.quiz_score_total / self.quizzes_completed
@@ -0,0 +1,82 @@
+"""
+Keyset pagination for leaderboards.
+
+Pages are addressed by an opaque cursor naming the last row shown instead of
+an offset, so a deep page costs the same as the first one and rows moving
+between requests are neither skipped nor repeated. Stored tables page on
+``(rank, user_id)``; boards served from the backend page on
+``(score, user_id)``, the key their ranks are derived from.
+"""
+import base64
+from collections import namedtuple
+from django.db.models import Q
+
+from .backends import get_backend
+from .ranking import with_users
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# One page of rows plus the cursor of the next page (None on the last page)
+Page = namedtuple('Page', ['entries', 'next_cursor'])
+
+
+def encode_cursor(first, user_id):
+    raw = f'{first!r}:{user_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, first_type=float):
+    """``(first, user_id)`` from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        first, user_id = raw.rsplit(':', 1)
+        return first_type(first), int(user_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page_size(value, default=PAGE_SIZE):
+    """Parse a requested page size, clamped to [1, MAX_PAGE_SIZE]"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def board_page(key, cursor=None, size=PAGE_SIZE):
+    """One page of a backend board as ``RankedEntry`` rows"""
+    backend = get_backend()
+    position = decode_cursor(cursor)
+    if position is None:
+        rows = backend.range(key, 0, size + 1)
+    else:
+        score, member = position
+        rows = backend.after(key, score, member, size + 1)
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return Page(with_users(rows), next_cursor)
+
+
+def queryset_page(queryset, cursor=None, size=PAGE_SIZE, rank_field='rank'):
+    """One page of a stored leaderboard table ordered by ``(rank_field, user_id)``"""
+    queryset = queryset.order_by(rank_field, 'user_id')
+    position = decode_cursor(cursor, int)
+    if position is not None:
+        rank, user_id = position
+        queryset = queryset.filter(
+            Q(**{f'{rank_field}__gt': rank}) | Q(**{rank_field: rank, 'user_id__gt': user_id})
+        )
+
+    rows = list(queryset[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(getattr(rows[-1], rank_field), rows[-1].user_id)
+    return Page(rows, next_cursor)
@@ -0,0 +1,231 @@
+"""
+Batched payout of leaderboard and season rewards.
+
+Prizes are resolved against a frozen board (the period's
+``LeaderboardSnapshot``, or a season's final ``season_rank``) and paid in
+chunks. Each chunk credits balances with one UPDATE per prize amount,
+bulk-inserts the ``EcoTokenTransaction`` rows and records the payout in a
+single transaction. Users already paid are skipped, so the job can simply be
+re-run after a failure.
+"""
+import time
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Floor, Greatest
+from django.utils import timezone
+
+from accounts.models import User
+from rewards.models import EcoTokenTransaction
+from .models import (
+    LeaderboardType, LeaderboardEntry, LeaderboardReward, UserLeaderboardReward,
+    LeaderboardSeason, SeasonParticipant, LeaderboardSnapshot,
+)
+from .periods import previous_period_bounds
+from .rebuild import rebuild_board
+from .seasons import rerank_season
+from .snapshots import freeze_period, unpack_snapshot
+
+CHUNK_SIZE = 1000
+
+# Boards whose scores move when prizes are paid
+PAYOUT_METRICS = ('total_tokens', 'level')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def credit_users(payments, description, source='event_participation'):
+    """Pay ``{user_id: (tokens, experience)}``; call inside a transaction.
+
+    Users receiving the same amounts are credited by one UPDATE, then every
+    token payment gets its ``EcoTokenTransaction`` in one bulk insert.
+    Prizes move balances but are not activity: they stay out of the
+    ``UserActivityDay`` buckets the period token boards sum, so a payout
+    never ranks its winners higher for the next one.
+    """
+    by_amount = defaultdict(list)
+    for user_id, amounts in payments.items():
+        if any(amounts):
+            by_amount[amounts].append(user_id)
+    if not by_amount:
+        return
+
+    for (tokens, experience), user_ids in by_amount.items():
+        User.objects.filter(pk__in=user_ids).update(
+            total_eco_tokens=F('total_eco_tokens') + tokens,
+            experience_points=F('experience_points') + experience,
+        )
+
+    paid = list(payments)
+    # Same rule as User.add_experience: 100 XP per level, never going down
+    User.objects.filter(pk__in=paid).update(
+        level=Greatest(F('level'), Floor(F('experience_points') / 100.0) + 1)
+    )
+    balances = dict(User.objects.filter(pk__in=paid).values_list('pk', 'total_eco_tokens'))
+    EcoTokenTransaction.objects.bulk_create([
+        EcoTokenTransaction(
+            user_id=user_id,
+            transaction_type='bonus',
+            source=source,
+            amount=tokens,
+            description=description,
+            balance_after=balances[user_id],
+        )
+        for user_id, (tokens, _) in payments.items()
+        if tokens
+    ])
+
+
+def pay_leaderboard_rewards(leaderboard_type, period_start, period_end, chunk_size=CHUNK_SIZE):
+    """Pay the rank-range rewards of one closed period; returns rewards paid"""
+    rewards = list(leaderboard_type.rewards.filter(is_active=True).order_by('min_rank'))
+    if not rewards:
+        return 0
+
+    snapshots = LeaderboardSnapshot.objects.filter(
+        leaderboard_type=leaderboard_type, period_start=period_start,
+    )
+    if not snapshots.exists():
+        freeze_period(leaderboard_type, period_start, period_end)
+
+    max_rank = max(reward.max_rank for reward in rewards)
+    paid = 0
+    for snapshot in snapshots.iterator():
+        winners = [
+            (user_id, rank, score, reward)
+            for user_id, rank, score in unpack_snapshot(snapshot)
+            if rank <= max_rank
+            for reward in rewards
+            if reward.min_rank <= rank <= reward.max_rank
+        ]
+        for chunk in _chunks(winners, chunk_size):
+            paid += _pay_leaderboard_chunk(leaderboard_type, period_start, period_end, chunk)
+    return paid
+
+
+def _pay_leaderboard_chunk(leaderboard_type, period_start, period_end, chunk):
+    with transaction.atomic():
+        # Serialises concurrent runs paying the same rewards
+        list(LeaderboardReward.objects.select_for_update().filter(
+            pk__in={reward.pk for _, _, _, reward in chunk}
+        ))
+
+        # Winners below the stored window get an entry so the payout can point at it
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(
+                leaderboard_type=leaderboard_type,
+                user_id=user_id,
+                rank=rank,
+                score=score,
+                period_start=period_start,
+                period_end=period_end,
+            )
+            for user_id, rank, score, _ in chunk
+        ], ignore_conflicts=True)
+        entries = dict(LeaderboardEntry.objects.filter(
+            leaderboard_type=leaderboard_type,
+            period_start=period_start,
+            user_id__in={user_id for user_id, _, _, _ in chunk},
+        ).values_list('user_id', 'pk'))
+
+        already_paid = set(UserLeaderboardReward.objects.filter(
+            leaderboard_entry_id__in=entries.values(),
+        ).values_list('user_id', 'leaderboard_reward_id'))
+        due = [
+            (user_id, reward)
+            for user_id, _, _, reward in chunk
+            if (user_id, reward.pk) not in already_paid
+        ]
+        if not due:
+            return 0
+
+        UserLeaderboardReward.objects.bulk_create([
+            UserLeaderboardReward(
+                user_id=user_id,
+                leaderboard_reward=reward,
+                leaderboard_entry_id=entries[user_id],
+                tokens_awarded=reward.token_reward,
+                experience_awarded=reward.experience_reward,
+            )
+            for user_id, reward in due
+        ])
+
+        payments = defaultdict(lambda: (0, 0))
+        for user_id, reward in due:
+            tokens, experience = payments[user_id]
+            payments[user_id] = (tokens + reward.token_reward, experience + reward.experience_reward)
+        credit_users(dict(payments), f"Leaderboard reward: {leaderboard_type.name}", source='other')
+    return len(due)
+
+
+def pay_season_rewards(season, chunk_size=CHUNK_SIZE):
+    """Pay winner and participation tokens of a finished season; returns participants paid"""
+    if season.end_date > timezone.now():
+        raise ValueError(f"Season {season} has not finished yet")
+
+    # Scores stopped changing when the season ended, so these ranks are final
+    rerank_season(season)
+
+    pending = SeasonParticipant.objects.filter(season=season, rewards_claimed=False).order_by('pk')
+    paid = 0
+    last = 0
+    while True:
+        with transaction.atomic():
+            participants = list(pending.select_for_update().filter(pk__gt=last)[:chunk_size])
+            if not participants:
+                break
+
+            by_tokens = defaultdict(list)
+            for participant in participants:
+                tokens = season.participation_tokens
+                if participant.season_rank == 1:
+                    tokens += season.winner_tokens
+                by_tokens[tokens].append(participant)
+
+            credit_users(
+                {p.user_id: (tokens, 0) for tokens, group in by_tokens.items() for p in group},
+                f"Season reward: {season.name}",
+            )
+            for tokens, group in by_tokens.items():
+                SeasonParticipant.objects.filter(pk__in=[p.pk for p in group]).update(
+                    rewards_claimed=True, final_tokens_awarded=tokens,
+                )
+        paid += len(participants)
+        last = participants[-1].pk
+    return paid
+
+
+def run_payouts(when=None, chunk_size=CHUNK_SIZE):
+    """Pay every reward that is due; yields ``(label, paid, seconds)`` per board or season.
+
+    Boards refreshed afterwards are yielded with ``paid`` set to None.
+    """
+    total = 0
+    boards = LeaderboardType.objects.filter(
+        is_active=True, rewards__is_active=True,
+    ).exclude(period='all_time').distinct()
+    for leaderboard_type in boards:
+        begin = time.monotonic()
+        period_start, period_end = previous_period_bounds(leaderboard_type.period, when)
+        paid = pay_leaderboard_rewards(leaderboard_type, period_start, period_end, chunk_size)
+        total += paid
+        yield f'{leaderboard_type} ({period_start:%Y-%m-%d})', paid, time.monotonic() - begin
+
+    seasons = LeaderboardSeason.objects.filter(
+        is_active=True, end_date__lt=timezone.now(), participants__rewards_claimed=False,
+    ).distinct()
+    for season in seasons:
+        begin = time.monotonic()
+        paid = pay_season_rewards(season, chunk_size)
+        total += paid
+        yield f'Season {season}', paid, time.monotonic() - begin
+
+    if total:
+        # Balances and levels moved in bulk, so re-rank the boards built on them
+        for leaderboard_type in LeaderboardType.objects.filter(is_active=True, metric__in=PAYOUT_METRICS):
+            begin = time.monotonic()
+            rebuild_board(leaderboard_type)
+            yield f'Refreshed {leaderboard_type}', None, time.monotonic() - begin
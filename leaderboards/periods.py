@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.utils import timezone
+
+# All-time boards use a single fixed window so they share one period_start
+ALL_TIME_START = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+ALL_TIME_END = datetime(9999, 12, 31, tzinfo=dt_timezone.utc)
+
+
+def period_bounds(period, when=None):
+    """Return the (start, end) window of ``period`` containing ``when``"""
+    if period == 'all_time':
+        return ALL_TIME_START, ALL_TIME_END
+
+    when = timezone.localtime(when or timezone.now())
+    day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if period == 'daily':
+        start = day
+        end = start + timedelta(days=1)
+    elif period == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
+    elif period == 'monthly':
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+    elif period == 'yearly':
+        start = day.replace(month=1, day=1)
+        end = start.replace(year=start.year + 1)
+    else:
+        raise ValueError(f"Unknown leaderboard period: {period}")
+
+    return start, end
+
+
+def previous_period_bounds(period, when=None):
+    """Return the window immediately before the one containing ``when``"""
+    if period == 'all_time':
+        return None
+    start, _ = period_bounds(period, when)
+    return period_bounds(period, start - timedelta(seconds=1))
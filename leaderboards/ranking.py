@@ -0,0 +1,293 @@
+"""
+Incremental rank maintenance for ``LeaderboardEntry``.
+
+Each board (leaderboard type, period and partition) is mirrored by a sorted
+set in the leaderboard backend. A score change moves one member in O(log n)
+and tells us exactly which stored rows have to shift, so the database work
+is a single ranged UPDATE plus an upsert of the user's own row instead of a
+full recompute.
+
+Ranks use competition ranking (equal scores share a rank, the next rank is
+skipped), the same as SQL ``RANK()``.
+"""
+import threading
+from collections import namedtuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import User
+from .models import LeaderboardType, LeaderboardEntry, GlobalLeaderboard, SeasonParticipant
+from .backends import get_backend, period_expiry
+from .metrics import SCOPE_FIELDS, get_partition, score_queryset, user_score
+from .periods import ALL_TIME_END, period_bounds
+from .sketches import observe_scores, record_score
+from .snapshots import previous_ranks
+
+
+# Metrics touched by each kind of activity, for update_user_rankings()
+TOKEN_METRICS = ('total_tokens',)
+QUIZ_METRICS = ('quiz_score', 'quizzes_completed', 'level', 'streak_days', 'longest_streak')
+TASK_METRICS = ('tasks_completed', 'level', 'streak_days', 'longest_streak')
+
+# Serialises read-modify-write sequences on the backend within this process
+_lock = threading.RLock()
+
+# A ranked row ready for display
+RankedEntry = namedtuple('RankedEntry', ['rank', 'score', 'user'])
+
+GLOBAL_KEY = 'lb:global'
+
+
+def board_key(leaderboard_type, period_start, partition=''):
+    return f'lb:type:{leaderboard_type.pk}:{period_start:%Y%m%d}:{partition}'
+
+
+def reset_boards(leaderboard_type, period_start):
+    """Drop the loaded sets of every partition so they reload from the database"""
+    get_backend().delete_prefix(f'lb:type:{leaderboard_type.pk}:{period_start:%Y%m%d}:')
+
+
+def season_key(season):
+    return f'lb:season:{season.pk}'
+
+
+def board_expiry(period_end):
+    return None if period_end == ALL_TIME_END else period_expiry(period_end)
+
+
+def ensure_board(leaderboard_type, period_start, period_end, partition=''):
+    """Return the backend key of a board, loading it from the database if needed"""
+    if SCOPE_FIELDS[leaderboard_type.scope] and not partition:
+        # Would load every partition into one set
+        raise ValueError(f'{leaderboard_type.scope} boards need a partition')
+    backend = get_backend()
+    key = board_key(leaderboard_type, period_start, partition)
+    if not backend.is_loaded(key):
+        scores = score_queryset(leaderboard_type, period_start, period_end, partition or None)
+        expire_at = board_expiry(period_end)
+        rows = scores.values_list('pk', 'score').iterator(chunk_size=5000)
+        backend.load(key, observe_scores(key, rows, expire_at), expire_at)
+        sync_board(leaderboard_type, period_start, period_end, partition,
+                   backend.top(key, leaderboard_type.max_entries))
+    return key
+
+
+def ensure_global():
+    """Backend key of the composite global board, loaded from its snapshot"""
+    backend = get_backend()
+    if not backend.is_loaded(GLOBAL_KEY):
+        rows = GlobalLeaderboard.objects.values_list('user_id', 'total_score').iterator(chunk_size=5000)
+        backend.load(GLOBAL_KEY, observe_scores(GLOBAL_KEY, rows))
+    return GLOBAL_KEY
+
+
+def ensure_season(season):
+    """Backend key of a season's board, loaded from its participants"""
+    backend = get_backend()
+    key = season_key(season)
+    if not backend.is_loaded(key):
+        rows = SeasonParticipant.objects.filter(season=season).values_list(
+            'user_id', 'season_score'
+        ).iterator(chunk_size=5000)
+        expire_at = period_expiry(season.end_date)
+        backend.load(key, observe_scores(key, rows, expire_at), expire_at)
+    return key
+
+
+def local_board_type(location_type, period='all_time'):
+    """The LeaderboardType backing a local board (the first active one, as in rebuilds)"""
+    return LeaderboardType.objects.filter(
+        is_active=True, scope=location_type, period=period
+    ).first()
+
+
+def with_users(rows):
+    """Turn backend ``(member, score, rank)`` rows into ``RankedEntry`` objects"""
+    users = User.objects.in_bulk([member for member, _, _ in rows])
+    return [
+        RankedEntry(rank, score, users[member])
+        for member, score, rank in rows
+        if member in users
+    ]
+
+
+def ranked_entries(key, start=0, stop=50):
+    """Entries at positions [start, stop) of a board"""
+    return with_users(get_backend().range(key, start, stop))
+
+
+def around_user(key, user, count=10):
+    """The user's entry with up to ``count`` entries above and below it.
+
+    Costs O(log n + count) whatever the user's position; empty if they are
+    not on the board.
+    """
+    return with_users(get_backend().around(key, user.pk, count))
+
+
+def user_entry(key, user):
+    """The user's own entry on a board, or None if they are not on it"""
+    backend = get_backend()
+    score = backend.score(key, user.pk)
+    if score is None:
+        return None
+    return RankedEntry(backend.rank_of_score(key, score), score, user)
+
+
+def board_entries(leaderboard_type, period_start, partition=''):
+    """Stored entries of one board, restricted to its partition"""
+    entries = LeaderboardEntry.objects.filter(
+        leaderboard_type=leaderboard_type,
+        period_start=period_start,
+    )
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    if field:
+        entries = entries.filter(**{f'user__{field}': partition})
+    return entries
+
+
+def rank_user(leaderboard_type, user, when=None):
+    """Move ``user`` to their current score on one board.
+
+    Returns the user's new rank, or None when they are not ranked.
+    """
+    period_start, period_end = period_bounds(leaderboard_type.period, when)
+    partition = get_partition(leaderboard_type, user)
+    if SCOPE_FIELDS[leaderboard_type.scope] and not partition:
+        return None
+
+    backend = get_backend()
+    key = ensure_board(leaderboard_type, period_start, period_end, partition)
+    score = user_score(leaderboard_type, user, period_start, period_end)
+
+    max_entries = leaderboard_type.max_entries
+    with _lock:
+        old_rank = backend.rank(key, user.pk)
+        if score > 0:
+            old_score = backend.add(key, user.pk, score)
+            new_rank = backend.rank_of_score(key, score)
+            if old_score != score:
+                record_score(key, score, board_expiry(period_end))
+        else:
+            old_score = backend.remove(key, user.pk)
+            new_rank = None
+        if old_score == score or (old_score is None and new_rank is None):
+            return new_rank
+        if (old_rank or max_entries + 1) > max_entries and (new_rank or max_entries + 1) > max_entries:
+            # The move happened entirely below the stored window
+            return new_rank
+        entrants = backend.top(key, max_entries) if old_rank and (new_rank or max_entries + 1) > old_rank else []
+
+    _apply_move(leaderboard_type, period_start, period_end, partition,
+                user, old_score or 0.0, score, new_rank, entrants)
+    return new_rank
+
+
+def _apply_move(leaderboard_type, period_start, period_end, partition,
+                user, old_score, new_score, new_rank, entrants):
+    """Mirror one backend move onto the stored rows"""
+    entries = board_entries(leaderboard_type, period_start, partition)
+    max_entries = leaderboard_type.max_entries
+
+    with transaction.atomic():
+        # Competition ranks only change for members scoring in [low, high)
+        low, high = sorted((old_score, new_score))
+        shift = 1 if new_score > old_score else -1
+        entries.filter(score__gte=low, score__lt=high).exclude(user=user).update(
+            rank=F('rank') + shift
+        )
+
+        if new_rank is not None and new_rank <= max_entries:
+            entry, created = LeaderboardEntry.objects.get_or_create(
+                leaderboard_type=leaderboard_type,
+                user=user,
+                period_start=period_start,
+                defaults={
+                    'rank': new_rank,
+                    'score': new_score,
+                    'period_end': period_end,
+                    'previous_rank': previous_ranks(
+                        leaderboard_type, period_start, [user.pk], partition
+                    ).get(user.pk),
+                },
+            )
+            if not created:
+                entry.rank = new_rank
+                entry.score = new_score
+                entry.save(update_fields=['rank', 'score', 'updated_at'])
+        else:
+            entries.filter(user=user).delete()
+
+        if shift > 0:
+            entries.filter(rank__gt=max_entries).delete()
+        elif entrants:
+            # Dropping a member can pull others up into the stored window
+            sync_board(leaderboard_type, period_start, period_end, partition, entrants)
+
+
+def sync_board(leaderboard_type, period_start, period_end, partition, ranked):
+    """Make the stored rows of one board match ``(member, score, rank)`` triples"""
+    wanted = {member: (score, rank) for member, score, rank in ranked}
+
+    with transaction.atomic():
+        existing = {}
+        stale = []
+        for entry in board_entries(leaderboard_type, period_start, partition):
+            if entry.user_id in wanted:
+                existing[entry.user_id] = entry
+            else:
+                stale.append(entry.pk)
+        LeaderboardEntry.objects.filter(pk__in=stale).delete()
+
+        changed = []
+        for member, entry in existing.items():
+            score, rank = wanted[member]
+            if entry.score != score or entry.rank != rank:
+                entry.score, entry.rank = score, rank
+                changed.append(entry)
+        LeaderboardEntry.objects.bulk_update(changed, ['score', 'rank'])
+
+        missing = [member for member in wanted if member not in existing]
+        carried = previous_ranks(leaderboard_type, period_start, missing, partition)
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(
+                leaderboard_type=leaderboard_type,
+                user_id=member,
+                rank=wanted[member][1],
+                score=wanted[member][0],
+                period_start=period_start,
+                period_end=period_end,
+                previous_rank=carried.get(member),
+            )
+            for member in missing
+        ])
+
+
+def update_user_rankings(user, metrics=None, when=None):
+    """Re-rank ``user`` on every active board tracking one of ``metrics``.
+
+    Call this once the activity that changed the user's scores has been
+    committed (see ``schedule_user_update``); ``metrics=None`` refreshes
+    every board.
+    """
+    boards = LeaderboardType.objects.filter(is_active=True)
+    if metrics is not None:
+        boards = boards.filter(metric__in=metrics)
+    for leaderboard_type in boards:
+        rank_user(leaderboard_type, user, when)
+
+
+def schedule_user_update(user, metrics=None):
+    """Re-rank ``user`` when the current transaction commits.
+
+    With ``LEADERBOARD_ASYNC_UPDATES`` and a shared backend the update is
+    queued as a job in the same transaction instead, and run by a worker off
+    the request path. An in-process backend keeps the update here, as a
+    worker would only move the members of its own copy of the sets.
+    """
+    if getattr(settings, 'LEADERBOARD_ASYNC_UPDATES', False) and get_backend().shared:
+        from .tasks import refresh_user_rankings
+        refresh_user_rankings.enqueue(user.pk, list(metrics) if metrics is not None else None)
+        return
+    transaction.on_commit(lambda: update_user_rankings(user, metrics))
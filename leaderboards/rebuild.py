@@ -0,0 +1,125 @@
+"""
+Set-based rebuild of the stored leaderboard tables.
+
+Every board is ranked by the database in one windowed ``RANK()`` query and
+written back in chunked upserts, so the cost does not involve a query (or a
+Python object) per user and memory stays bounded by the chunk size. The
+global composite board is scored with NumPy (see ``scoring``) and local
+boards are rebuilt in shards by location (see ``local``).
+"""
+import time
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LeaderboardType, LeaderboardEntry, LeaderboardSeason
+from .backends import get_backend
+from .local import LOCAL_SCOPES, rebuild_local
+from .metrics import ranked_queryset
+from .periods import period_bounds
+from .ranking import GLOBAL_KEY, reset_boards
+from .scoring import score_global, write_global
+from .seasons import rerank_season
+from .snapshots import carry_previous_ranks
+
+CHUNK_SIZE = 2000
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rebuild_board(leaderboard_type, when=None, chunk_size=CHUNK_SIZE):
+    """Recompute the ``LeaderboardEntry`` rows of one board for the period containing ``when``.
+
+    Returns the number of rows written.
+    """
+    period_start, period_end = period_bounds(leaderboard_type.period, when)
+    started = timezone.now()
+    written = 0
+
+    with transaction.atomic():
+        rows = ranked_queryset(leaderboard_type, period_start, period_end, leaderboard_type.max_entries)
+        for chunk in _chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+            LeaderboardEntry.objects.bulk_create([
+                LeaderboardEntry(
+                    leaderboard_type=leaderboard_type,
+                    user_id=user_id,
+                    rank=rank,
+                    score=score,
+                    period_start=period_start,
+                    period_end=period_end,
+                )
+                for user_id, score, rank, _ in chunk
+            ], update_conflicts=True,
+                unique_fields=['leaderboard_type', 'user', 'period_start'],
+                update_fields=['rank', 'score', 'period_end', 'updated_at'])
+            written += len(chunk)
+
+        # Anything not rewritten above has dropped off the board
+        LeaderboardEntry.objects.filter(
+            leaderboard_type=leaderboard_type,
+            period_start=period_start,
+            updated_at__lt=started,
+        ).delete()
+
+    carry_previous_ranks(leaderboard_type, period_start, chunk_size)
+    reset_boards(leaderboard_type, period_start)
+    return written
+
+
+def rebuild_global(chunk_size=CHUNK_SIZE, weights=None):
+    """Recompute ``GlobalLeaderboard`` for every active user; returns rows written"""
+    user_ids, columns = score_global(weights)
+    written = write_global(user_ids, columns, chunk_size)
+
+    # Served from the backend, so drop the old set and reload from the new snapshot
+    get_backend().delete(GLOBAL_KEY)
+    return written
+
+
+def rebuild_all(boards=None, when=None, chunk_size=CHUNK_SIZE, include_global=True,
+                weights=None, workers=1):
+    """Rebuild every active board; yields ``(label, rows_written, seconds)`` per board.
+
+    Local boards are rebuilt once per (scope, period) of the given boards,
+    sharded by location over ``workers`` processes; a shard that still fails
+    after a retry is yielded with a label describing the error.
+    """
+    if boards is None:
+        boards = LeaderboardType.objects.filter(is_active=True)
+
+    local_slots = []
+    for leaderboard_type in boards:
+        slot = (leaderboard_type.scope, leaderboard_type.period)
+        if leaderboard_type.scope in LOCAL_SCOPES and slot not in local_slots:
+            local_slots.append(slot)
+
+        begin = time.monotonic()
+        rows = rebuild_board(leaderboard_type, when, chunk_size)
+        yield str(leaderboard_type), rows, time.monotonic() - begin
+
+    for location_type, period in local_slots:
+        begin = time.monotonic()
+        rows = 0
+        for result in rebuild_local(location_type, period, when, workers=workers):
+            if result.error:
+                yield f'Local {location_type} {result.location_value!r} ({period}) FAILED', 0, result.seconds
+            rows += result.rows
+        yield f'Local {location_type} leaderboards ({period})', rows, time.monotonic() - begin
+
+    if include_global:
+        begin = time.monotonic()
+        rows = rebuild_global(chunk_size, weights)
+        yield 'Global leaderboard', rows, time.monotonic() - begin
+
+    for season in LeaderboardSeason.objects.filter(is_active=True, end_date__gte=timezone.now()):
+        begin = time.monotonic()
+        rows = rerank_season(season)
+        yield f'Season {season}', rows, time.monotonic() - begin
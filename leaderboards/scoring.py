@@ -0,0 +1,142 @@
+"""
+Vectorized composite scoring for ``GlobalLeaderboard``.
+
+The all-time metrics of every active user are loaded into NumPy columns in
+keyset-paginated chunks. Per-metric competition ranks and the weighted
+composite are then computed for all users in one vectorized pass and
+written back in chunked upserts, so Python only touches each row to build
+the model instance that is saved.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from accounts.models import User, UserAchievement
+from .models import GlobalLeaderboard
+from .metrics import ALL_TIME_EXPRESSIONS
+
+CHUNK_SIZE = 2000
+LOAD_CHUNK_SIZE = 20000
+
+# Weight of each all-time metric in GlobalLeaderboard.total_score
+DEFAULT_COMPOSITE_WEIGHTS = {
+    'total_tokens': 1.0,
+    'level': 10.0,
+    'quiz_score': 1.0,
+    'tasks_completed': 5.0,
+}
+
+# GlobalLeaderboard rank column filled for each metric
+METRIC_RANK_FIELDS = {
+    'total_tokens': 'tokens_rank',
+    'level': 'level_rank',
+    'quiz_score': 'quiz_rank',
+    'tasks_completed': 'task_rank',
+}
+
+GLOBAL_FIELDS = ['total_score', 'global_rank', 'total_achievements', *METRIC_RANK_FIELDS.values()]
+
+
+def get_composite_weights():
+    return getattr(settings, 'LEADERBOARD_COMPOSITE_WEIGHTS', DEFAULT_COMPOSITE_WEIGHTS)
+
+
+def competition_rank(values):
+    """Rank of each value, highest first; equal values share a rank like SQL ``RANK()``"""
+    descending = -np.asarray(values, dtype=np.float64)
+    return np.searchsorted(np.sort(descending), descending, side='left') + 1
+
+
+def load_columns(metrics, chunk_size=LOAD_CHUNK_SIZE):
+    """Active user ids (ascending) and a float column per metric, loaded in chunks"""
+    users = User.objects.filter(is_active=True).annotate(**{
+        f'metric_{metric}': ALL_TIME_EXPRESSIONS[metric] for metric in metrics
+    }).order_by('pk').values_list('pk', *(f'metric_{metric}' for metric in metrics))
+
+    blocks = []
+    last = 0
+    while True:
+        rows = list(users.filter(pk__gt=last)[:chunk_size])
+        if not rows:
+            break
+        # Users without a profile come back as None, i.e. NaN
+        blocks.append(np.array(rows, dtype=np.float64).reshape(len(rows), len(metrics) + 1))
+        last = rows[-1][0]
+
+    data = np.concatenate(blocks) if blocks else np.empty((0, len(metrics) + 1))
+    user_ids = data[:, 0].astype(np.int64)
+    values = np.nan_to_num(data[:, 1:])
+    return user_ids, {metric: values[:, i] for i, metric in enumerate(metrics)}
+
+
+def _align(pairs, user_ids):
+    """Values of ``(user_id, value)`` pairs aligned with sorted ``user_ids``, 0 where missing"""
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    aligned = np.zeros(len(user_ids), dtype=np.int64)
+    if len(pairs) and len(user_ids):
+        positions = np.searchsorted(user_ids, pairs[:, 0]).clip(max=len(user_ids) - 1)
+        found = user_ids[positions] == pairs[:, 0]
+        aligned[positions[found]] = pairs[found, 1]
+    return aligned
+
+
+def achievement_counts(user_ids):
+    """Number of achievements of each user in ``user_ids`` (which must be sorted)"""
+    return _align(
+        UserAchievement.objects.values_list('user_id').annotate(count=Count('pk')).order_by(),
+        user_ids,
+    )
+
+
+def score_global(weights=None, chunk_size=LOAD_CHUNK_SIZE):
+    """Composite score and ranks of every active user.
+
+    Returns ``(user_ids, columns)`` where ``columns`` maps each
+    ``GlobalLeaderboard`` field in ``GLOBAL_FIELDS`` to an array aligned
+    with ``user_ids``.
+    """
+    weights = weights or get_composite_weights()
+    unknown = set(weights) - set(ALL_TIME_EXPRESSIONS)
+    if unknown:
+        raise ValueError(f"Unknown composite metrics: {', '.join(sorted(unknown))}")
+
+    metrics = list(dict.fromkeys([*METRIC_RANK_FIELDS, *weights]))
+    user_ids, values = load_columns(metrics, chunk_size)
+
+    total_score = np.zeros(len(user_ids))
+    for metric, weight in weights.items():
+        total_score += values[metric] * float(weight)
+
+    columns = {
+        'total_score': total_score,
+        'global_rank': competition_rank(total_score),
+        'total_achievements': achievement_counts(user_ids),
+    }
+    for metric, rank_field in METRIC_RANK_FIELDS.items():
+        columns[rank_field] = competition_rank(values[metric])
+    return user_ids, columns
+
+
+def write_global(user_ids, columns, chunk_size=CHUNK_SIZE):
+    """Upsert scored rows into ``GlobalLeaderboard``, dropping users no longer scored"""
+    started = timezone.now()
+
+    with transaction.atomic():
+        for start in range(0, len(user_ids), chunk_size):
+            stop = start + chunk_size
+            chunk = zip(
+                user_ids[start:stop].tolist(),
+                *(columns[field][start:stop].tolist() for field in GLOBAL_FIELDS),
+            )
+            GlobalLeaderboard.objects.bulk_create([
+                GlobalLeaderboard(user_id=user_id, **dict(zip(GLOBAL_FIELDS, values)))
+                for user_id, *values in chunk
+            ], update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=GLOBAL_FIELDS + ['last_updated'])
+
+        GlobalLeaderboard.objects.filter(last_updated__lt=started).delete()
+
+    return len(user_ids)
@@ -0,0 +1,148 @@
+"""
+Season scoring.
+
+Every token award is credited to the running seasons the user has joined:
+the season's ``bonus_multiplier`` applies to its ``featured_activities``
+(earning sources such as ``'quiz_completion'``; an empty list features
+everything) and the participant's counters are bumped. Running seasons come
+from a small in-process index, so awards do not query ``LeaderboardSeason``.
+
+``season_rank`` is kept current incrementally: a participant moving from
+``old`` to ``new`` only shifts the participants scoring in [old, new), the
+same competition ranking used by ``ranking``.
+"""
+import threading
+import time
+from collections import namedtuple
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+from django.utils import timezone
+
+from .models import LeaderboardSeason, SeasonParticipant
+from .backends import get_backend, period_expiry
+from .ranking import ensure_season, season_key
+from .sketches import record_score
+
+# Seconds before the index of running seasons is reloaded
+SEASON_INDEX_TTL = 60
+
+# Participant counter bumped for each earning source
+SOURCE_COUNTERS = {
+    'quiz_completion': 'quizzes_completed',
+    'task_completion': 'tasks_completed',
+}
+
+SeasonRule = namedtuple('SeasonRule', ['season_id', 'start_date', 'end_date', 'bonus_multiplier', 'featured'])
+
+_index = {'expires': 0.0, 'rules': []}
+_index_lock = threading.Lock()
+
+
+def invalidate_season_index():
+    """Force the next lookup to reload seasons (called when a season is saved)"""
+    with _index_lock:
+        _index['expires'] = 0.0
+
+
+def running_seasons(when=None):
+    """Rules of the seasons running at ``when``, from the cached index"""
+    with _index_lock:
+        if time.monotonic() >= _index['expires']:
+            # Upcoming seasons are included so they start without a reload
+            _index['rules'] = [
+                SeasonRule(pk, start, end, multiplier, frozenset(featured or ()))
+                for pk, start, end, multiplier, featured in LeaderboardSeason.objects.filter(
+                    is_active=True, end_date__gte=timezone.now(),
+                ).values_list('pk', 'start_date', 'end_date', 'bonus_multiplier', 'featured_activities')
+            ]
+            _index['expires'] = time.monotonic() + SEASON_INDEX_TTL
+        rules = _index['rules']
+
+    when = when or timezone.now()
+    return [rule for rule in rules if rule.start_date <= when <= rule.end_date]
+
+
+def season_credit(rule, source, amount):
+    """Season points earned for ``amount`` tokens from ``source``"""
+    if not rule.featured or source in rule.featured:
+        return amount * rule.bonus_multiplier
+    return float(amount)
+
+
+def credit_season_activity(user, source, amount, when=None):
+    """Credit one award to every running season ``user`` participates in"""
+    rules = {rule.season_id: rule for rule in running_seasons(when)}
+    if not rules or amount <= 0:
+        return
+
+    with transaction.atomic():
+        participants = SeasonParticipant.objects.select_for_update(of=('self',)).filter(
+            user=user, season_id__in=rules,
+        ).select_related('season')
+        for participant in participants:
+            old_score = participant.season_score
+            participant.season_score += season_credit(rules[participant.season_id], source, amount)
+            participant.tokens_earned += amount
+            fields = ['season_score', 'tokens_earned', 'last_activity']
+            counter = SOURCE_COUNTERS.get(source)
+            if counter:
+                setattr(participant, counter, getattr(participant, counter) + 1)
+                fields.append(counter)
+            participant.save(update_fields=fields)
+            _rank_participant(participant, old_score)
+
+
+def _rank_participant(participant, old_score):
+    """Move one participant's stored rank and their member in the season's set"""
+    new_score = participant.season_score
+    # Others scoring in [old, new) are overtaken and drop one place
+    SeasonParticipant.objects.filter(
+        season_id=participant.season_id,
+        season_score__gte=old_score,
+        season_score__lt=new_score,
+    ).exclude(pk=participant.pk).update(season_rank=F('season_rank') + 1)
+
+    key = ensure_season(participant.season)
+    backend = get_backend()
+    rank = backend.rank_of_score(key, new_score)
+    SeasonParticipant.objects.filter(pk=participant.pk).update(season_rank=rank)
+    expire_at = period_expiry(participant.season.end_date)
+
+    def publish():
+        backend.add(key, participant.user_id, new_score)
+        record_score(key, new_score, expire_at)
+
+    transaction.on_commit(publish)
+
+
+def join_rank(participant):
+    """Store the rank of a participant who just joined and add them to the set"""
+    key = ensure_season(participant.season)
+    backend = get_backend()
+    backend.add(key, participant.user_id, participant.season_score)
+    record_score(key, participant.season_score, period_expiry(participant.season.end_date))
+    participant.season_rank = backend.rank_of_score(key, participant.season_score)
+    participant.save(update_fields=['season_rank'])
+
+
+def rerank_season(season):
+    """Recompute every ``season_rank`` of a season in one pass; returns rows changed"""
+    ranked = SeasonParticipant.objects.filter(season=season).annotate(
+        new_rank=Window(Rank(), order_by=F('season_score').desc())
+    ).values_list('user_id', 'season_rank', 'new_rank')
+
+    changed = [
+        SeasonParticipant(user_id=user_id, season=season, season_rank=new_rank)
+        for user_id, season_rank, new_rank in ranked
+        if season_rank != new_rank
+    ]
+    with transaction.atomic():
+        # Every row exists, so the upsert only rewrites season_rank; much
+        # cheaper than bulk_update's CASE expressions on large seasons
+        SeasonParticipant.objects.bulk_create(
+            changed, batch_size=2000, update_conflicts=True,
+            unique_fields=['user', 'season'], update_fields=['season_rank'],
+        )
+    get_backend().delete(season_key(season))
+    return len(changed)
@@ -0,0 +1,387 @@
+"""
+Approximate score distributions for leaderboards.
+
+Each board set in the backend (``ranking.board_key``, ``ranking.season_key``
+and the global board) has a KLL quantile sketch next to it, built when the
+set is loaded and updated as scores move. A sketch holds a few hundred
+values whatever the board size, so "top X%" and histograms are answered
+without counting rows, and sketches of several boards can be merged.
+
+A new score is appended to the board's pending values with one atomic
+backend call, so concurrent requests never overwrite each other's updates;
+readers fold the pending values in, and keep what they built per process
+until either blob changes. Every ``PENDING_LIMIT`` values a
+``compact_sketch`` run merges them into the stored sketch, off the request
+path: queued as a job when the backend is shared, on a thread otherwise.
+
+Sketches never forget a value: when a member moves, its old score stays in
+the sketch until it is rebuilt from the board, which ``compact_sketch`` does
+once the sketch has seen ``REFRESH_RATIO`` times as many values as the board
+holds.
+"""
+import math
+import random
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .backends import get_backend
+
+# Accuracy parameter: rank error is roughly 1.7 / K of the board size
+K = 200
+
+# Rebuild a sketch once it counts this many values per member on its board
+REFRESH_RATIO = 1.25
+
+# Pending values that trigger a compaction
+PENDING_LIMIT = 512
+
+# Members read per backend call when a sketch is rebuilt from its board
+REBUILD_CHUNK = 1000
+
+# Boards whose sketches ``load_sketch`` keeps per process
+CACHE_SIZE = 256
+
+HISTOGRAM_BINS = 10
+
+_HEADER = struct.Struct('<QI')
+
+# key -> (sketch blob, pending blob, compacted sketch, sketch with pending values)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class KLLSketch:
+    """Mergeable quantile sketch (Karnin, Lang and Liberty, 2016).
+
+    Level ``h`` holds items of weight ``2 ** h``; a full level is sorted and
+    every other item is promoted, keeping the total size at O(K).
+    """
+
+    C = 2 / 3
+
+    def __init__(self, k=K):
+        self.k = k
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.levels = [[]]
+        self._size = 0
+        self._limit = self._max_size()
+        self._cdf = None
+
+    def __len__(self):
+        return self.count
+
+    def _capacity(self, height):
+        depth = len(self.levels) - height - 1
+        return int(math.ceil(self.k * self.C ** depth)) + 1
+
+    def _max_size(self):
+        return sum(self._capacity(height) for height in range(len(self.levels)))
+
+    def _grow(self):
+        self.levels.append([])
+        self._limit = self._max_size()
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self._size += 1
+        self.count += 1
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self._cdf = None
+        if self._size >= self._limit:
+            self._compress()
+
+    def copy(self):
+        sketch = KLLSketch(self.k)
+        sketch.count = self.count
+        sketch.minimum = self.minimum
+        sketch.maximum = self.maximum
+        sketch.levels = [list(level) for level in self.levels]
+        sketch._size = self._size
+        sketch._limit = self._limit
+        return sketch
+
+    def extend(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def merge(self, other):
+        """Fold ``other`` into this sketch"""
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for height, items in enumerate(other.levels):
+            self.levels[height].extend(items)
+        self._size += other._size
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._cdf = None
+        self._compress()
+        return self
+
+    def _compress(self):
+        while self._size >= self._limit:
+            for height, items in enumerate(self.levels):
+                if len(items) >= self._capacity(height):
+                    if height + 1 == len(self.levels):
+                        self._grow()
+                    items.sort()
+                    odd = items.pop() if len(items) % 2 else None
+                    promoted = items[random.getrandbits(1)::2]
+                    self.levels[height + 1].extend(promoted)
+                    self._size -= len(items) - len(promoted)
+                    items[:] = [] if odd is None else [odd]
+                    break
+            else:
+                break
+
+    def _weights(self):
+        """Sorted values with the cumulative weight up to and including each"""
+        if self._cdf is None:
+            items = sorted(
+                (value, 1 << height)
+                for height, level in enumerate(self.levels)
+                for value in level
+            )
+            values, cumulative, total = [], [], 0
+            for value, weight in items:
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._cdf = (values, cumulative, total)
+        return self._cdf
+
+    def rank(self, value, inclusive=True):
+        """Estimated fraction of values ``<= value`` (``< value`` if not inclusive)"""
+        values, cumulative, total = self._weights()
+        if not total:
+            return 0.0
+        position = (bisect_right if inclusive else bisect_left)(values, value)
+        return cumulative[position - 1] / total if position else 0.0
+
+    def quantile(self, fraction):
+        """Estimated value below which ``fraction`` of the values fall"""
+        values, cumulative, total = self._weights()
+        if not total:
+            return None
+        position = bisect_left(cumulative, fraction * total)
+        return values[min(position, len(values) - 1)]
+
+    def histogram(self, bins=HISTOGRAM_BINS):
+        """``(low, high, count)`` for ``bins`` equal-width buckets over [min, max]"""
+        if not self.count:
+            return []
+        width = (self.maximum - self.minimum) / bins
+        if not width:
+            return [(self.minimum, self.maximum, self.count)]
+        buckets = []
+        below = 0.0
+        for i in range(bins):
+            low = self.minimum + i * width
+            high = self.maximum if i == bins - 1 else low + width
+            upto = 1.0 if i == bins - 1 else self.rank(high, inclusive=False)
+            buckets.append((low, high, round((upto - below) * self.count)))
+            below = upto
+        return buckets
+
+    def to_bytes(self):
+        header = _HEADER.pack(self.count, len(self.levels))
+        sizes = array('I', [len(level) for level in self.levels])
+        values = array('d', [self.minimum, self.maximum])
+        for level in self.levels:
+            values.extend(level)
+        if sys.byteorder != 'little':
+            sizes.byteswap()
+            values.byteswap()
+        return header + sizes.tobytes() + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, k=K):
+        sketch = cls(k)
+        count, depth = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        sizes = array('I')
+        sizes.frombytes(data[offset:offset + 4 * depth])
+        values = array('d')
+        values.frombytes(data[offset + 4 * depth:])
+        if sys.byteorder != 'little':
+            sizes.byteswap()
+            values.byteswap()
+
+        sketch.count = count
+        sketch.minimum, sketch.maximum = values[0], values[1]
+        sketch.levels = []
+        position = 2
+        for size in sizes:
+            sketch.levels.append(values[position:position + size].tolist())
+            position += size
+        sketch._size = position - 2
+        sketch._limit = sketch._max_size()
+        return sketch
+
+
+def sketch_key(key):
+    return f'{key}:sketch'
+
+
+def pending_key(key):
+    return f'{key}:sketch:pending'
+
+
+def _pack(values):
+    values = array('d', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(data):
+    values = array('d')
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def observe_scores(key, items, expire_at=None):
+    """Pass ``(member, score)`` pairs through while building the sketch of ``key``.
+
+    Wrap the items given to ``backend.load`` with this so the set and its
+    sketch are built in the same pass.
+    """
+    sketch = KLLSketch()
+    for member, score in items:
+        sketch.update(score)
+        yield member, score
+    backend = get_backend()
+    backend.set_blob(sketch_key(key), sketch.to_bytes(), expire_at)
+    # Already counted by the pass above
+    backend.pop_blob(pending_key(key))
+
+
+def load_sketch(key):
+    """The sketch of a board with its pending values, or None if it has neither.
+
+    Sketches are cached per process against the blobs they were read from,
+    so while a board is unchanged its sketch and CDF are reused; a new
+    pending value only re-merges the pending values on top of the cached
+    compacted sketch. Treat the result as read-only.
+    """
+    backend = get_backend()
+    data = backend.get_blob(sketch_key(key))
+    pending = backend.get_blob(pending_key(key))
+    if not data and not pending:
+        return None
+
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == data:
+        if cached[1] == pending:
+            return cached[3]
+        base = cached[2]
+    else:
+        base = KLLSketch.from_bytes(data) if data else KLLSketch()
+    sketch = base.copy().extend(_unpack(pending)) if pending else base
+
+    with _cache_lock:
+        _cache.pop(key, None)
+        _cache[key] = (data, pending, base, sketch)
+        while len(_cache) > CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+    return sketch
+
+
+def record_score(key, score, expire_at=None):
+    """Add a member's new score to the pending values of ``key``'s sketch"""
+    length = get_backend().append_blob(pending_key(key), _pack([score]), expire_at)
+    # Each append adds 8 bytes, so exactly one caller sees each multiple
+    if length % (8 * PENDING_LIMIT) == 0:
+        schedule_compaction(key, expire_at)
+
+
+def schedule_compaction(key, expire_at=None):
+    """Run ``compact_sketch`` for ``key`` outside the current request"""
+    if get_backend().shared:
+        from .tasks import compact_score_sketch
+        compact_score_sketch.enqueue(key, expire_at.isoformat() if expire_at else None)
+    else:
+        # Each process has its own sets, which a worker could not reach
+        threading.Thread(target=compact_sketch, args=(key, expire_at), daemon=True).start()
+
+
+def _board_scores(backend, key):
+    """Every score on the board, read ``REBUILD_CHUNK`` members per backend call"""
+    start = 0
+    while True:
+        # Each call holds the in-process backend's lock only for its own chunk
+        rows = backend.range(key, start, start + REBUILD_CHUNK)
+        for _, score, _ in rows:
+            yield score
+        if len(rows) < REBUILD_CHUNK:
+            return
+        start += len(rows)
+
+
+def compact_sketch(key, expire_at=None):
+    """Merge the pending values of ``key`` into its stored sketch.
+
+    Rebuilds the sketch from the board instead when it is missing or holds
+    ``REFRESH_RATIO`` times as many values as the board has members.
+    """
+    backend = get_backend()
+    pending = _unpack(backend.pop_blob(pending_key(key)) or b'')
+    data = backend.get_blob(sketch_key(key))
+    sketch = KLLSketch.from_bytes(data) if data else None
+    members = backend.count(key)
+    seen = len(pending) + (len(sketch) if sketch is not None else 0)
+    if backend.is_loaded(key) and (sketch is None or seen >= max(members, 1) * REFRESH_RATIO):
+        # Too many superseded scores: rebuild from the board itself
+        sketch = KLLSketch().extend(_board_scores(backend, key))
+    elif pending:
+        sketch = (sketch or KLLSketch()).extend(pending)
+    else:
+        return
+    backend.set_blob(sketch_key(key), sketch.to_bytes(), expire_at)
+
+
+def top_percent(sketch, score):
+    """Share of the board scoring at least ``score``, as a percentage (>= 0.1)"""
+    if sketch is None or not len(sketch):
+        return None
+    above = 1.0 - sketch.rank(score, inclusive=False)
+    return max(round(above * 100, 1), 0.1)
+
+
+def distribution(keys, score=None, bins=HISTOGRAM_BINS):
+    """Merged distribution of one or more boards, with ``score``'s "top X%" if given"""
+    parts = [part for part in map(load_sketch, keys) if part is not None]
+    if not parts:
+        return None
+    sketch = parts[0]
+    if len(parts) > 1:
+        # Merge into a new sketch, as loaded ones are shared through the cache
+        sketch = sketch.copy()
+        for part in parts[1:]:
+            sketch.merge(part)
+    return {
+        'count': len(sketch),
+        'percentiles': {p: sketch.quantile(p / 100) for p in (10, 25, 50, 75, 90, 99)},
+        'histogram': [
+            {'low': low, 'high': high, 'count': count}
+            for low, high, count in sketch.histogram(bins)
+        ],
+        'top_percent': top_percent(sketch, score) if score is not None else None,
+    }
+
+
+def board_distribution(key, user=None, bins=HISTOGRAM_BINS):
+    """``distribution`` of one loaded board, placing ``user`` if they are on it"""
+    score = get_backend().score(key, user.pk) if user is not None else None
+    return distribution([key], score, bins)
@@ -0,0 +1,214 @@
+"""
+Period rollover for leaderboards.
+
+When a daily, weekly, monthly or yearly period closes its full ranking is
+frozen into ``LeaderboardSnapshot`` rows (one per partition) holding packed
+arrays, and the final ranks are carried into the new period's
+``previous_rank`` in bulk. Rollover only reads the live tables and writes in
+short chunked transactions, so reads of the live board are never blocked.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from django.db import transaction
+from django.db.models import F
+
+from .models import LeaderboardEntry, LeaderboardSnapshot
+from .metrics import SCOPE_FIELDS, ranked_queryset
+from .periods import period_bounds, previous_period_bounds
+
+CHUNK_SIZE = 2000
+
+# Snapshot arrays are stored sorted by user id so lookups can bisect them
+USER_ID_TYPE = 'q'
+RANK_TYPE = 'I'
+SCORE_TYPE = 'd'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+CACHE_SIZE = 64
+
+
+def _pack(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def unpack_snapshot(snapshot):
+    """``(user_id, rank, score)`` tuples of a snapshot, ordered by rank"""
+    entries = zip(
+        _unpack(USER_ID_TYPE, snapshot.user_ids),
+        _unpack(RANK_TYPE, snapshot.ranks),
+        _unpack(SCORE_TYPE, snapshot.scores),
+    )
+    return sorted(entries, key=lambda entry: (entry[1], entry[0]))
+
+
+def _build_snapshot(leaderboard_type, partition, period_start, period_end, rows):
+    rows.sort()
+    return LeaderboardSnapshot(
+        leaderboard_type=leaderboard_type,
+        partition=partition,
+        period_start=period_start,
+        period_end=period_end,
+        entry_count=len(rows),
+        user_ids=_pack(array(USER_ID_TYPE, (row[0] for row in rows))),
+        ranks=_pack(array(RANK_TYPE, (row[1] for row in rows))),
+        scores=_pack(array(SCORE_TYPE, (row[2] for row in rows))),
+    )
+
+
+def freeze_period(leaderboard_type, period_start, period_end, chunk_size=CHUNK_SIZE):
+    """Store the final ranking of one period; returns the number of entries frozen"""
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    rows = ranked_queryset(leaderboard_type, period_start, period_end)
+    rows = rows.order_by(field, 'pk') if field else rows.order_by('pk')
+
+    snapshots = []
+    partition, current = None, []
+    for user_id, score, rank, row_partition in rows.iterator(chunk_size=chunk_size):
+        if row_partition != partition and current:
+            snapshots.append(_build_snapshot(leaderboard_type, partition, period_start, period_end, current))
+            current = []
+        partition = row_partition
+        current.append((user_id, rank, score))
+
+    if current or not snapshots:
+        # An empty global snapshot still marks the period as frozen
+        snapshots.append(_build_snapshot(
+            leaderboard_type, partition or '', period_start, period_end, current
+        ))
+
+    with transaction.atomic():
+        LeaderboardSnapshot.objects.filter(
+            leaderboard_type=leaderboard_type, period_start=period_start
+        ).delete()
+        LeaderboardSnapshot.objects.bulk_create(snapshots, batch_size=100)
+
+    with _cache_lock:
+        for key in [k for k in _cache if k[:2] == (leaderboard_type.pk, period_start)]:
+            del _cache[key]
+    return sum(snapshot.entry_count for snapshot in snapshots)
+
+
+def _snapshot_arrays(leaderboard_type, period_start, partition):
+    """Cached (user_ids, ranks) arrays of a snapshot, or None if it is not frozen"""
+    key = (leaderboard_type.pk, period_start, partition)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    snapshot = LeaderboardSnapshot.objects.filter(
+        leaderboard_type=leaderboard_type, period_start=period_start, partition=partition,
+    ).values_list('user_ids', 'ranks').first()
+    if snapshot is None:
+        if LeaderboardSnapshot.objects.filter(
+            leaderboard_type=leaderboard_type, period_start=period_start
+        ).exists():
+            # Frozen, but nobody in this partition was ranked
+            snapshot = (b'', b'')
+        else:
+            return None
+
+    arrays = (_unpack(USER_ID_TYPE, snapshot[0]), _unpack(RANK_TYPE, snapshot[1]))
+    with _cache_lock:
+        _cache[key] = arrays
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return arrays
+
+
+def previous_ranks(leaderboard_type, period_start, user_ids, partition=''):
+    """Ranks the given users held at the end of the previous period.
+
+    Reads the frozen snapshot when the previous period has been rolled over,
+    otherwise the stored entries of that period.
+    """
+    bounds = previous_period_bounds(leaderboard_type.period, period_start)
+    if bounds is None or not user_ids:
+        return {}
+
+    arrays = _snapshot_arrays(leaderboard_type, bounds[0], partition)
+    if arrays is None:
+        return dict(LeaderboardEntry.objects.filter(
+            leaderboard_type=leaderboard_type,
+            period_start=bounds[0],
+            user_id__in=user_ids,
+        ).values_list('user_id', 'rank'))
+
+    ids, ranks = arrays
+    found = {}
+    for user_id in user_ids:
+        i = bisect_left(ids, user_id)
+        if i < len(ids) and ids[i] == user_id:
+            found[user_id] = ranks[i]
+    return found
+
+
+def carry_previous_ranks(leaderboard_type, period_start, chunk_size=CHUNK_SIZE):
+    """Set ``previous_rank`` on every entry of a period in bulk; returns rows changed"""
+    if previous_period_bounds(leaderboard_type.period, period_start) is None:
+        return 0
+
+    field = SCOPE_FIELDS[leaderboard_type.scope]
+    entries = LeaderboardEntry.objects.filter(
+        leaderboard_type=leaderboard_type, period_start=period_start,
+    ).annotate(
+        partition=F(f'user__{field}') if field else F('leaderboard_type__scope'),
+    ).order_by('pk').values_list('pk', 'user_id', 'previous_rank', 'partition')
+
+    changed = 0
+    chunk = list(entries[:chunk_size])
+    while chunk:
+        by_partition = {}
+        for pk, user_id, previous_rank, partition in chunk:
+            by_partition.setdefault(partition if field else '', []).append((pk, user_id, previous_rank))
+
+        updates = []
+        for partition, rows in by_partition.items():
+            carried = previous_ranks(leaderboard_type, period_start, [row[1] for row in rows], partition)
+            for pk, user_id, previous_rank in rows:
+                if carried.get(user_id) != previous_rank:
+                    updates.append(LeaderboardEntry(pk=pk, previous_rank=carried.get(user_id)))
+
+        with transaction.atomic():
+            LeaderboardEntry.objects.bulk_update(updates, ['previous_rank'])
+        changed += len(updates)
+        chunk = list(entries.filter(pk__gt=chunk[-1][0])[:chunk_size])
+
+    return changed
+
+
+def rollover_board(leaderboard_type, when=None, chunk_size=CHUNK_SIZE):
+    """Freeze the period before ``when`` if needed and carry its ranks forward.
+
+    Safe to run repeatedly (e.g. from cron); returns ``(frozen, carried)``
+    counts, or None for all-time boards which never roll over.
+    """
+    if leaderboard_type.period == 'all_time':
+        return None
+
+    period_start, _ = period_bounds(leaderboard_type.period, when)
+    previous_start, previous_end = previous_period_bounds(leaderboard_type.period, when)
+
+    frozen = 0
+    if not LeaderboardSnapshot.objects.filter(
+        leaderboard_type=leaderboard_type, period_start=previous_start
+    ).exists():
+        frozen = freeze_period(leaderboard_type, previous_start, previous_end, chunk_size)
+
+    carried = carry_previous_ranks(leaderboard_type, period_start, chunk_size)
+    return frozen, carried
@@ -0,0 +1,23 @@
+"""
+Background tasks of the leaderboards app, run by ``manage.py runworker``.
+"""
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import User
+from jobs.queue import task
+from .ranking import update_user_rankings
+from .sketches import compact_sketch
+
+
+@task(priority=10)
+def refresh_user_rankings(user_id, metrics=None):
+    """Re-rank one user, queued by ``schedule_user_update`` in async mode"""
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        update_user_rankings(user, metrics)
+
+
+@task
+def compact_score_sketch(key, expire_at=None):
+    """Fold a board's pending scores into its sketch, queued by ``record_score``"""
+    compact_sketch(key, parse_datetime(expire_at) if expire_at else None)
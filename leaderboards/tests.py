@@ -0,0 +1,273 @@
+import os
+import random
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+from django.test import TestCase, override_settings
+
+from accounts.models import User
+from jobs.models import Job
+from . import archive, sketches, snapshots
+from .backends import InProcessBackend, RankIndex, get_backend, set_backend
+from .models import LeaderboardEntry, LeaderboardType
+from .periods import period_bounds, previous_period_bounds
+from .ranking import schedule_user_update
+from .sketches import KLLSketch
+
+
+def make_users(count):
+    return [
+        User.objects.create(username=f'user{i}', email=f'user{i}@example.com')
+        for i in range(count)
+    ]
+
+
+def make_board(**kwargs):
+    defaults = {'name': 'Tokens', 'scope': 'global', 'period': 'weekly', 'metric': 'total_tokens'}
+    defaults.update(kwargs)
+    return LeaderboardType.objects.create(**defaults)
+
+
+class BackendTestCase(TestCase):
+    """Runs each test against a fresh in-process backend"""
+
+    def setUp(self):
+        self.previous_backend = get_backend()
+        self.backend = InProcessBackend()
+        set_backend(self.backend)
+        sketches._cache.clear()
+
+    def tearDown(self):
+        set_backend(self.previous_backend)
+
+
+class RankIndexTests(TestCase):
+    def test_ranks_match_sql_rank_with_ties(self):
+        users = make_users(60)
+        board = make_board()
+        start, end = period_bounds('weekly')
+        rng = random.Random(1)
+        scores = {user.pk: float(rng.choice([0.5, 10, 10, 20, 35, 35, 35, 50])) for user in users}
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(leaderboard_type=board, user_id=user_id, rank=0, score=score,
+                             period_start=start, period_end=end)
+            for user_id, score in scores.items()
+        ])
+        index = RankIndex(scores.items())
+
+        def assert_ranks_match():
+            expected = dict(LeaderboardEntry.objects.filter(leaderboard_type=board).annotate(
+                sql_rank=Window(Rank(), order_by=F('score').desc()),
+            ).values_list('user_id', 'sql_rank'))
+            self.assertEqual(len(index), len(expected))
+            for user_id, rank in expected.items():
+                self.assertEqual(index.rank(user_id), rank)
+            ordered = index.range(0, len(index))
+            self.assertEqual([rank for _, _, rank in ordered], sorted(expected.values()))
+
+        assert_ranks_match()
+
+        # Moves, removals and re-inserts keep the index in step with the table
+        for user_id in rng.sample(list(scores), 25):
+            score = float(rng.choice([0.5, 10, 20, 35, 99]))
+            index.add(user_id, score)
+            LeaderboardEntry.objects.filter(leaderboard_type=board, user_id=user_id).update(score=score)
+        for user_id in rng.sample(list(scores), 10):
+            self.assertIsNotNone(index.remove(user_id))
+            LeaderboardEntry.objects.filter(leaderboard_type=board, user_id=user_id).delete()
+        assert_ranks_match()
+
+    def test_range_position_and_top(self):
+        index = RankIndex([(1, 50.0), (2, 40.0), (3, 40.0), (4, 40.0), (5, 10.0)])
+        self.assertEqual(index.range(0, 2), [(1, 50.0, 1), (2, 40.0, 2)])
+        self.assertEqual(index.range(3, 10), [(4, 40.0, 2), (5, 10.0, 5)])
+        self.assertEqual(index.position(3), 2)
+        self.assertEqual(index.rank_of_score(45.0), 2)
+        # Members tied with the last one share its rank and are included
+        self.assertEqual([member for member, _, _ in index.top(2)], [1, 2, 3, 4])
+        self.assertIsNone(index.rank(99))
+
+    def test_backend_windows(self):
+        backend = InProcessBackend()
+        backend.load('board', [(member, float(100 - member)) for member in range(1, 21)])
+        self.assertEqual([row[0] for row in backend.around('board', 10, 2)], [8, 9, 10, 11, 12])
+        self.assertEqual([row[0] for row in backend.after('board', 90.0, 10, 3)], [11, 12, 13])
+        self.assertEqual(backend.incr('board', 20, 100.0), 180.0)
+        self.assertEqual(backend.rank('board', 20), 1)
+
+
+class KLLSketchTests(TestCase):
+    def setUp(self):
+        # Compaction promotes a random half of each level
+        random.seed(0)
+
+    def test_serialization_round_trip(self):
+        rng = random.Random(2)
+        sketch = KLLSketch().extend(rng.uniform(0, 1000) for _ in range(20000))
+        copy = KLLSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(copy.count, sketch.count)
+        self.assertEqual(copy.levels, sketch.levels)
+        self.assertEqual((copy.minimum, copy.maximum), (sketch.minimum, sketch.maximum))
+        for fraction in (0.1, 0.5, 0.9):
+            self.assertEqual(copy.quantile(fraction), sketch.quantile(fraction))
+
+    def test_rank_error_is_bounded(self):
+        values = list(range(100000))
+        random.Random(3).shuffle(values)
+        sketch = KLLSketch().extend(values)
+        self.assertLess(sum(len(level) for level in sketch.levels), 2000)
+        for value in (1000, 25000, 50000, 75000, 99000):
+            self.assertAlmostEqual(sketch.rank(value), value / 100000, delta=0.02)
+
+    def test_merge_and_copy(self):
+        low = KLLSketch().extend(range(0, 5000))
+        high = KLLSketch().extend(range(5000, 10000))
+        copy = low.copy()
+        merged = low.copy().merge(high)
+        self.assertEqual(len(merged), 10000)
+        self.assertEqual((merged.minimum, merged.maximum), (0, 9999))
+        self.assertAlmostEqual(merged.quantile(0.5), 5000, delta=300)
+        # Copies do not share levels with the original
+        copy.update(-1)
+        self.assertEqual(len(low), 5000)
+        self.assertEqual(low.minimum, 0)
+
+
+class SketchStorageTests(BackendTestCase):
+    def load_board(self, key, count):
+        self.backend.load(key, sketches.observe_scores(key, [(i, float(i)) for i in range(1, count + 1)]))
+
+    def test_pending_scores_are_read_and_compacted(self):
+        self.load_board('board', 100)
+        with mock.patch.object(sketches, 'schedule_compaction') as schedule:
+            for i in range(1, sketches.PENDING_LIMIT + 1):
+                sketches.record_score('board', 1000.0 + i)
+        # Exactly one compaction per PENDING_LIMIT values
+        schedule.assert_called_once_with('board', None)
+        self.assertEqual(len(sketches.load_sketch('board')), 100 + sketches.PENDING_LIMIT)
+
+        # The sketch has seen far more values than the board has members: rebuild
+        sketches.compact_sketch('board')
+        self.assertIsNone(self.backend.get_blob(sketches.pending_key('board')))
+        self.assertEqual(len(sketches.load_sketch('board')), 100)
+
+    def test_compaction_merges_when_fresh(self):
+        self.load_board('board', 1000)
+        for score in (5.0, 6.0):
+            sketches.record_score('board', score)
+        sketches.compact_sketch('board')
+        stored = KLLSketch.from_bytes(self.backend.get_blob(sketches.sketch_key('board')))
+        self.assertEqual(len(stored), 1002)
+
+    def test_cache_follows_the_blobs(self):
+        self.load_board('board', 50)
+        first = sketches.load_sketch('board')
+        self.assertIs(sketches.load_sketch('board'), first)
+        sketches.record_score('board', 25.0)
+        second = sketches.load_sketch('board')
+        self.assertIsNot(second, first)
+        self.assertEqual((len(first), len(second)), (50, 51))
+
+    def test_distribution_leaves_cached_sketches_alone(self):
+        self.load_board('a', 10)
+        self.load_board('b', 20)
+        data = sketches.distribution(['a', 'b'], score=15.0)
+        self.assertEqual(data['count'], 30)
+        self.assertEqual(len(sketches.load_sketch('a')), 10)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        snapshots._cache.clear()
+        self.board = make_board()
+        self.start, self.end = period_bounds('weekly')
+        self.previous_start, self.previous_end = previous_period_bounds('weekly', self.start)
+
+    def build(self, rows, period_start=None, period_end=None):
+        return snapshots._build_snapshot(
+            self.board, '', period_start or self.previous_start, period_end or self.previous_end, rows,
+        )
+
+    def test_round_trip_sorted_by_user_id(self):
+        rows = [(30, 1, 90.0), (10, 3, 40.0), (20, 2, 50.5), (40, 3, 40.0)]
+        snapshot = self.build(list(rows))
+        stored = snapshots._unpack(snapshots.USER_ID_TYPE, snapshot.user_ids)
+        self.assertEqual(list(stored), [10, 20, 30, 40])
+        self.assertEqual(snapshot.entry_count, 4)
+        self.assertEqual(snapshots.unpack_snapshot(snapshot), sorted(rows, key=lambda row: (row[1], row[0])))
+
+    def test_previous_ranks_read_the_snapshot(self):
+        self.build([(5, 2, 10.0), (3, 1, 20.0), (9, 3, 5.0)]).save()
+        ranks = snapshots.previous_ranks(self.board, self.start, [3, 4, 9])
+        self.assertEqual(ranks, {3: 1, 9: 3})
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(LEADERBOARD_ARCHIVE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        archive._maps.clear()
+        self.addCleanup(archive._maps.clear)
+        self.board = make_board()
+
+    def snapshot(self, weeks_ago, rows):
+        start = period_bounds('weekly')[0] - timedelta(weeks=weeks_ago)
+        return snapshots._build_snapshot(self.board, '', start, start + timedelta(weeks=1), rows)
+
+    def test_append_and_read_history(self):
+        older = self.snapshot(2, [(1, 2, 10.0), (2, 1, 30.0)])
+        newer = self.snapshot(1, [(1, 1, 50.0), (3, 2, 5.0)])
+        self.assertTrue(archive.append_snapshot(older))
+        self.assertTrue(archive.append_snapshot(newer))
+        # Appending a period twice is a no-op
+        self.assertFalse(archive.append_snapshot(newer))
+
+        history = archive.rank_history(self.board, 1)
+        self.assertEqual([(point.rank, point.score) for point in history], [(2, 10.0), (1, 50.0)])
+        self.assertEqual(history[0].period_start, older.period_start)
+        self.assertEqual([point.rank for point in archive.rank_history(self.board, 1, limit=1)], [1])
+        self.assertEqual(archive.rank_history(self.board, 2)[0].rank, 1)
+        self.assertEqual(archive.rank_history(self.board, 99), [])
+
+    def test_segment_cut_short_is_ignored_then_replaced(self):
+        first = self.snapshot(3, [(1, 1, 10.0)])
+        archive.append_snapshot(first)
+        path = archive.archive_path(self.board)
+        complete = os.path.getsize(path)
+
+        # A crash half way through the next append
+        partial = self.snapshot(2, [(1, 4, 1.0), (2, 1, 9.0)])
+        with open(path, 'ab') as handle:
+            handle.write(archive.SEGMENT.pack(int(partial.period_start.timestamp()), 0, 2, 0) + b'\x01\x02')
+        self.assertEqual(len(archive.rank_history(self.board, 1)), 1)
+
+        self.assertTrue(archive.append_snapshot(partial))
+        self.assertEqual(os.path.getsize(path), complete + archive._segment_size(2))
+        self.assertEqual([point.rank for point in archive.rank_history(self.board, 1)], [1, 4])
+
+
+class ScheduleUserUpdateTests(BackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_users(1)[0]
+
+    @override_settings(LEADERBOARD_ASYNC_UPDATES=True)
+    def test_in_process_backend_updates_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            schedule_user_update(self.user)
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(LEADERBOARD_ASYNC_UPDATES=True)
+    def test_shared_backend_queues_a_job(self):
+        self.backend.shared = True
+        with self.captureOnCommitCallbacks() as callbacks:
+            schedule_user_update(self.user, ['level'])
+        self.assertEqual(callbacks, [])
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.args), ('leaderboards.tasks.refresh_user_rankings', [self.user.pk, ['level']]))
@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Avg, Count, Sum
+from django.db.models import Q, F, Avg, Count, Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import (
@@ -9,6 +9,19 @@ from .models import (
     LeaderboardSeason, SeasonParticipant
 )
 from accounts.models import User, UserProfile
+from .activity import recent_days
+from .metrics import get_partition
+from .pagination import board_page
+from .periods import period_bounds
+from .seasons import join_rank
+from .ranking import (
+    around_user, ensure_board, ensure_global, ensure_season, local_board_type,
+    user_entry,
+)
+from .sketches import board_distribution
+
+# Entries shown above and below the user's own row
+NEARBY_COUNT = 5
 
 def leaderboard_home(request):
     """Main leaderboards page showing different categories"""
@@ -58,11 +71,26 @@ def leaderboard_home(request):
             if local_school:
                 user_rankings['school'] = local_school
     
+    # Score distributions and "top X%" from the boards' quantile sketches
+    user = request.user if request.user.is_authenticated else None
+    distributions = {'global': board_distribution(ensure_global(), user)}
+    if current_season:
+        distributions['season'] = board_distribution(ensure_season(current_season), user)
+    if user:
+        for location_type in ('city', 'school'):
+            leaderboard_type = local_board_type(location_type)
+            partition = get_partition(leaderboard_type, user) if leaderboard_type else None
+            if partition:
+                period_start, period_end = period_bounds(leaderboard_type.period)
+                key = ensure_board(leaderboard_type, period_start, period_end, partition)
+                distributions[location_type] = board_distribution(key, user)
+    
     context = {
         'global_boards': global_boards,
         'local_boards': local_boards,
         'current_season': current_season,
         'user_rankings': user_rankings,
+        'distributions': distributions,
     }
     return render(request, 'leaderboards/home.html', context)
 
@@ -77,43 +105,43 @@ def global_leaderboard(request, board_type=None):
         )
         
         # Get current period entries
-        entries = LeaderboardEntry.objects.filter(
-            leaderboard_type=leaderboard_type
-        ).select_related('user').order_by('rank')[:50]
+        period_start, period_end = period_bounds(leaderboard_type.period)
+        key = ensure_board(leaderboard_type, period_start, period_end)
+        page = board_page(key, request.GET.get('after'))
         
         # Get user's position if logged in
-        user_entry = None
+        own_entry = None
+        nearby_entries = []
         if request.user.is_authenticated:
-            try:
-                user_entry = LeaderboardEntry.objects.get(
-                    leaderboard_type=leaderboard_type,
-                    user=request.user
-                )
-            except LeaderboardEntry.DoesNotExist:
-                pass
+            own_entry = user_entry(key, request.user)
+            nearby_entries = around_user(key, request.user, NEARBY_COUNT)
         
         context = {
             'leaderboard_type': leaderboard_type,
-            'entries': entries,
-            'user_entry': user_entry,
+            'entries': page.entries,
+            'next_cursor': page.next_cursor,
+            'user_entry': own_entry,
+            'nearby_entries': nearby_entries,
         }
         return render(request, 'leaderboards/global_detail.html', context)
     
     else:
         # Show overall global leaderboard
-        top_users = GlobalLeaderboard.objects.select_related('user').order_by('global_rank')[:50]
+        key = ensure_global()
+        page = board_page(key, request.GET.get('after'))
         
         # Get user's global position
         user_global = None
+        nearby_entries = []
         if request.user.is_authenticated:
-            try:
-                user_global = GlobalLeaderboard.objects.get(user=request.user)
-            except GlobalLeaderboard.DoesNotExist:
-                pass
+            user_global = user_entry(key, request.user)
+            nearby_entries = around_user(key, request.user, NEARBY_COUNT)
         
         context = {
-            'top_users': top_users,
+            'top_users': page.entries,
+            'next_cursor': page.next_cursor,
             'user_global': user_global,
+            'nearby_entries': nearby_entries,
         }
         return render(request, 'leaderboards/global.html', context)
 
@@ -132,31 +160,29 @@ def local_leaderboard(request, location_type, location_value=None):
         messages.error(request, "Location not specified")
         return redirect('leaderboards:home')
     
-    # Get local leaderboard entries
-    entries = LocalLeaderboard.objects.filter(
-        location_type=location_type,
-        location_value=location_value,
-        period_type='all_time'  # Default to all-time
-    ).select_related('user').order_by('rank')[:50]
-    
-    # Get user's position
-    user_entry = None
-    if request.user.is_authenticated:
-        try:
-            user_entry = LocalLeaderboard.objects.get(
-                location_type=location_type,
-                location_value=location_value,
-                user=request.user,
-                period_type='all_time'
-            )
-        except LocalLeaderboard.DoesNotExist:
-            pass
+    # Get local leaderboard entries (default to all-time)
+    entries = []
+    next_cursor = None
+    own_entry = None
+    nearby_entries = []
+    leaderboard_type = local_board_type(location_type, 'all_time')
+    if leaderboard_type:
+        period_start, period_end = period_bounds(leaderboard_type.period)
+        key = ensure_board(leaderboard_type, period_start, period_end, location_value)
+        entries, next_cursor = board_page(key, request.GET.get('after'))
+        
+        # Get user's position
+        if request.user.is_authenticated:
+            own_entry = user_entry(key, request.user)
+            nearby_entries = around_user(key, request.user, NEARBY_COUNT)
     
     context = {
         'location_type': location_type,
         'location_value': location_value,
         'entries': entries,
-        'user_entry': user_entry,
+        'next_cursor': next_cursor,
+        'user_entry': own_entry,
+        'nearby_entries': nearby_entries,
     }
     return render(request, 'leaderboards/local.html', context)
 
@@ -166,25 +192,22 @@ def seasonal_leaderboard(request, season_id=None):
         season = get_object_or_404(LeaderboardSeason, id=season_id, is_active=True)
         
         # Get participants
-        participants = SeasonParticipant.objects.filter(
-            season=season
-        ).select_related('user').order_by('season_rank')[:50]
+        key = ensure_season(season)
+        page = board_page(key, request.GET.get('after'))
         
         # Get user's participation
         user_participation = None
+        nearby_entries = []
         if request.user.is_authenticated:
-            try:
-                user_participation = SeasonParticipant.objects.get(
-                    season=season,
-                    user=request.user
-                )
-            except SeasonParticipant.DoesNotExist:
-                pass
+            user_participation = user_entry(key, request.user)
+            nearby_entries = around_user(key, request.user, NEARBY_COUNT)
         
         context = {
             'season': season,
-            'participants': participants,
+            'participants': page.entries,
+            'next_cursor': page.next_cursor,
             'user_participation': user_participation,
+            'nearby_entries': nearby_entries,
             'is_running': season.is_running(),
         }
         return render(request, 'leaderboards/season_detail.html', context)
@@ -221,6 +244,7 @@ def join_season(request, season_id):
     )
     
     if created:
+        join_rank(participant)
         messages.success(request, f"Joined {season.name}!")
     else:
         messages.info(request, "You're already participating in this season")
@@ -230,13 +254,15 @@ def join_season(request, season_id):
 def quiz_leaderboards(request):
     """Show quiz-specific leaderboards"""
     from quizzes.models import QuizAttempt, Quiz
+    from quizzes.stats import current_week_start
     
-    # Top quiz performers (all time)
-    top_quiz_performers = User.objects.annotate(
-        avg_score=Avg('quiz_attempts__score'),
-        total_quizzes=Count('quiz_attempts', filter=Q(quiz_attempts__is_completed=True))
-    ).filter(
-        total_quizzes__gte=3  # At least 3 completed quizzes
+    # Top quiz performers (all time), read from the per-user quiz stats
+    top_quiz_performers = User.objects.filter(
+        quiz_stats__quizzes_completed__gte=3  # At least 3 completed quizzes
+    ).annotate(
+        avg_score=F('quiz_stats__average_score'),
+        total_quizzes=F('quiz_stats__quizzes_completed'),
+        best_score=F('quiz_stats__best_score')
     ).order_by('-avg_score')[:20]
     
     # Recent perfect scores
@@ -246,13 +272,12 @@ def quiz_leaderboards(request):
     ).select_related('user', 'quiz').order_by('-completed_at')[:10]
     
     # Most active quiz takers this week
-    week_ago = timezone.now() - timedelta(days=7)
-    weekly_active = User.objects.annotate(
-        weekly_quizzes=Count('quiz_attempts', filter=Q(
-            quiz_attempts__completed_at__gte=week_ago,
-            quiz_attempts__is_completed=True
-        ))
-    ).filter(weekly_quizzes__gt=0).order_by('-weekly_quizzes')[:15]
+    weekly_active = User.objects.filter(
+        quiz_stats__week_start=current_week_start(),
+        quiz_stats__weekly_completed__gt=0
+    ).annotate(
+        weekly_quizzes=F('quiz_stats__weekly_completed')
+    ).order_by('-weekly_quizzes')[:15]
     
     context = {
         'top_quiz_performers': top_quiz_performers,
@@ -267,7 +292,7 @@ def task_leaderboards(request):
     
     # Top task completers
     top_task_performers = User.objects.annotate(
-        completed_tasks=Count('eco_tasks', filter=Q(eco_tasks__status='completed'))
+        completed_tasks=F('profile__tasks_completed')
     ).filter(completed_tasks__gt=0).order_by('-completed_tasks')[:20]
     
     # Recent task completions
@@ -276,12 +301,8 @@ def task_leaderboards(request):
     ).select_related('user', 'task').order_by('-completed_at')[:10]
     
     # Most active this month
-    month_ago = timezone.now() - timedelta(days=30)
     monthly_active = User.objects.annotate(
-        monthly_tasks=Count('eco_tasks', filter=Q(
-            eco_tasks__completed_at__gte=month_ago,
-            eco_tasks__status='completed'
-        ))
+        monthly_tasks=Sum('activity_days__tasks_completed', filter=Q(**recent_days(30)))
     ).filter(monthly_tasks__gt=0).order_by('-monthly_tasks')[:15]
     
     context = {
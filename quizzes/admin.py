@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import QuizCategory, Quiz, Question, Answer, QuizAttempt, UserAnswer, QuizLeaderboard
+from .models import QuizCategory, Quiz, Question, Answer, QuizAttempt, UserAnswer, QuizLeaderboard, UserQuizStats, UserQuizProgress, QuizStats, QuestionStats
 
 class AnswerInline(admin.TabularInline):
     model = Answer
@@ -14,7 +14,9 @@ class QuizCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
-    list_display = ('title', 'category', 'difficulty', 'is_active', 'is_featured', 'get_questions_count')
+    list_display = ('title', 'category', 'difficulty', 'is_active', 'is_featured', 'get_questions_count',
+                    'get_completion_rate', 'get_average_score')
+    list_select_related = ('category', 'stats')
     list_filter = ('category', 'difficulty', 'is_active', 'is_featured')
     search_fields = ('title', 'description')
     filter_horizontal = ('prerequisite_quizzes',)
@@ -22,7 +24,9 @@ class QuizAdmin(admin.ModelAdmin):
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
-    list_display = ('quiz', 'question_type', 'text_preview', 'points', 'order')
+    list_display = ('quiz', 'question_type', 'text_preview', 'points', 'order',
+                    'p_value', 'discrimination', 'responses')
+    list_select_related = ('quiz', 'stats')
     list_filter = ('question_type', 'quiz__category')
     search_fields = ('text', 'quiz__title')
     inlines = [AnswerInline]
@@ -30,6 +34,22 @@ class QuestionAdmin(admin.ModelAdmin):
     def text_preview(self, obj):
         return obj.text[:100] + "..." if len(obj.text) > 100 else obj.text
     text_preview.short_description = "Question Text"
+    
+    def _stat(self, obj, field):
+        stats = getattr(obj, 'stats', None)
+        return getattr(stats, field, None)
+    
+    @admin.display(description='Difficulty (p)', ordering='stats__p_value')
+    def p_value(self, obj):
+        return self._stat(obj, 'p_value')
+    
+    @admin.display(description='Discrimination', ordering='stats__discrimination')
+    def discrimination(self, obj):
+        return self._stat(obj, 'discrimination')
+    
+    @admin.display(description='Responses', ordering='stats__responses')
+    def responses(self, obj):
+        return self._stat(obj, 'responses')
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
@@ -43,10 +63,15 @@ class AnswerAdmin(admin.ModelAdmin):
 
 @admin.register(QuizAttempt)
 class QuizAttemptAdmin(admin.ModelAdmin):
-    list_display = ('user', 'quiz', 'score', 'is_completed', 'tokens_earned', 'started_at')
+    list_display = ('user', 'quiz', 'score', 'is_completed', 'answers_archived', 'tokens_earned', 'started_at')
     list_filter = ('is_completed', 'quiz__category', 'started_at')
     search_fields = ('user__username', 'quiz__title')
     readonly_fields = ('started_at', 'completed_at')
+    exclude = ('answer_log',)
+    
+    @admin.display(description='Archived', boolean=True)
+    def answers_archived(self, obj):
+        return obj.answers_archived
 
 @admin.register(UserAnswer)
 class UserAnswerAdmin(admin.ModelAdmin):
@@ -59,3 +84,30 @@ class QuizLeaderboardAdmin(admin.ModelAdmin):
     list_display = ('quiz', 'user', 'leaderboard_type', 'best_score', 'rank', 'updated_at')
     list_filter = ('leaderboard_type', 'quiz__category', 'updated_at')
     search_fields = ('user__username', 'quiz__title')
+
+@admin.register(UserQuizStats)
+class UserQuizStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'quizzes_completed', 'average_score', 'best_score', 'weekly_completed', 'last_completed_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('updated_at',)
+
+@admin.register(UserQuizProgress)
+class UserQuizProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'quiz', 'attempts_completed', 'best_score', 'best_time_seconds', 'last_completed_at')
+    list_filter = ('quiz',)
+    search_fields = ('user__username', 'quiz__title')
+
+@admin.register(QuizStats)
+class QuizStatsAdmin(admin.ModelAdmin):
+    list_display = ('quiz', 'question_count', 'attempts_started', 'attempts_completed', 'average_score', 'updated_at')
+    list_select_related = ('quiz',)
+    search_fields = ('quiz__title',)
+    readonly_fields = ('updated_at',)
+
+@admin.register(QuestionStats)
+class QuestionStatsAdmin(admin.ModelAdmin):
+    list_display = ('question', 'responses', 'p_value', 'discrimination', 'analyzed_at')
+    list_select_related = ('question__quiz',)
+    list_filter = ('question__quiz',)
+    search_fields = ('question__text', 'question__quiz__title')
+    readonly_fields = ('analyzed_at',)
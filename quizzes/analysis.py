@@ -0,0 +1,235 @@
+"""
+Vectorized item analysis of quiz questions.
+
+Answers from completed attempts are streamed in keyset-paginated chunks into
+NumPy columns ``(attempt, question, selected_answer, is_correct)``, next to
+the ``(attempt, quiz, score)`` columns of those attempts. Every statistic is
+then computed for all questions at once with sorts and ``bincount``, so
+Python never loops over answers:
+
+- p-value: share of responses that are correct;
+- discrimination: p-value among the top 27% of a quiz's attempts (by score)
+  minus the p-value among its bottom 27%;
+- answer counts: how often each answer was chosen, i.e. distractor
+  frequencies.
+
+Answers of archived attempts are decoded from their packed logs into the
+same columns, one attempt (not one answer) at a time.
+
+Results are upserted into ``QuestionStats``.
+"""
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .answer_log import NO_ANSWER, decode_columns
+from .models import Answer, Question, QuestionStats, QuizAttempt, UserAnswer
+
+CHUNK_SIZE = 1000
+LOAD_CHUNK_SIZE = 50000
+
+# Share of a quiz's attempts in each of the upper and lower groups
+GROUP_SHARE = 0.27
+
+ANSWER_COLUMNS = ('attempt_id', 'question_id', 'selected_answer_id', 'is_correct')
+
+
+def _load(queryset, fields, chunk_size):
+    """``pk`` and ``fields`` of ``queryset`` as a float matrix, fetched in pk order in chunks"""
+    rows = queryset.order_by('pk').values_list('pk', *fields)
+    blocks = []
+    last = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last)[:chunk_size])
+        if not chunk:
+            break
+        # A missing selected answer (fill-in-the-blank) comes back as None, i.e. NaN
+        blocks.append(np.array(chunk, dtype=np.float64).reshape(len(chunk), len(fields) + 1))
+        last = chunk[-1][0]
+
+    data = np.concatenate(blocks) if blocks else np.empty((0, len(fields) + 1))
+    return np.nan_to_num(data)
+
+
+def load_attempts(quiz_ids=None, chunk_size=LOAD_CHUNK_SIZE):
+    """Ids (ascending), quizzes and scores of completed attempts"""
+    attempts = QuizAttempt.objects.filter(is_completed=True)
+    if quiz_ids is not None:
+        attempts = attempts.filter(quiz_id__in=quiz_ids)
+    data = _load(attempts, ('quiz_id', 'score'), chunk_size)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2]
+
+
+def load_logged_answers(quiz_ids=None, chunk_size=LOAD_CHUNK_SIZE):
+    """``ANSWER_COLUMNS`` decoded from the answer logs of archived attempts"""
+    attempts = QuizAttempt.objects.filter(is_completed=True, answer_log__isnull=False)
+    if quiz_ids is not None:
+        attempts = attempts.filter(quiz_id__in=quiz_ids)
+    rows = attempts.order_by('pk').values_list('pk', 'answer_log')
+
+    attempt_ids, counts, question_ids, answer_ids, bitmaps = [], [], [], [], []
+    last = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last)[:chunk_size])
+        if not chunk:
+            break
+        for attempt_id, log in chunk:
+            columns = decode_columns(log)
+            attempt_ids.append(attempt_id)
+            counts.append(len(columns.question_ids))
+            question_ids.extend(columns.question_ids)
+            answer_ids.extend(columns.answer_ids)
+            bitmaps.append(columns.correct_bitmap)
+        last = chunk[-1][0]
+    if not attempt_ids:
+        return {column: np.empty(0, dtype=np.int64) for column in ANSWER_COLUMNS}
+
+    counts = np.array(counts, dtype=np.int64)
+    questions = np.array(question_ids, dtype=np.int64)
+    selected = np.array(answer_ids, dtype=np.int64)
+
+    # Each bitmap is padded to whole bytes; keep the first ``count`` bits of each
+    padded = (counts + 7) // 8 * 8
+    bits = np.unpackbits(np.frombuffer(b''.join(bitmaps), dtype=np.uint8), bitorder='little')
+    offset = np.arange(len(bits)) - np.repeat(np.cumsum(padded) - padded, padded)
+    correct = bits[offset < np.repeat(counts, padded)].astype(np.int64)
+
+    # Answers to deleted questions or choices would have been deleted with them
+    existing = Question.objects.all()
+    choices = Answer.objects.all()
+    if quiz_ids is not None:
+        existing = existing.filter(quiz_id__in=quiz_ids)
+        choices = choices.filter(question__quiz_id__in=quiz_ids)
+    kept = np.isin(questions, np.array(list(existing.values_list('pk', flat=True)), dtype=np.int64))
+    kept &= (selected == NO_ANSWER) | np.isin(
+        selected, np.array(list(choices.values_list('pk', flat=True)), dtype=np.int64),
+    )
+    return {
+        'attempt_id': np.repeat(np.array(attempt_ids, dtype=np.int64), counts)[kept],
+        'question_id': questions[kept],
+        'selected_answer_id': selected[kept],
+        'is_correct': correct[kept],
+    }
+
+
+def load_answers(quiz_ids=None, chunk_size=LOAD_CHUNK_SIZE):
+    """``ANSWER_COLUMNS`` of the answers given in completed attempts, as int64 columns"""
+    answers = UserAnswer.objects.filter(attempt__is_completed=True)
+    if quiz_ids is not None:
+        answers = answers.filter(attempt__quiz_id__in=quiz_ids)
+    data = _load(answers, ANSWER_COLUMNS, chunk_size).astype(np.int64)
+    logged = load_logged_answers(quiz_ids, chunk_size)
+    return {
+        column: np.concatenate([data[:, i + 1], logged[column]]) for i, column in enumerate(ANSWER_COLUMNS)
+    }
+
+
+def attempt_groups(quizzes, scores, share=GROUP_SHARE):
+    """1 for attempts in their quiz's upper group, -1 for the lower group, else 0"""
+    groups = np.zeros(len(quizzes), dtype=np.int8)
+    if not len(quizzes):
+        return groups
+    # Ascending by quiz, then score
+    order = np.lexsort((scores, quizzes))
+    _, starts, counts = np.unique(quizzes[order], return_index=True, return_counts=True)
+    sizes = np.repeat(counts, counts)
+    position = np.arange(len(order)) - np.repeat(starts, counts)
+    size = np.maximum(np.rint(sizes * share), 1)
+    ranked = sizes >= 2
+    groups[order[ranked & (position < size)]] = -1
+    groups[order[ranked & (position >= sizes - size)]] = 1
+    return groups
+
+
+def analyze(quiz_ids=None, chunk_size=LOAD_CHUNK_SIZE):
+    """Item statistics of every answered question.
+
+    Returns ``(question_ids, columns, answer_counts)``: ``columns`` maps
+    ``responses``, ``correct``, ``p_value`` and ``discrimination`` to arrays
+    aligned with ``question_ids``, and ``answer_counts`` maps each question
+    id to ``{answer_id: count}``.
+    """
+    attempt_ids, quizzes, scores = load_attempts(quiz_ids, chunk_size)
+    answers = load_answers(quiz_ids, chunk_size)
+
+    # Group of each answer's attempt (attempt_ids is sorted); answers of an
+    # attempt completed after the attempts were loaded stay ungrouped
+    groups = np.zeros(len(answers['attempt_id']), dtype=np.int8)
+    if len(attempt_ids):
+        positions = np.searchsorted(attempt_ids, answers['attempt_id']).clip(max=len(attempt_ids) - 1)
+        found = attempt_ids[positions] == answers['attempt_id']
+        groups[found] = attempt_groups(quizzes, scores)[positions[found]]
+
+    question_ids, index = np.unique(answers['question_id'], return_inverse=True)
+    size = len(question_ids)
+    correct = answers['is_correct'].astype(np.float64)
+
+    responses = np.bincount(index, minlength=size)
+    correct_total = np.bincount(index, weights=correct, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p_value = correct_total / responses
+
+        upper, lower = groups == 1, groups == -1
+        p_upper = (np.bincount(index[upper], weights=correct[upper], minlength=size)
+                   / np.bincount(index[upper], minlength=size))
+        p_lower = (np.bincount(index[lower], weights=correct[lower], minlength=size)
+                   / np.bincount(index[lower], minlength=size))
+    discrimination = p_upper - p_lower  # NaN unless both groups answered
+
+    chosen = answers['selected_answer_id'] > 0
+    pairs, counts = np.unique(
+        np.stack([answers['question_id'][chosen], answers['selected_answer_id'][chosen]], axis=1),
+        axis=0, return_counts=True,
+    ) if chosen.any() else (np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64))
+    answer_counts = {}
+    for (question_id, answer_id), count in zip(pairs.tolist(), counts.tolist()):
+        answer_counts.setdefault(question_id, {})[str(answer_id)] = count
+
+    columns = {
+        'responses': responses,
+        'correct': correct_total.astype(np.int64),
+        'p_value': p_value,
+        'discrimination': discrimination,
+    }
+    return question_ids, columns, answer_counts
+
+
+def _value(value):
+    return None if np.isnan(value) else round(float(value), 6)
+
+
+def analyze_questions(quiz_ids=None, chunk_size=CHUNK_SIZE, load_chunk_size=LOAD_CHUNK_SIZE):
+    """Refresh ``QuestionStats`` of the given quizzes (all when None); returns questions written"""
+    started = timezone.now()
+    question_ids, columns, answer_counts = analyze(quiz_ids, load_chunk_size)
+
+    with transaction.atomic():
+        for start in range(0, len(question_ids), chunk_size):
+            stop = start + chunk_size
+            QuestionStats.objects.bulk_create([
+                QuestionStats(
+                    question_id=question_id,
+                    responses=responses,
+                    correct=correct,
+                    p_value=_value(p_value),
+                    discrimination=_value(discrimination),
+                    answer_counts=answer_counts.get(question_id, {}),
+                )
+                for question_id, responses, correct, p_value, discrimination in zip(
+                    question_ids[start:stop].tolist(),
+                    columns['responses'][start:stop].tolist(),
+                    columns['correct'][start:stop].tolist(),
+                    columns['p_value'][start:stop],
+                    columns['discrimination'][start:stop],
+                )
+            ], update_conflicts=True,
+                unique_fields=['question'],
+                update_fields=['responses', 'correct', 'p_value', 'discrimination', 'answer_counts', 'analyzed_at'])
+
+        # Questions left without completed answers
+        stale = QuestionStats.objects.filter(analyzed_at__lt=started)
+        if quiz_ids is not None:
+            stale = stale.filter(question__quiz_id__in=quiz_ids)
+        stale.delete()
+
+    return len(question_ids)
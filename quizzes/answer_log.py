@@ -0,0 +1,180 @@
+"""
+Compact answer logs of archived quiz attempts.
+
+While an attempt is open every answer is a ``UserAnswer`` row. Once it is
+completed its answers never change, so ``archive_attempts`` packs them into
+``QuizAttempt.answer_log`` and deletes the rows. A log is little-endian::
+
+    version   uint8      LOG_VERSION
+    count     uint16     answers in the log
+    questions count * uint32, question ids in ascending order
+    answers   count * uint32, selected answer ids, NO_ANSWER when none
+    correct   ceil(count / 8) bytes, correctness bitmap, lowest bit first
+    texts     uint16 count, then (uint16 position, uint16 length, UTF-8)
+              for each non-empty text answer
+
+A ten-question attempt takes about 90 bytes instead of ten rows plus their
+index entries. ``answered_at`` is not kept; the attempt's ``completed_at``
+is. An answer whose question or selected answer has since been deleted is
+skipped, as its ``UserAnswer`` row would have been deleted with them.
+"""
+import struct
+from collections import namedtuple
+from django.db import transaction
+
+from .models import Answer, Question, QuizAttempt, UserAnswer
+
+LOG_VERSION = 2
+NO_ANSWER = 0
+CHUNK_SIZE = 1000
+
+HEADER = struct.Struct('<BH')
+TEXT_HEADER = struct.Struct('<HH')
+COUNT = struct.Struct('<H')
+MAX_COUNT = 0xFFFF
+MAX_ID = 0xFFFFFFFF
+
+LoggedAnswer = namedtuple('LoggedAnswer', ['question_id', 'answer_id', 'is_correct', 'text_answer'])
+
+# Columns of a decoded log: question ids (tuple), answer ids (tuple),
+# correctness bitmap (bytes) and text answers ({position: text})
+LogColumns = namedtuple('LogColumns', ['question_ids', 'answer_ids', 'correct_bitmap', 'texts'])
+
+
+def encode(answers):
+    """Pack ``LoggedAnswer`` tuples into a log; ``answer_id`` None means no selection"""
+    answers = sorted(answers, key=lambda answer: answer.question_id)
+    count = len(answers)
+    if count > MAX_COUNT:
+        raise ValueError(f'{count} answers do not fit in one log')
+    bits = 0
+    answer_ids = []
+    texts = []
+    for position, answer in enumerate(answers):
+        answer_id = NO_ANSWER if answer.answer_id is None else answer.answer_id
+        if not (0 < answer.question_id <= MAX_ID and 0 <= answer_id <= MAX_ID):
+            raise ValueError(f'Answer {answer_id} of question {answer.question_id} cannot be packed')
+        answer_ids.append(answer_id)
+        if answer.is_correct:
+            bits |= 1 << position
+        if answer.text_answer:
+            text = answer.text_answer.encode('utf-8')
+            if len(text) > MAX_COUNT:
+                raise ValueError(f'Text answer to question {answer.question_id} is too long to pack')
+            texts.append((position, text))
+
+    parts = [
+        HEADER.pack(LOG_VERSION, count),
+        struct.pack(f'<{count}I', *(answer.question_id for answer in answers)),
+        struct.pack(f'<{count}I', *answer_ids),
+        bits.to_bytes((count + 7) // 8, 'little'),
+        COUNT.pack(len(texts)),
+    ]
+    for position, text in texts:
+        parts.append(TEXT_HEADER.pack(position, len(text)))
+        parts.append(text)
+    return b''.join(parts)
+
+
+def decode_columns(log):
+    """Unpack a log into ``LogColumns``"""
+    log = bytes(log)
+    version, count = HEADER.unpack_from(log)
+    if version != LOG_VERSION:
+        raise ValueError(f'Unknown answer log version {version}')
+    offset = HEADER.size
+    question_ids = struct.unpack_from(f'<{count}I', log, offset)
+    offset += 4 * count
+    answer_ids = struct.unpack_from(f'<{count}I', log, offset)
+    offset += 4 * count
+    correct_bitmap = log[offset:offset + (count + 7) // 8]
+    offset += (count + 7) // 8
+
+    texts = {}
+    (text_count,) = COUNT.unpack_from(log, offset)
+    offset += COUNT.size
+    for _ in range(text_count):
+        position, length = TEXT_HEADER.unpack_from(log, offset)
+        offset += TEXT_HEADER.size
+        texts[position] = log[offset:offset + length].decode('utf-8')
+        offset += length
+    return LogColumns(question_ids, answer_ids, correct_bitmap, texts)
+
+
+def decode(log):
+    """Unpack a log into ``LoggedAnswer`` tuples, by question id"""
+    columns = decode_columns(log)
+    bits = int.from_bytes(columns.correct_bitmap, 'little')
+    return [
+        LoggedAnswer(
+            question_id,
+            None if answer_id == NO_ANSWER else answer_id,
+            bool(bits >> position & 1),
+            columns.texts.get(position, ''),
+        )
+        for position, (question_id, answer_id) in enumerate(zip(columns.question_ids, columns.answer_ids))
+    ]
+
+
+def archive_attempts(completed_before, chunk_size=CHUNK_SIZE):
+    """Pack the answers of attempts completed before ``completed_before``.
+
+    Yields the number of attempts archived per chunk. Attempts with an
+    answer that cannot be packed keep their rows.
+    """
+    attempts = QuizAttempt.objects.filter(
+        is_completed=True, completed_at__lt=completed_before, answer_log__isnull=True,
+    ).order_by('pk').values_list('pk', flat=True)
+    last = 0
+    while True:
+        attempt_ids = list(attempts.filter(pk__gt=last)[:chunk_size])
+        if not attempt_ids:
+            return
+        last = attempt_ids[-1]
+
+        with transaction.atomic():
+            rows = UserAnswer.objects.filter(attempt_id__in=attempt_ids).values_list(
+                'attempt_id', 'question_id', 'selected_answer_id', 'is_correct', 'text_answer',
+            )
+            by_attempt = {attempt_id: [] for attempt_id in attempt_ids}
+            for attempt_id, *row in rows:
+                by_attempt[attempt_id].append(row)
+
+            archived = []
+            for attempt_id, answers in by_attempt.items():
+                try:
+                    log = encode(LoggedAnswer(*answer) for answer in answers)
+                except ValueError:
+                    continue
+                archived.append(QuizAttempt(pk=attempt_id, answer_log=log))
+
+            QuizAttempt.objects.bulk_update(archived, ['answer_log'])
+            UserAnswer.objects.filter(attempt_id__in=[attempt.pk for attempt in archived]).delete()
+        yield len(archived)
+
+
+def attempt_answers(attempt):
+    """The answers of ``attempt`` as ``UserAnswer`` objects, decoded from its log once archived"""
+    if not attempt.answers_archived:
+        return list(
+            UserAnswer.objects.filter(attempt=attempt).select_related('question', 'selected_answer').order_by('id')
+        )
+
+    logged = decode(attempt.answer_log)
+    questions = Question.objects.in_bulk([answer.question_id for answer in logged])
+    choices = Answer.objects.in_bulk([answer.answer_id for answer in logged if answer.answer_id is not None])
+    answers = []
+    for answer in logged:
+        question = questions.get(answer.question_id)
+        selected = choices.get(answer.answer_id) if answer.answer_id is not None else None
+        if question is None or (answer.answer_id is not None and selected is None):
+            continue
+        answers.append(UserAnswer(
+            attempt=attempt,
+            question=question,
+            selected_answer=selected,
+            text_answer=answer.text_answer,
+            is_correct=answer.is_correct,
+        ))
+    answers.sort(key=lambda answer: (answer.question.order, answer.question.pk))
+    return answers
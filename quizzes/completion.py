@@ -0,0 +1,199 @@
+"""
+Completion of a quiz attempt.
+
+``complete_attempt`` replaces the chain of ``award_tokens``,
+``User.add_experience`` and profile saves the views used to run, each of
+which re-read and fully saved its row. Every delta (score, tokens after the
+earning rule and daily limit, experience, level, profile counters and
+streak) is worked out first and then applied in one transaction. The
+attempt row is locked and its answer counters read back before it is
+closed, which also guards against double completion. The user row is
+locked and read together with the profile, balances move with ``F()``,
+and the daily limit is charged by one conditional UPDATE: eight
+statements when tokens are awarded, the earning rule lookup included.
+
+Statistics, quiz boards, activity buckets, seasons and rankings are derived
+from that state, so ``record_completion_stats`` updates them after the
+commit instead of holding the user's lock. The statements executed by the
+completion itself are counted and returned, so callers and benchmarks can
+see what it costs.
+"""
+from collections import namedtuple
+from datetime import date
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Floor, Greatest
+from django.utils import timezone
+
+from accounts.models import User, UserProfile
+from leaderboards.activity import record_activity
+from leaderboards.ranking import QUIZ_METRICS, TOKEN_METRICS, schedule_user_update
+from leaderboards.seasons import credit_season_activity
+from rewards.models import DailyTokenLimit, EcoTokenTransaction, TokenEarningRule
+from .leaderboard import record_quiz_result
+from .models import QuizAttempt, QuizStats
+from .stats import record_quiz_completion, record_quiz_progress
+
+TOKEN_SOURCE = 'quiz_completion'
+
+# Same default as award_tokens
+DEFAULT_DAILY_TOKENS = 100
+
+# What a completion did; ``completed`` is False if the attempt was already closed
+CompletionResult = namedtuple('CompletionResult', [
+    'completed', 'tokens_awarded', 'experience_gained', 'level', 'leveled_up', 'statements',
+])
+
+
+class _StatementCounter:
+    """Execute wrapper counting the statements run on a connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def score_attempt(attempt, when=None):
+    """Fill in score, timing and rewards of ``attempt`` in memory; returns tokens earned"""
+    attempt.calculate_score()
+    attempt.completed_at = when or timezone.now()
+    if attempt.started_at:
+        attempt.time_taken_seconds = int((attempt.completed_at - attempt.started_at).total_seconds())
+
+    tokens = attempt.quiz.base_tokens_reward
+    if attempt.is_perfect_score():
+        tokens += attempt.quiz.perfect_score_bonus
+    tokens += attempt.get_time_bonus_tokens()
+
+    attempt.tokens_earned = tokens
+    attempt.experience_gained = tokens
+    return tokens
+
+
+def _token_award(user, amount):
+    """Tokens ``user`` receives for ``amount`` under the active earning rule (as in ``award_tokens``)"""
+    rule = TokenEarningRule.objects.filter(activity=TOKEN_SOURCE, is_active=True).first()
+    if rule is not None:
+        amount = min(amount, rule.calculate_tokens(user))
+    return amount
+
+
+def _charge_daily_limit(user_id, amount, today):
+    """Count ``amount`` against today's limit; False if it would exceed it"""
+    limits = DailyTokenLimit.objects.filter(user_id=user_id, date=today)
+    if limits.filter(tokens_earned_today__lte=F('max_daily_tokens') - amount).update(
+        tokens_earned_today=F('tokens_earned_today') + amount
+    ):
+        return True
+    # First award of the day, or the limit is reached
+    limit, created = DailyTokenLimit.objects.get_or_create(
+        user_id=user_id, date=today, defaults={'max_daily_tokens': DEFAULT_DAILY_TOKENS},
+    )
+    if not created or not limit.can_earn_tokens(amount):
+        return False
+    limits.update(tokens_earned_today=F('tokens_earned_today') + amount)
+    return True
+
+
+def complete_attempt(attempt, when=None):
+    """Close ``attempt`` and apply every reward and statistic in one transaction.
+
+    ``attempt`` is updated in place and needs its ``quiz`` loaded; its answer
+    counters are read from the database. Returns a ``CompletionResult``;
+    nothing is written if the attempt was already completed.
+    """
+    counter = _StatementCounter()
+    # Statistics and re-ranking run on commit, outside the counted statements
+    with transaction.atomic(), connection.execute_wrapper(counter):
+        # Lock the attempt so answers submitted meanwhile are either counted
+        # here or rejected as arriving after completion
+        counts = QuizAttempt.objects.select_for_update().filter(pk=attempt.pk, is_completed=False).values_list(
+            'answered_count', 'correct_answers',
+        ).first()
+        if counts is None:
+            return CompletionResult(False, 0, 0, None, False, counter.count)
+        attempt.answered_count, attempt.correct_answers = counts
+
+        tokens = score_attempt(attempt, when)
+        QuizAttempt.objects.filter(pk=attempt.pk).update(
+            is_completed=True,
+            completed_at=attempt.completed_at,
+            score=attempt.score,
+            time_taken_seconds=attempt.time_taken_seconds,
+            tokens_earned=attempt.tokens_earned,
+            experience_gained=attempt.experience_gained,
+        )
+        attempt.is_completed = True
+
+        # Serializes completions of one user; the profile comes with the same read
+        user = User.objects.select_for_update(of=('self',)).select_related('profile').get(pk=attempt.user_id)
+        try:
+            profile = user.profile
+        except UserProfile.DoesNotExist:
+            profile = UserProfile.objects.create(user=user)
+
+        awarded = _token_award(user, tokens) if tokens else 0
+        if awarded and not _charge_daily_limit(user.pk, awarded, date.today()):
+            awarded = 0
+
+        experience = attempt.experience_gained
+        new_level = max(user.level, (user.experience_points + experience) // 100 + 1)
+        User.objects.filter(pk=user.pk).update(
+            total_eco_tokens=F('total_eco_tokens') + awarded,
+            experience_points=F('experience_points') + experience,
+            # Same rule as User.add_experience: 100 XP per level, never going down
+            level=Greatest(F('level'), Floor((F('experience_points') + experience) / 100.0) + 1),
+        )
+        if awarded:
+            EcoTokenTransaction.objects.create(
+                user=user,
+                transaction_type='earned',
+                source=TOKEN_SOURCE,
+                amount=awarded,
+                description=f"Completed quiz: {attempt.quiz.title}",
+                balance_after=user.total_eco_tokens + awarded,
+                quiz_id=attempt.quiz_id,
+            )
+
+        profile.quizzes_completed += 1
+        profile.total_quiz_score += round(attempt.score)
+        profile.average_quiz_score = profile.total_quiz_score / profile.quizzes_completed
+        profile.update_streak(commit=False)
+        profile.save(update_fields=[
+            'quizzes_completed', 'total_quiz_score', 'average_quiz_score',
+            'streak_days', 'longest_streak', 'last_activity_date',
+        ])
+
+        # Re-ranking checks eligibility (e.g. a board's min_level) on this instance
+        leveled_up = new_level > user.level
+        user.level = new_level
+        user.experience_points += experience
+        user.total_eco_tokens += awarded
+        # A failure there is logged rather than raised from the committed completion
+        transaction.on_commit(lambda: record_completion_stats(attempt, user, awarded), robust=True)
+
+    return CompletionResult(True, awarded, experience, new_level, leveled_up, counter.count)
+
+
+def record_completion_stats(attempt, user, awarded):
+    """Fold a completed attempt into the read models, then re-rank its user.
+
+    Runs once the completion has committed, in a transaction of its own;
+    the rebuild commands repair the read models if it fails or never gets
+    to run.
+    """
+    with transaction.atomic():
+        record_quiz_completion(attempt)
+        record_quiz_progress(attempt)
+        QuizStats.add(attempt.quiz_id, attempts_completed=1, score_sum=attempt.score)
+        record_quiz_result(attempt)
+        record_activity(
+            user, attempt.completed_at,
+            quizzes_completed=1, quiz_score_total=attempt.score, tokens_earned=awarded,
+        )
+        if awarded:
+            credit_season_activity(user, TOKEN_SOURCE, awarded)
+        schedule_user_update(user, QUIZ_METRICS + TOKEN_METRICS)
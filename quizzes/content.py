@@ -0,0 +1,118 @@
+"""
+Compiled, immutable snapshots of quiz content.
+
+Serving and grading a quiz only needs its questions, answers, answer key and
+explanations, which rarely change. ``compiled_quiz`` builds them once per
+process into plain tuples and keeps them keyed by ``Quiz.content_version``,
+which is bumped whenever a question or answer is saved or deleted, cascades
+and queryset deletes included (see the receivers in models.py). The version
+comes with the quiz row the views load anyway, so in steady state a quiz is
+served and graded without content queries. Bulk writes that bypass
+``save()`` must bump the version themselves (see ``bump_content_version``).
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+from django.db.models import F
+
+from .models import Question, Quiz
+
+# Compiled quizzes kept per process
+CACHE_SIZE = 256
+
+CompiledAnswer = namedtuple('CompiledAnswer', ['id', 'text', 'is_correct', 'order'])
+CompiledQuestion = namedtuple('CompiledQuestion', [
+    'id', 'question_type', 'text', 'explanation', 'image_url', 'points', 'order', 'answers',
+])
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class CompiledQuiz:
+    """Questions of one quiz version with lookups for grading"""
+
+    __slots__ = ('quiz_id', 'version', 'questions', '_questions', '_answers', '_correct_text')
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.questions = tuple(questions)
+        self._questions = MappingProxyType({q.id: q for q in self.questions})
+        self._answers = MappingProxyType({
+            answer.id: (question.id, answer) for question in self.questions for answer in question.answers
+        })
+        self._correct_text = MappingProxyType({
+            question.id: next((a.text for a in question.answers if a.is_correct), None)
+            for question in self.questions
+        })
+
+    def __len__(self):
+        return len(self.questions)
+
+    def question(self, question_id):
+        """The question with this id, or None if it is not part of the quiz"""
+        try:
+            return self._questions.get(int(question_id))
+        except (TypeError, ValueError):
+            return None
+
+    def answer(self, question_id, answer_id):
+        """The answer with this id if it belongs to ``question_id``, else None"""
+        try:
+            found = self._answers.get(int(answer_id))
+        except (TypeError, ValueError):
+            return None
+        if found is None or found[0] != int(question_id):
+            return None
+        return found[1]
+
+    def correct_text(self, question_id):
+        """Text of the first correct answer, used to grade fill-in-the-blank questions"""
+        return self._correct_text.get(int(question_id))
+
+
+def compile_quiz(quiz_id, version):
+    """Read one quiz's content from the database (two queries)"""
+    questions = Question.objects.filter(quiz_id=quiz_id).prefetch_related('answers').order_by('order', 'pk')
+    return CompiledQuiz(quiz_id, version, [
+        CompiledQuestion(
+            id=question.pk,
+            question_type=question.question_type,
+            text=question.text,
+            explanation=question.explanation,
+            image_url=question.image.url if question.image else '',
+            points=question.points,
+            order=question.order,
+            answers=tuple(
+                CompiledAnswer(answer.pk, answer.text, answer.is_correct, answer.order)
+                for answer in sorted(question.answers.all(), key=lambda a: (a.order, a.pk))
+            ),
+        )
+        for question in questions
+    ])
+
+
+def compiled_quiz(quiz):
+    """The compiled content of ``quiz`` at its current ``content_version``"""
+    with _cache_lock:
+        cached = _cache.get(quiz.pk)
+        if cached is not None and cached.version == quiz.content_version:
+            _cache.move_to_end(quiz.pk)
+            return cached
+
+    compiled = compile_quiz(quiz.pk, quiz.content_version)
+    with _cache_lock:
+        current = _cache.get(quiz.pk)
+        # Never replace a newer version compiled by a concurrent request
+        if current is None or current.version <= compiled.version:
+            _cache[quiz.pk] = compiled
+            _cache.move_to_end(quiz.pk)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def bump_content_version(quiz_ids):
+    """Invalidate compiled content after bulk changes that skip ``save()``"""
+    Quiz.objects.filter(pk__in=quiz_ids).update(content_version=F('content_version') + 1)
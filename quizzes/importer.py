@@ -0,0 +1,285 @@
+"""
+Streaming import of quiz fixtures.
+
+Reads files in Django's fixture format (a JSON list of
+``{"model": ..., "pk": ..., "fields": {...}}`` records, as in
+``sample_quiz_data.json``) one record at a time, so memory stays flat however
+large the file is. Records are buffered per model and written in batches:
+
+- a batch is validated as a whole: field values with ``clean_fields``, and
+  relations and unique fields with one query each for rows not seen earlier
+  in the file;
+- rows are upserted by primary key with one ``bulk_create`` per batch, so
+  re-running an import updates rows in place instead of duplicating them;
+- parents are flushed before their children, whatever the batch boundaries.
+
+Bulk writes skip ``save()``, so the content version and ``QuizStats`` of the
+touched quizzes are refreshed once at the end.
+"""
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.color import no_style
+from django.db import connection
+
+from .content import bump_content_version
+from .models import Answer, Question, Quiz, QuizCategory
+from .stats import rebuild_quiz_totals
+
+BATCH_SIZE = 2000
+READ_SIZE = 1 << 16
+
+# Validation errors listed per failed batch
+MAX_ERRORS = 20
+
+# In flush order: every model after the model it points to
+MODELS = {
+    'quizzes.quizcategory': QuizCategory,
+    'quizzes.quiz': Quiz,
+    'quizzes.question': Question,
+    'quizzes.answer': Answer,
+}
+PARENT_FIELDS = {
+    Quiz: 'category',
+    Question: 'quiz',
+    Answer: 'question',
+}
+
+# Kept as they are on rows that already exist
+PRESERVED_FIELDS = ('created_at', 'content_version')
+
+
+class InvalidImport(ValueError):
+    """The file is malformed or a batch failed validation"""
+
+
+def iter_records(handle, read_size=READ_SIZE):
+    """Yield the items of the top-level JSON list in ``handle`` one at a time"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        while pos < len(buffer) and (buffer[pos] in ' \t\r\n' or (started and buffer[pos] == ',')):
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise InvalidImport('Expected a JSON list of fixture records')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as exc:
+                # Most likely an item cut off at the end of the buffer
+                if eof:
+                    raise InvalidImport(f'Invalid JSON: {exc}') from exc
+            else:
+                yield item
+                pos = end
+                continue
+
+        if eof:
+            raise InvalidImport('Unexpected end of file')
+        chunk = handle.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def _update_fields(model):
+    return [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in PRESERVED_FIELDS
+    ]
+
+
+class QuizImporter:
+    """Validates and upserts fixture records in batches; see ``import_quizzes``"""
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.buffers = {model: {} for model in MODELS.values()}
+        self.prerequisites = {}
+        # Primary keys known to exist, per model; question ids map to their quiz
+        self.known = {QuizCategory: set(), Quiz: set()}
+        self.question_quiz = {}
+        self.touched_quizzes = set()
+
+    def add(self, record, position):
+        """Buffer one fixture record; yields ``(label, rows)`` for each batch written"""
+        try:
+            label = record['model'].lower()
+            pk = int(record['pk'])
+            fields = record['fields']
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise InvalidImport(f'Record {position}: expected "model", an integer "pk" and "fields"')
+
+        model = MODELS.get(label)
+        if model is None:
+            raise InvalidImport(f'Record {position}: unsupported model "{record["model"]}"')
+
+        obj = model(pk=pk)
+        for name, value in fields.items():
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise InvalidImport(f'{label} {pk}: unknown field "{name}"')
+            if field.many_to_many:
+                self.prerequisites[pk] = value
+            elif field.is_relation:
+                setattr(obj, field.attname, value)
+            else:
+                try:
+                    setattr(obj, field.attname, field.to_python(value))
+                except ValidationError as exc:
+                    raise InvalidImport(f'{label} {pk}: {name}: {"; ".join(exc.messages)}')
+
+        # A later record for the same pk replaces the earlier one
+        buffer = self.buffers[model]
+        buffer[pk] = obj
+        if len(buffer) >= self.batch_size:
+            yield from self.flush(model)
+
+    def flush(self, upto=None):
+        """Write buffered parents of ``upto`` and ``upto`` itself (everything when None)"""
+        for model in MODELS.values():
+            if self.buffers[model]:
+                rows = list(self.buffers[model].values())
+                self.buffers[model] = {}
+                self._validate(model, rows)
+                self._write(model, rows)
+                yield model._meta.label_lower, len(rows)
+            if model is upto:
+                break
+
+    def finish(self):
+        """Write what is left and refresh derived data; yields like ``add``"""
+        yield from self.flush()
+
+        if self.prerequisites:
+            self._write_prerequisites()
+
+        touched = sorted(self.touched_quizzes)
+        if touched:
+            bump_content_version(touched)
+            rebuild_quiz_totals(touched)
+
+        # Rows were inserted with explicit ids
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(MODELS.values())):
+                cursor.execute(sql)
+
+    def _validate(self, model, rows):
+        label = model._meta.label_lower
+        parent_field = PARENT_FIELDS.get(model)
+        exclude = [parent_field] if parent_field else []
+        errors = []
+
+        for obj in rows:
+            try:
+                obj.clean_fields(exclude=exclude)
+            except ValidationError as exc:
+                for name, messages in exc.message_dict.items():
+                    errors.append(f'{label} {obj.pk}: {name}: {"; ".join(messages)}')
+
+        if parent_field:
+            errors.extend(self._check_parents(model, parent_field, rows))
+        errors.extend(self._check_unique(model, rows))
+
+        if errors:
+            more = f'\n... and {len(errors) - MAX_ERRORS} more' if len(errors) > MAX_ERRORS else ''
+            raise InvalidImport('\n'.join(errors[:MAX_ERRORS]) + more)
+
+    def _check_parents(self, model, parent_field, rows):
+        label = model._meta.label_lower
+        field = model._meta.get_field(parent_field)
+        parent = field.related_model
+        known = self.question_quiz if parent is Question else self.known[parent]
+
+        values = {getattr(obj, field.attname) for obj in rows}
+        missing = {value for value in values if value is not None and value not in known}
+        if missing:
+            found = parent.objects.filter(pk__in=missing)
+            if parent is Question:
+                self.question_quiz.update(found.values_list('pk', 'quiz_id'))
+            else:
+                known.update(found.values_list('pk', flat=True))
+
+        errors = []
+        for obj in rows:
+            value = getattr(obj, field.attname)
+            if value is None:
+                errors.append(f'{label} {obj.pk}: {parent_field}: This field cannot be null.')
+            elif value not in known:
+                errors.append(f'{label} {obj.pk}: {parent_field}: {parent._meta.label_lower} {value} does not exist')
+        return errors
+
+    def _check_unique(self, model, rows):
+        label = model._meta.label_lower
+        errors = []
+        for field in model._meta.concrete_fields:
+            if not field.unique or field.primary_key:
+                continue
+            owners = {}
+            for obj in rows:
+                value = getattr(obj, field.attname)
+                if owners.setdefault(value, obj.pk) != obj.pk:
+                    errors.append(f'{label} {obj.pk}: {field.name}: "{value}" is also used by {owners[value]}')
+            taken = model.objects.filter(**{f'{field.attname}__in': list(owners)}).values_list(field.attname, 'pk')
+            for value, pk in taken:
+                if pk != owners[value]:
+                    errors.append(f'{label} {owners[value]}: {field.name}: "{value}" already exists as {pk}')
+        return errors
+
+    def _write(self, model, rows):
+        model.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=_update_fields(model),
+        )
+
+        if model is QuizCategory or model is Quiz:
+            self.known[model].update(obj.pk for obj in rows)
+        if model is Quiz:
+            self.touched_quizzes.update(obj.pk for obj in rows)
+        elif model is Question:
+            self.question_quiz.update((obj.pk, obj.quiz_id) for obj in rows)
+            self.touched_quizzes.update(obj.quiz_id for obj in rows)
+        elif model is Answer:
+            self.touched_quizzes.update(self.question_quiz[obj.question_id] for obj in rows)
+
+    def _write_prerequisites(self):
+        through = Quiz.prerequisite_quizzes.through
+        rows = []
+        for quiz_id, prerequisite_ids in self.prerequisites.items():
+            missing = set(prerequisite_ids) - self.known[Quiz]
+            if missing:
+                self.known[Quiz].update(Quiz.objects.filter(pk__in=missing).values_list('pk', flat=True))
+                missing -= self.known[Quiz]
+            if missing:
+                raise InvalidImport(
+                    f'quizzes.quiz {quiz_id}: prerequisite_quizzes: quizzes {sorted(missing)} do not exist'
+                )
+            rows.extend(through(from_quiz_id=quiz_id, to_quiz_id=pk) for pk in prerequisite_ids)
+
+        through.objects.filter(from_quiz_id__in=self.prerequisites).delete()
+        through.objects.bulk_create(rows, batch_size=self.batch_size)
+
+
+def import_quizzes(handle, batch_size=BATCH_SIZE):
+    """Import the fixture records read from ``handle``.
+
+    Yields ``(label, rows)`` for each batch written. Run it inside a
+    transaction so a file that fails validation half way leaves nothing
+    behind.
+    """
+    importer = QuizImporter(batch_size)
+    for position, record in enumerate(iter_records(handle), start=1):
+        yield from importer.add(record, position)
+    yield from importer.finish()
@@ -0,0 +1,144 @@
+"""
+Incremental maintenance of ``QuizLeaderboard``.
+
+Each quiz has one board per period (daily, weekly, monthly and all time)
+holding every player's best result, ordered by score and then by time.
+``record_quiz_result`` folds a finished attempt into those rows when the quiz
+is completed: when a player's best improves, only the rows they overtake
+move down a place, so the cost depends on the players of that quiz rather
+than on its attempt history; an attempt that improves nothing costs a
+single UPDATE. ``rebuild_quiz_leaderboard`` recomputes a board
+from ``QuizAttempt`` for backfills and repairs.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from leaderboards.periods import period_bounds
+from .models import Quiz, QuizAttempt, QuizLeaderboard
+
+QUIZ_PERIODS = [period for period, _ in QuizLeaderboard.LEADERBOARD_TYPES]
+
+
+def _beats(score, seconds):
+    """Rows ranked strictly below a result of ``score`` in ``seconds``"""
+    return Q(best_score__lt=score) | Q(best_score=score, best_time_seconds__gt=seconds)
+
+
+def _ranks_above(score, seconds):
+    """Rows ranked strictly above a result of ``score`` in ``seconds``"""
+    return Q(best_score__gt=score) | Q(best_score=score, best_time_seconds__lt=seconds)
+
+
+def board_rows(quiz, period, period_start):
+    return QuizLeaderboard.objects.filter(
+        quiz=quiz, leaderboard_type=period, period_start=period_start,
+    )
+
+
+def record_quiz_result(attempt):
+    """Add a completed attempt to the quiz's boards of every period.
+
+    Run it inside a transaction. An attempt that improves none of the
+    player's rows only bumps their ``total_attempts``, in one UPDATE; rows
+    are loaded and the quiz locked only when a best result or a new row
+    moves ranks.
+    """
+    score, seconds = attempt.score, attempt.time_taken_seconds
+    periods = {period: period_bounds(period, attempt.completed_at) for period in QUIZ_PERIODS}
+    boards = Q()
+    for period, (period_start, _) in periods.items():
+        boards |= Q(leaderboard_type=period, period_start=period_start)
+    player_rows = QuizLeaderboard.objects.filter(boards, quiz_id=attempt.quiz_id, user_id=attempt.user_id)
+
+    # ``now`` marks the rows counted here; update() skips auto_now
+    now = timezone.now()
+    counted = player_rows.exclude(_beats(score, seconds)).update(
+        total_attempts=F('total_attempts') + 1, updated_at=now,
+    )
+    if counted == len(periods):
+        return
+
+    # Rank shifts on a quiz's boards must not interleave
+    Quiz.objects.select_for_update().filter(pk=attempt.quiz_id).exists()
+    entries = {entry.leaderboard_type: entry for entry in player_rows}
+
+    for period, (period_start, period_end) in periods.items():
+        rows = board_rows(attempt.quiz_id, period, period_start)
+        entry = entries.get(period)
+
+        if entry is not None:
+            improved = (score, -seconds) > (entry.best_score, -entry.best_time_seconds)
+            if not improved:
+                if entry.updated_at != now:
+                    # Improved by another attempt of the player since the UPDATE above
+                    rows.filter(pk=entry.pk).update(total_attempts=F('total_attempts') + 1, updated_at=now)
+                continue
+            entry.total_attempts += 1
+            # Only rows between the old and new result are overtaken
+            overtaken = rows.filter(_beats(score, seconds)).exclude(
+                _beats(entry.best_score, entry.best_time_seconds)
+            ).exclude(pk=entry.pk)
+        else:
+            entry = QuizLeaderboard(
+                quiz_id=attempt.quiz_id,
+                user_id=attempt.user_id,
+                leaderboard_type=period,
+                period_start=period_start,
+                period_end=period_end,
+            )
+            overtaken = rows.filter(_beats(score, seconds))
+
+        overtaken.update(rank=F('rank') + 1)
+        entry.best_score = score
+        entry.best_time_seconds = seconds
+        entry.rank = rows.filter(_ranks_above(score, seconds)).count() + 1
+        entry.save()
+
+
+def rebuild_quiz_leaderboard(quiz, period, when=None):
+    """Recompute one board of ``quiz`` from its attempts; returns rows written"""
+    period_start, period_end = period_bounds(period, when)
+    attempts = QuizAttempt.objects.filter(
+        quiz=quiz, is_completed=True,
+        completed_at__gte=period_start, completed_at__lt=period_end,
+    ).values_list('user_id', 'score', 'time_taken_seconds')
+
+    best = {}
+    for user_id, score, seconds in attempts.iterator(chunk_size=5000):
+        current = best.get(user_id)
+        if current is None:
+            best[user_id] = [score, seconds, 1]
+        else:
+            current[2] += 1
+            if (score, -seconds) > (current[0], -current[1]):
+                current[0], current[1] = score, seconds
+
+    ordered = sorted(best.items(), key=lambda item: (-item[1][0], item[1][1]))
+    entries = []
+    rank = 0
+    previous = None
+    for position, (user_id, (score, seconds, total)) in enumerate(ordered, start=1):
+        if (score, seconds) != previous:
+            rank, previous = position, (score, seconds)
+        entries.append(QuizLeaderboard(
+            quiz=quiz,
+            user_id=user_id,
+            leaderboard_type=period,
+            best_score=score,
+            best_time_seconds=seconds,
+            total_attempts=total,
+            rank=rank,
+            period_start=period_start,
+            period_end=period_end,
+        ))
+
+    with transaction.atomic():
+        board_rows(quiz, period, period_start).exclude(user_id__in=best).delete()
+        QuizLeaderboard.objects.bulk_create(
+            entries, batch_size=1000, update_conflicts=True,
+            unique_fields=['quiz', 'user', 'leaderboard_type', 'period_start'],
+            update_fields=['best_score', 'best_time_seconds', 'total_attempts', 'rank',
+                           'period_end', 'updated_at'],
+        )
+    return len(entries)
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from quizzes.analysis import CHUNK_SIZE, LOAD_CHUNK_SIZE, analyze_questions
+
+
+class Command(BaseCommand):
+    help = 'Compute per-question difficulty, discrimination and distractor frequencies from completed attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            help='Only analyze the quiz with this id (repeatable)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Question stats written per batch',
+        )
+        parser.add_argument(
+            '--load-chunk-size',
+            type=int,
+            default=LOAD_CHUNK_SIZE,
+            help='Answers fetched per query',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = analyze_questions(options['quiz'], options['chunk_size'], options['load_chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Analyzed {count} questions in {time.monotonic() - started:.2f}s'
+        ))
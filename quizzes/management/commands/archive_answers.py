@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from quizzes.answer_log import CHUNK_SIZE, archive_attempts
+
+
+class Command(BaseCommand):
+    help = 'Pack the answers of completed quiz attempts into compact logs and delete their answer rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=30,
+            help='Only archive attempts completed at least this many days ago',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Attempts archived per transaction',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        total = 0
+        for archived in archive_attempts(cutoff, options['chunk_size']):
+            total += archived
+            self.stdout.write(f'{total} attempts archived')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived the answers of {total} attempts'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from quizzes.stats import CHUNK_SIZE, backfill_quiz_progress, backfill_quiz_stats, rebuild_quiz_totals
+
+
+class Command(BaseCommand):
+    help = 'Build per-user quiz statistics, per-quiz progress and quiz totals from existing quiz attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Users aggregated and written per batch',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for rows in backfill_quiz_stats(options['chunk_size']):
+            total += rows
+            self.stdout.write(f'{total} users processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled quiz stats for {total} users'))
+
+        total = 0
+        for rows in backfill_quiz_progress(options['chunk_size']):
+            total += rows
+            self.stdout.write(f'{total} users processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled quiz progress for {total} users'))
+
+        quizzes = rebuild_quiz_totals()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt totals of {quizzes} quizzes'))
@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from quizzes.importer import BATCH_SIZE, InvalidImport, import_quizzes
+
+
+class Command(BaseCommand):
+    help = 'Import quiz categories, quizzes, questions and answers from JSON fixture files, updating existing rows by id'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            help='Fixture files in the format of sample_quiz_data.json',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Records validated and written per batch',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the files and roll back instead of committing',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        totals = {}
+        try:
+            with transaction.atomic():
+                for path in options['paths']:
+                    with open(path, encoding='utf-8') as handle:
+                        for label, rows in import_quizzes(handle, options['batch_size']):
+                            totals[label] = totals.get(label, 0) + rows
+                            self.stdout.write(f'{path}: {totals[label]} {label} rows')
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except OSError as exc:
+            raise CommandError(f'Cannot read {exc.filename}: {exc.strerror}')
+        except InvalidImport as exc:
+            raise CommandError(f'Import failed, nothing was saved:\n{exc}')
+
+        summary = ', '.join(f'{rows} {label}' for label, rows in totals.items()) or 'nothing'
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {summary} in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from quizzes.leaderboard import QUIZ_PERIODS, rebuild_quiz_leaderboard
+from quizzes.models import Quiz
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the current period of every quiz leaderboard from quiz attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--quiz',
+            type=int,
+            action='append',
+            help='Only rebuild the quiz with this id (repeatable)',
+        )
+        parser.add_argument(
+            '--period',
+            choices=QUIZ_PERIODS,
+            action='append',
+            help='Only rebuild this period (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        quizzes = Quiz.objects.order_by('pk')
+        if options['quiz']:
+            quizzes = quizzes.filter(id__in=options['quiz'])
+        periods = options['period'] or QUIZ_PERIODS
+
+        for quiz in quizzes:
+            begin = time.monotonic()
+            rows = sum(rebuild_quiz_leaderboard(quiz, period) for period in periods)
+            self.stdout.write(f'{quiz.title}: {rows} entries in {time.monotonic() - begin:.2f}s')
+
+        self.stdout.write(self.style.SUCCESS('Quiz leaderboards rebuilt'))
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quizzes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserQuizStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quizzes_completed', models.PositiveIntegerField(default=0)),
+                ('total_score', models.FloatField(default=0.0)),
+                ('average_score', models.FloatField(default=0.0)),
+                ('best_score', models.FloatField(default=0.0)),
+                ('perfect_scores', models.PositiveIntegerField(default=0)),
+                ('week_start', models.DateTimeField(blank=True, null=True)),
+                ('weekly_completed', models.PositiveIntegerField(default=0)),
+                ('last_completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User quiz stats',
+                'indexes': [models.Index(fields=['-average_score'], name='quizzes_use_average_a91898_idx'), models.Index(fields=['week_start', '-weekly_completed'], name='quizzes_use_week_st_c69a0d_idx')],
+            },
+        ),
+    ]
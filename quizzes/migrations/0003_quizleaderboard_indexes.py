@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0002_userquizstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quizleaderboard',
+            index=models.Index(fields=['quiz', 'leaderboard_type', 'period_start', 'rank'], name='quizzes_qui_quiz_id_76ce12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizleaderboard',
+            index=models.Index(fields=['quiz', 'leaderboard_type', 'period_start', '-best_score', 'best_time_seconds'], name='quizzes_qui_quiz_id_d4ec87_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_answered_count(apps, schema_editor):
+    QuizAttempt = apps.get_model('quizzes', 'QuizAttempt')
+    UserAnswer = apps.get_model('quizzes', 'UserAnswer')
+    answered = UserAnswer.objects.filter(attempt=OuterRef('pk')).order_by().values('attempt').annotate(
+        total=Count('pk')
+    ).values('total')
+    QuizAttempt.objects.update(answered_count=Coalesce(Subquery(answered), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0004_quiz_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='answered_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_answered_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quizzes', '0005_quizattempt_answered_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserQuizProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts_completed', models.PositiveIntegerField(default=0)),
+                ('best_score', models.FloatField(default=0.0)),
+                ('best_time_seconds', models.PositiveIntegerField(default=0)),
+                ('last_completed_at', models.DateTimeField(blank=True, null=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_progress', to='quizzes.quiz')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User quiz progress',
+                'unique_together': {('user', 'quiz')},
+            },
+        ),
+    ]
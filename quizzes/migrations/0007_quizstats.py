@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:54
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def backfill_quiz_stats(apps, schema_editor):
+    Quiz = apps.get_model('quizzes', 'Quiz')
+    Question = apps.get_model('quizzes', 'Question')
+    QuizAttempt = apps.get_model('quizzes', 'QuizAttempt')
+    QuizStats = apps.get_model('quizzes', 'QuizStats')
+
+    questions = dict(
+        Question.objects.order_by().values('quiz_id').annotate(total=Count('pk')).values_list('quiz_id', 'total')
+    )
+    attempts = {
+        row['quiz_id']: row
+        for row in QuizAttempt.objects.order_by().values('quiz_id').annotate(
+            started=Count('pk'),
+            completed=Count('pk', filter=Q(is_completed=True)),
+            score_sum=Sum('score', filter=Q(is_completed=True)),
+        )
+    }
+    QuizStats.objects.bulk_create([
+        QuizStats(
+            quiz_id=quiz_id,
+            question_count=questions.get(quiz_id, 0),
+            attempts_started=attempts.get(quiz_id, {}).get('started', 0),
+            attempts_completed=attempts.get(quiz_id, {}).get('completed', 0),
+            score_sum=attempts.get(quiz_id, {}).get('score_sum') or 0.0,
+        )
+        for quiz_id in Quiz.objects.values_list('pk', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0006_userquizprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_count', models.PositiveIntegerField(default=0)),
+                ('attempts_started', models.PositiveIntegerField(default=0)),
+                ('attempts_completed', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='quizzes.quiz')),
+            ],
+            options={
+                'verbose_name_plural': 'Quiz stats',
+            },
+        ),
+        migrations.RunPython(backfill_quiz_stats, migrations.RunPython.noop),
+    ]
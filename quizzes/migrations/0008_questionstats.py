@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0007_quizstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('responses', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('p_value', models.FloatField(blank=True, null=True)),
+                ('discrimination', models.FloatField(blank=True, null=True)),
+                ('answer_counts', models.JSONField(blank=True, default=dict)),
+                ('analyzed_at', models.DateTimeField(auto_now=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='quizzes.question')),
+            ],
+            options={
+                'verbose_name_plural': 'Question stats',
+                'indexes': [models.Index(fields=['p_value'], name='quizzes_que_p_value_b526ee_idx'), models.Index(fields=['discrimination'], name='quizzes_que_discrim_dadce4_idx')],
+            },
+        ),
+    ]
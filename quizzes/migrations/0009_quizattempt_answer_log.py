@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0008_questionstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='answer_log',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
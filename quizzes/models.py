@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 import json
 
 User = get_user_model()
@@ -53,6 +56,9 @@ class Quiz(models.Model):
     randomize_questions = models.BooleanField(default=True)
     show_correct_answers = models.BooleanField(default=True)
     
+    # Bumped whenever a question or answer changes; keys the compiled content cache
+    content_version = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -62,21 +68,20 @@ class Quiz(models.Model):
     def __str__(self):
         return f"{self.title} ({self.get_difficulty_display()})"
     
+    def _stats(self):
+        try:
+            return self.stats
+        except QuizStats.DoesNotExist:
+            return QuizStats(quiz=self)
+    
     def get_questions_count(self):
-        return self.questions.count()
+        return self._stats().question_count
     
     def get_average_score(self):
-        attempts = QuizAttempt.objects.filter(quiz=self, is_completed=True)
-        if attempts.exists():
-            return attempts.aggregate(models.Avg('score'))['score__avg']
-        return 0
+        return self._stats().average_score
     
     def get_completion_rate(self):
-        total_attempts = QuizAttempt.objects.filter(quiz=self).count()
-        completed_attempts = QuizAttempt.objects.filter(quiz=self, is_completed=True).count()
-        if total_attempts > 0:
-            return (completed_attempts / total_attempts) * 100
-        return 0
+        return self._stats().completion_rate
 
 class Question(models.Model):
     """Quiz questions with multiple choice answers"""
@@ -107,6 +112,13 @@ class Question(models.Model):
     def __str__(self):
         return f"{self.quiz.title} - Q{self.order}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the content receivers notice a question moved to another quiz
+        instance._loaded_quiz_id = instance.__dict__.get('quiz_id')
+        return instance
+    
     def get_correct_answer(self):
         return self.answers.filter(is_correct=True).first()
 
@@ -123,6 +135,12 @@ class Answer(models.Model):
     
     def __str__(self):
         return f"{self.question} - {self.text[:50]}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_question_id = instance.__dict__.get('question_id')
+        return instance
 
 class QuizAttempt(models.Model):
     """Track user quiz attempts and scores"""
@@ -139,6 +157,7 @@ class QuizAttempt(models.Model):
     score = models.FloatField(default=0.0, validators=[MinValueValidator(0.0), MaxValueValidator(100.0)])
     total_questions = models.PositiveIntegerField(default=0)
     correct_answers = models.PositiveIntegerField(default=0)
+    answered_count = models.PositiveIntegerField(default=0)  # UserAnswer rows, kept by submit_answer
     
     # Gamification
     tokens_earned = models.PositiveIntegerField(default=0)
@@ -147,6 +166,7 @@ class QuizAttempt(models.Model):
     
     # Data
     answers_data = models.JSONField(default=dict)  # Store user's answers
+    answer_log = models.BinaryField(null=True, blank=True)  # Packed answers once archived, see answer_log.py
     
     class Meta:
         ordering = ['-started_at']
@@ -162,6 +182,10 @@ class QuizAttempt(models.Model):
             self.score = 0
         return self.score
     
+    @property
+    def answers_archived(self):
+        return self.answer_log is not None
+    
     def is_perfect_score(self):
         return self.score == 100.0
     
@@ -177,6 +201,35 @@ class QuizAttempt(models.Model):
             return 2
         return 0
 
+class UserQuizStats(models.Model):
+    """Per-user quiz statistics, updated as each quiz is completed"""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='quiz_stats')
+    
+    # All-time totals
+    quizzes_completed = models.PositiveIntegerField(default=0)
+    total_score = models.FloatField(default=0.0)
+    average_score = models.FloatField(default=0.0)
+    best_score = models.FloatField(default=0.0)
+    perfect_scores = models.PositiveIntegerField(default=0)
+    
+    # Completions in the week starting at week_start
+    week_start = models.DateTimeField(null=True, blank=True)
+    weekly_completed = models.PositiveIntegerField(default=0)
+    
+    last_completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'User quiz stats'
+        indexes = [
+            models.Index(fields=['-average_score']),
+            models.Index(fields=['week_start', '-weekly_completed']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.quizzes_completed} quizzes ({self.average_score:.1f}%)"
+
 class UserAnswer(models.Model):
     """Individual answers given by users"""
     
@@ -193,6 +246,100 @@ class UserAnswer(models.Model):
     def __str__(self):
         return f"{self.attempt.user.username} - {self.question}"
 
+class UserQuizProgress(models.Model):
+    """A user's completed attempts and best result on one quiz"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_progress')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='user_progress')
+    
+    attempts_completed = models.PositiveIntegerField(default=0)
+    best_score = models.FloatField(default=0.0)
+    best_time_seconds = models.PositiveIntegerField(default=0)  # Time of the best-scoring attempt
+    last_completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = 'User quiz progress'
+        unique_together = ['user', 'quiz']
+    
+    @property
+    def completed(self):
+        return self.attempts_completed > 0
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.quiz.title} ({self.best_score}%)"
+
+class QuizStats(models.Model):
+    """Running totals of one quiz, kept up to date as questions and attempts change"""
+    
+    quiz = models.OneToOneField(Quiz, on_delete=models.CASCADE, related_name='stats')
+    
+    question_count = models.PositiveIntegerField(default=0)
+    attempts_started = models.PositiveIntegerField(default=0)
+    attempts_completed = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0.0)  # Of completed attempts
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Quiz stats'
+    
+    def __str__(self):
+        return f"{self.quiz.title} - {self.attempts_completed}/{self.attempts_started} completed"
+    
+    @property
+    def average_score(self):
+        if self.attempts_completed:
+            return self.score_sum / self.attempts_completed
+        return 0
+    
+    @property
+    def completion_rate(self):
+        if self.attempts_started:
+            return (self.attempts_completed / self.attempts_started) * 100
+        return 0
+    
+    @classmethod
+    def add(cls, quiz_id, **deltas):
+        """Apply counter deltas (e.g. ``attempts_started=1``) to a quiz's row, creating it on first use"""
+        updates = {field: models.F(field) + value for field, value in deltas.items()}
+        updates['updated_at'] = timezone.now()
+        rows = cls.objects.filter(quiz_id=quiz_id)
+        if rows.update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(quiz_id=quiz_id, **{field: max(value, 0) for field, value in deltas.items()})
+        except IntegrityError:
+            # Another request created the row first
+            rows.update(**updates)
+
+class QuestionStats(models.Model):
+    """Item analysis of one question, refreshed by ``manage.py analyze_questions``"""
+    
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='stats')
+    
+    responses = models.PositiveIntegerField(default=0)  # Answers in completed attempts
+    correct = models.PositiveIntegerField(default=0)
+    # Share answered correctly; low values mark hard questions
+    p_value = models.FloatField(null=True, blank=True)
+    # Correct share among the top 27% of attempts minus the bottom 27%; near
+    # zero or negative means the question does not separate strong from weak
+    discrimination = models.FloatField(null=True, blank=True)
+    # {answer_id: times chosen}, showing which distractors draw answers
+    answer_counts = models.JSONField(default=dict, blank=True)
+    
+    analyzed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Question stats'
+        indexes = [
+            models.Index(fields=['p_value']),
+            models.Index(fields=['discrimination']),
+        ]
+    
+    def __str__(self):
+        return f"{self.question} (p={self.p_value}, D={self.discrimination})"
+
 class QuizLeaderboard(models.Model):
     """Leaderboard entries for quizzes"""
     
@@ -219,6 +366,46 @@ class QuizLeaderboard(models.Model):
     class Meta:
         unique_together = ['quiz', 'user', 'leaderboard_type', 'period_start']
         ordering = ['quiz', 'leaderboard_type', 'rank']
+        indexes = [
+            models.Index(fields=['quiz', 'leaderboard_type', 'period_start', 'rank']),
+            models.Index(fields=['quiz', 'leaderboard_type', 'period_start', '-best_score', 'best_time_seconds']),
+        ]
     
     def __str__(self):
         return f"{self.quiz.title} - {self.user.username} (#{self.rank})"
+
+
+# Compiled quiz content (see content.py) is keyed by ``Quiz.content_version``
+# and ``QuizStats.question_count`` counts questions. Receivers rather than
+# save()/delete() overrides, so queryset deletes and cascades (admin bulk
+# delete, deleting a quiz or question) keep both up to date as well.
+
+def _bump_content_version(**filters):
+    Quiz.objects.filter(**filters).update(content_version=models.F('content_version') + 1)
+
+def _remove_question(quiz_id):
+    # Never creates the row: during a quiz cascade it may already be gone
+    QuizStats.objects.filter(quiz_id=quiz_id, question_count__gt=0).update(
+        question_count=models.F('question_count') - 1, updated_at=timezone.now()
+    )
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, signal, created=False, **kwargs):
+    previous = getattr(instance, '_loaded_quiz_id', None)
+    _bump_content_version(pk__in={instance.quiz_id, previous} - {None})
+
+    if signal is post_delete:
+        _remove_question(instance.quiz_id)
+    elif created or (previous is not None and previous != instance.quiz_id):
+        if not created:
+            _remove_question(previous)
+        QuizStats.add(instance.quiz_id, question_count=1)
+    instance._loaded_quiz_id = instance.quiz_id
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def answer_changed(sender, instance, **kwargs):
+    question_ids = {instance.question_id, getattr(instance, '_loaded_question_id', None)} - {None}
+    _bump_content_version(questions__in=question_ids)
+    instance._loaded_question_id = instance.question_id
@@ -0,0 +1,234 @@
+"""
+Maintenance of the ``UserQuizStats`` and ``UserQuizProgress`` read models.
+
+``record_quiz_completion`` folds one finished attempt into the user's row,
+so pages listing top quiz performers read a handful of indexed rows instead
+of aggregating every attempt. ``record_quiz_progress`` does the same for
+the user's row of that quiz, which the quiz list loads in one query.
+``backfill_quiz_stats`` and ``backfill_quiz_progress`` rebuild the rows from
+``QuizAttempt`` history, and ``rebuild_quiz_totals`` recomputes the per-quiz
+``QuizStats`` counters that questions and attempts otherwise keep current.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case, Count, DateTimeField, F, FloatField, Max, PositiveIntegerField, Q, Sum, Value, When,
+)
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from leaderboards.periods import period_bounds
+from .models import Question, Quiz, QuizAttempt, QuizStats, UserQuizProgress, UserQuizStats
+
+CHUNK_SIZE = 1000
+
+
+def current_week_start(when=None):
+    week_start, _ = period_bounds('weekly', when)
+    return week_start
+
+
+def record_quiz_completion(attempt):
+    """Add a completed attempt to its user's ``UserQuizStats`` in one statement"""
+    completed_at = attempt.completed_at
+    week_start = current_week_start(completed_at)
+    score = attempt.score
+    perfect = 1 if attempt.is_perfect_score() else 0
+
+    # A newer week restarts the weekly count; an attempt of an older week leaves it alone
+    newer_week = Q(week_start__isnull=True) | Q(week_start__lt=week_start)
+    rows = UserQuizStats.objects.filter(user_id=attempt.user_id)
+    updates = {
+        'quizzes_completed': F('quizzes_completed') + 1,
+        'total_score': F('total_score') + score,
+        'average_score': (F('total_score') + score) / (F('quizzes_completed') + 1),
+        'best_score': Greatest(F('best_score'), Value(score)),
+        'perfect_scores': F('perfect_scores') + perfect,
+        'week_start': Case(
+            When(newer_week, then=Value(week_start)), default=F('week_start'), output_field=DateTimeField(),
+        ),
+        'weekly_completed': Case(
+            When(newer_week, then=Value(1)),
+            When(week_start=week_start, then=F('weekly_completed') + 1),
+            default=F('weekly_completed'), output_field=PositiveIntegerField(),
+        ),
+        'last_completed_at': Case(
+            When(Q(last_completed_at__isnull=True) | Q(last_completed_at__lt=completed_at),
+                 then=Value(completed_at)),
+            default=F('last_completed_at'), output_field=DateTimeField(),
+        ),
+        'updated_at': timezone.now(),
+    }
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            UserQuizStats.objects.create(
+                user_id=attempt.user_id,
+                quizzes_completed=1,
+                total_score=score,
+                average_score=score,
+                best_score=score,
+                perfect_scores=perfect,
+                week_start=week_start,
+                weekly_completed=1,
+                last_completed_at=completed_at,
+            )
+    except IntegrityError:
+        # Another completion created the row first
+        rows.update(**updates)
+
+
+def record_quiz_progress(attempt):
+    """Add a completed attempt to the user's ``UserQuizProgress`` row in one statement"""
+    score, seconds = attempt.score, attempt.time_taken_seconds
+    # Higher score wins, then the faster time
+    improved = Q(best_score__lt=score) | Q(best_score=score, best_time_seconds__gt=seconds)
+    rows = UserQuizProgress.objects.filter(user_id=attempt.user_id, quiz_id=attempt.quiz_id)
+    updates = {
+        'attempts_completed': F('attempts_completed') + 1,
+        'best_score': Case(
+            When(improved, then=Value(score)), default=F('best_score'), output_field=FloatField(),
+        ),
+        'best_time_seconds': Case(
+            When(improved, then=Value(seconds)), default=F('best_time_seconds'),
+            output_field=PositiveIntegerField(),
+        ),
+        'last_completed_at': Case(
+            When(Q(last_completed_at__isnull=True) | Q(last_completed_at__lt=attempt.completed_at),
+                 then=Value(attempt.completed_at)),
+            default=F('last_completed_at'), output_field=DateTimeField(),
+        ),
+    }
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            UserQuizProgress.objects.create(
+                user_id=attempt.user_id,
+                quiz_id=attempt.quiz_id,
+                attempts_completed=1,
+                best_score=score,
+                best_time_seconds=seconds,
+                last_completed_at=attempt.completed_at,
+            )
+    except IntegrityError:
+        # Another completion created the row first
+        rows.update(**updates)
+
+
+def backfill_quiz_stats(chunk_size=CHUNK_SIZE):
+    """Rebuild ``UserQuizStats`` from completed attempts; yields rows written per chunk.
+
+    Users are processed in chunks of ``chunk_size`` ids, each upserted in
+    one statement, so the command can be re-run safely.
+    """
+    week_start = current_week_start()
+    completed = QuizAttempt.objects.filter(is_completed=True).order_by()
+    user_ids = completed.values_list('user_id', flat=True).distinct().order_by('user_id')
+
+    last = 0
+    while True:
+        chunk = list(user_ids.filter(user_id__gt=last)[:chunk_size])
+        if not chunk:
+            break
+        rows = completed.filter(user_id__in=chunk).values('user_id').annotate(
+            count=Count('pk'),
+            total=Sum('score'),
+            best=Max('score'),
+            perfect=Count('pk', filter=Q(score=100.0)),
+            weekly=Count('pk', filter=Q(completed_at__gte=week_start)),
+            last_completed=Max('completed_at'),
+        )
+        UserQuizStats.objects.bulk_create([
+            UserQuizStats(
+                user_id=row['user_id'],
+                quizzes_completed=row['count'],
+                total_score=row['total'] or 0.0,
+                average_score=(row['total'] or 0.0) / row['count'],
+                best_score=row['best'] or 0.0,
+                perfect_scores=row['perfect'],
+                week_start=week_start,
+                weekly_completed=row['weekly'],
+                last_completed_at=row['last_completed'],
+            )
+            for row in rows
+        ], update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[
+                'quizzes_completed', 'total_score', 'average_score', 'best_score',
+                'perfect_scores', 'week_start', 'weekly_completed', 'last_completed_at',
+                'updated_at',
+            ])
+        last = chunk[-1]
+        yield len(chunk)
+
+
+def backfill_quiz_progress(chunk_size=CHUNK_SIZE):
+    """Rebuild ``UserQuizProgress`` from completed attempts; yields users processed per chunk"""
+    completed = QuizAttempt.objects.filter(is_completed=True).order_by()
+    user_ids = completed.values_list('user_id', flat=True).distinct().order_by('user_id')
+
+    last = 0
+    while True:
+        chunk = list(user_ids.filter(user_id__gt=last)[:chunk_size])
+        if not chunk:
+            break
+        progress = {}
+        attempts = completed.filter(user_id__in=chunk).values_list(
+            'user_id', 'quiz_id', 'score', 'time_taken_seconds', 'completed_at',
+        )
+        for user_id, quiz_id, score, seconds, completed_at in attempts.iterator(chunk_size=5000):
+            row = progress.get((user_id, quiz_id))
+            if row is None:
+                progress[(user_id, quiz_id)] = UserQuizProgress(
+                    user_id=user_id, quiz_id=quiz_id, attempts_completed=1,
+                    best_score=score, best_time_seconds=seconds, last_completed_at=completed_at,
+                )
+                continue
+            row.attempts_completed += 1
+            if (score, -seconds) > (row.best_score, -row.best_time_seconds):
+                row.best_score, row.best_time_seconds = score, seconds
+            if completed_at and (row.last_completed_at is None or completed_at > row.last_completed_at):
+                row.last_completed_at = completed_at
+        UserQuizProgress.objects.bulk_create(
+            progress.values(), batch_size=1000, update_conflicts=True,
+            unique_fields=['user', 'quiz'],
+            update_fields=['attempts_completed', 'best_score', 'best_time_seconds', 'last_completed_at'],
+        )
+        last = chunk[-1]
+        yield len(chunk)
+
+
+def rebuild_quiz_totals(quiz_ids=None):
+    """Recompute ``QuizStats`` of the given quizzes (all when None); returns rows written"""
+    quizzes = Quiz.objects.all() if quiz_ids is None else Quiz.objects.filter(pk__in=quiz_ids)
+    quiz_ids = list(quizzes.values_list('pk', flat=True))
+    questions = dict(
+        Question.objects.filter(quiz_id__in=quiz_ids).order_by().values('quiz_id').annotate(
+            count=Count('pk')
+        ).values_list('quiz_id', 'count')
+    )
+    attempts = {
+        row['quiz_id']: row
+        for row in QuizAttempt.objects.filter(quiz_id__in=quiz_ids).order_by().values('quiz_id').annotate(
+            started=Count('pk'),
+            completed=Count('pk', filter=Q(is_completed=True)),
+            score_sum=Sum('score', filter=Q(is_completed=True)),
+        )
+    }
+    rows = [
+        QuizStats(
+            quiz_id=quiz_id,
+            question_count=questions.get(quiz_id, 0),
+            attempts_started=attempts.get(quiz_id, {}).get('started', 0),
+            attempts_completed=attempts.get(quiz_id, {}).get('completed', 0),
+            score_sum=attempts.get(quiz_id, {}).get('score_sum') or 0.0,
+        )
+        for quiz_id in quiz_ids
+    ]
+    QuizStats.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['quiz'],
+        update_fields=['question_count', 'attempts_started', 'attempts_completed', 'score_sum', 'updated_at'],
+    )
+    return len(rows)
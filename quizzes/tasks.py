@@ -0,0 +1,22 @@
+"""
+Background tasks of the quizzes app, run by ``manage.py runworker``.
+"""
+from datetime import timedelta
+from django.utils import timezone
+
+from jobs.queue import task
+from .analysis import analyze_questions
+from .answer_log import archive_attempts
+
+
+@task
+def analyze_quiz_questions(quiz_ids=None):
+    """Refresh item analysis in the background, e.g. after a quiz closes"""
+    analyze_questions(quiz_ids)
+
+
+@task
+def archive_quiz_answers(older_than_days=30):
+    """Pack the answers of attempts completed more than ``older_than_days`` ago"""
+    for _ in archive_attempts(timezone.now() - timedelta(days=older_than_days)):
+        pass
@@ -0,0 +1,236 @@
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from . import content
+from .answer_log import MAX_ID, LoggedAnswer, archive_attempts, attempt_answers, decode, encode
+from .completion import complete_attempt
+from .importer import InvalidImport, import_quizzes, iter_records
+from .models import Answer, Question, Quiz, QuizAttempt, QuizCategory, UserAnswer
+
+
+def make_quiz(questions=3):
+    """A multiple-choice quiz whose first answer to each question is the right one"""
+    category = QuizCategory.objects.create(name='Recycling', description='Sorting waste')
+    quiz = Quiz.objects.create(title='Sorting', description='', category=category, difficulty='beginner')
+    for order in range(questions):
+        question = Question.objects.create(quiz=quiz, text=f'Question {order}', order=order)
+        Answer.objects.create(question=question, text='Right', is_correct=True, order=0)
+        Answer.objects.create(question=question, text='Wrong', order=1)
+    # Saving content bumped the version
+    quiz.refresh_from_db()
+    return quiz
+
+
+class QuizTestCase(TestCase):
+    def setUp(self):
+        # Quiz ids are reused once a test rolls back, so drop compiled content
+        content._cache.clear()
+        self.quiz = make_quiz()
+        self.questions = list(self.quiz.questions.order_by('order'))
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+
+    def choice(self, question, correct=True):
+        return question.answers.get(is_correct=correct)
+
+
+class AnswerLogTests(QuizTestCase):
+    def test_round_trip(self):
+        answers = [
+            LoggedAnswer(question_id, answer_id, question_id % 3 == 0, text)
+            for question_id, answer_id, text in [
+                (12, 120, ''), (3, None, 'compost ♻'), (MAX_ID, MAX_ID, ''), (5, 0, ''),
+                (1, 10, ''), (9, None, ''), (7, 70, ''), (2, 20, 'glass'), (4, 40, ''), (8, 80, ''),
+            ]
+        ]
+        decoded = decode(encode(answers))
+        expected = sorted(answers, key=lambda answer: answer.question_id)
+        # 0 is the "no answer" marker
+        expected = [answer._replace(answer_id=answer.answer_id or None) for answer in expected]
+        self.assertEqual(decoded, expected)
+        self.assertEqual(decode(encode([])), [])
+
+    def test_values_that_do_not_fit(self):
+        with self.assertRaises(ValueError):
+            encode([LoggedAnswer(0, 1, True, '')])
+        with self.assertRaises(ValueError):
+            encode([LoggedAnswer(1, MAX_ID + 1, True, '')])
+        with self.assertRaises(ValueError):
+            decode(b'\x01' + encode([])[1:])
+
+    def test_archived_answers_read_back(self):
+        attempt = QuizAttempt.objects.create(
+            user=self.user, quiz=self.quiz, total_questions=3, is_completed=True,
+            completed_at=timezone.now() - timedelta(days=1),
+        )
+        for question, correct in zip(self.questions, (True, True, False)):
+            UserAnswer.objects.create(
+                attempt=attempt, question=question, selected_answer=self.choice(question, correct), is_correct=correct,
+            )
+
+        def summary():
+            return [
+                (answer.question.pk, answer.selected_answer.pk, answer.is_correct)
+                for answer in attempt_answers(attempt)
+            ]
+
+        before = summary()
+        self.assertEqual(sum(archive_attempts(timezone.now())), 1)
+        attempt.refresh_from_db()
+        self.assertTrue(attempt.answers_archived)
+        self.assertFalse(UserAnswer.objects.exists())
+        self.assertEqual(summary(), before)
+
+        # Answers are stored by id, so content edits do not shift them
+        Answer.objects.create(question=self.questions[0], text='Also wrong', order=0)
+        self.assertEqual(summary(), before)
+        self.choice(self.questions[1]).delete()
+        self.assertEqual(summary(), [before[0], before[2]])
+        # Already archived attempts are left alone
+        self.assertEqual(sum(archive_attempts(timezone.now())), 0)
+
+
+class SubmitAnswerTests(QuizTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.attempt = QuizAttempt.objects.create(user=self.user, quiz=self.quiz, total_questions=3)
+
+    def submit(self, question, correct=True):
+        return self.client.post(
+            reverse('quizzes:submit_answer', kwargs={'attempt_id': self.attempt.pk}),
+            json.dumps({'question_id': question.pk, 'answer_id': self.choice(question, correct).pk}),
+            content_type='application/json',
+        )
+
+    def counters(self):
+        return QuizAttempt.objects.filter(pk=self.attempt.pk).values_list('answered_count', 'correct_answers').get()
+
+    def test_answers_are_counted_until_complete(self):
+        responses = [self.submit(question, correct) for question, correct in zip(self.questions, (True, False, True))]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        self.assertEqual([response.json()['is_complete'] for response in responses], [False, False, True])
+        self.assertIn('redirect_url', responses[-1].json())
+        self.assertEqual(self.counters(), (3, 2))
+
+    def test_duplicate_answer_is_rejected(self):
+        self.assertEqual(self.submit(self.questions[0]).status_code, 200)
+        response = self.submit(self.questions[0], correct=False)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Question already answered')
+        # The rejected answer's increments were rolled back
+        self.assertEqual(self.counters(), (1, 1))
+        self.assertEqual(UserAnswer.objects.get().is_correct, True)
+
+    def test_concurrent_answer_to_the_same_question(self):
+        question = self.questions[0]
+        compiled_quiz = content.compiled_quiz
+
+        def other_request_first(quiz):
+            # Another request answers after this one loaded the attempt
+            UserAnswer.objects.create(
+                attempt=self.attempt, question=question, selected_answer=self.choice(question, False),
+            )
+            QuizAttempt.objects.filter(pk=self.attempt.pk).update(answered_count=F('answered_count') + 1)
+            return compiled_quiz(quiz)
+
+        with mock.patch('quizzes.views.compiled_quiz', side_effect=other_request_first):
+            response = self.submit(question)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.counters(), (1, 0))
+        self.assertEqual(UserAnswer.objects.count(), 1)
+
+    def test_answer_racing_completion(self):
+        compiled_quiz = content.compiled_quiz
+
+        def completed_first(quiz):
+            QuizAttempt.objects.filter(pk=self.attempt.pk).update(is_completed=True)
+            return compiled_quiz(quiz)
+
+        with mock.patch('quizzes.views.compiled_quiz', side_effect=completed_first):
+            response = self.submit(self.questions[0])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Quiz attempt already completed')
+        self.assertEqual(self.counters(), (0, 0))
+        self.assertFalse(UserAnswer.objects.exists())
+
+    def test_completion_counts_answers_submitted_after_loading(self):
+        stale = QuizAttempt.objects.select_related('quiz').get(pk=self.attempt.pk)
+        for question, correct in zip(self.questions, (True, True, False)):
+            self.submit(question, correct)
+
+        result = complete_attempt(stale)
+        self.assertTrue(result.completed)
+        self.assertEqual((stale.answered_count, stale.correct_answers), (3, 2))
+        self.assertAlmostEqual(QuizAttempt.objects.get(pk=self.attempt.pk).score, 200 / 3)
+
+        # Completing it again changes nothing
+        again = complete_attempt(QuizAttempt.objects.select_related('quiz').get(pk=self.attempt.pk))
+        self.assertFalse(again.completed)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_eco_tokens, result.tokens_awarded)
+        self.assertEqual(self.user.experience_points, result.experience_gained)
+        self.assertEqual(self.submit(self.questions[0]).status_code, 404)
+
+
+class ImporterTests(TestCase):
+    def setUp(self):
+        content._cache.clear()
+
+    def test_records_split_across_reads(self):
+        records = [
+            {'model': 'quizzes.quizcategory', 'pk': 1, 'fields': {'name': 'Odd, "quoted" ] [ name'}},
+            {'model': 'quizzes.quiz', 'pk': 2, 'fields': {'prerequisite_quizzes': [1, 3]}},
+        ]
+        text = json.dumps(records, indent=2)
+        self.assertEqual(list(iter_records(io.StringIO(text), read_size=5)), records)
+        self.assertEqual(list(iter_records(io.StringIO(' [ ] '))), [])
+
+    def test_malformed_files(self):
+        for text in ('{"model": "quizzes.quiz"}', '[{"model": ', '[1, 2', ''):
+            with self.subTest(text=text), self.assertRaises(InvalidImport):
+                list(iter_records(io.StringIO(text), read_size=4))
+
+    def run_import(self, handle):
+        with transaction.atomic():
+            return list(import_quizzes(handle, batch_size=10))
+
+    def test_reimport_updates_in_place(self):
+        path = settings.BASE_DIR / 'sample_quiz_data.json'
+        with open(path, encoding='utf-8') as handle:
+            records = json.load(handle)
+            handle.seek(0)
+            self.run_import(handle)
+        models = (QuizCategory, Quiz, Question, Answer)
+        counts = [model.objects.count() for model in models]
+        self.assertEqual(sum(counts), len(records))
+        versions = dict(Quiz.objects.values_list('pk', 'content_version'))
+
+        with open(path, encoding='utf-8') as handle:
+            self.run_import(handle)
+        self.assertEqual([model.objects.count() for model in models], counts)
+        # Re-imported content invalidates compiled quizzes
+        for pk, version in Quiz.objects.values_list('pk', 'content_version'):
+            self.assertGreater(version, versions[pk])
+
+    def test_invalid_batch_is_reported(self):
+        records = [
+            {'model': 'quizzes.quizcategory', 'pk': 1, 'fields': {'name': 'Energy', 'description': 'Power'}},
+            {'model': 'quizzes.question', 'pk': 1, 'fields': {'quiz': 999, 'text': 'Orphan'}},
+        ]
+        with self.assertRaisesMessage(InvalidImport, 'quizzes.question 1: quiz: quizzes.quiz 999 does not exist'):
+            self.run_import(io.StringIO(json.dumps(records)))
+        self.assertFalse(QuizCategory.objects.exists())
+
+        with self.assertRaisesMessage(InvalidImport, 'unknown field "colour"'):
+            self.run_import(io.StringIO(json.dumps([
+                {'model': 'quizzes.quizcategory', 'pk': 1, 'fields': {'colour': '#fff'}},
+            ])))
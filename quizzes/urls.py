@@ -11,6 +11,7 @@ urlpatterns = [
     path('quiz/<int:quiz_id>/start/', views.start_quiz, name='start'),
     path('take/<int:attempt_id>/', views.take_quiz, name='take_quiz'),
     path('submit/<int:attempt_id>/', views.submit_answer, name='submit_answer'),
+    path('submit/<int:attempt_id>/all/', views.submit_quiz, name='submit_quiz'),
     path('complete/<int:attempt_id>/', views.complete_quiz, name='complete'),
     path('leaderboard/<int:quiz_id>/', views.quiz_leaderboard, name='leaderboard'),
 ]
@@ -1,7 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.http import require_POST
@@ -9,9 +10,13 @@ from django.urls import reverse
 import json
 import random
 
-from .models import QuizCategory, Quiz, Question, Answer, QuizAttempt, UserAnswer
-from rewards.views import award_tokens
-from accounts.models import UserProfile
+from .models import QuizCategory, Quiz, QuizAttempt, QuizStats, UserAnswer, UserQuizProgress
+from .answer_log import attempt_answers
+from .content import compiled_quiz
+from .completion import complete_attempt
+from .leaderboard import QUIZ_PERIODS, board_rows
+from leaderboards.pagination import queryset_page
+from leaderboards.periods import period_bounds
 
 
 def quiz_categories(request):
@@ -26,38 +31,40 @@ def quiz_list(request, category_id=None):
     Display quizzes, optionally filtered by category.
     Includes quiz_progress when user is authenticated.
     """
-    quizzes = Quiz.objects.filter(is_active=True).select_related('category')
+    quizzes = Quiz.objects.filter(is_active=True).select_related('category', 'stats')
 
     category = None
     if category_id:
         category = get_object_or_404(QuizCategory, id=category_id, is_active=True)
         quizzes = quizzes.filter(category=category)
 
+    quizzes = list(quizzes)
     context = {'quizzes': quizzes, 'category': category}
 
-    # Add user progress info if logged in
+    # Add user progress info if logged in (one query for the whole page)
     if request.user.is_authenticated:
-        user_attempts = QuizAttempt.objects.filter(
-            user=request.user,
-            is_completed=True
-        ).values_list('quiz_id', flat=True)
+        progress = {
+            row.quiz_id: row
+            for row in UserQuizProgress.objects.filter(
+                user=request.user,
+                quiz_id__in=[quiz.id for quiz in quizzes]
+            )
+        }
 
         quiz_progress = []
         for quiz in quizzes:
+            row = progress.get(quiz.id)
             progress_info = {
                 'quiz': quiz,
-                'completed': quiz.id in user_attempts,
+                'completed': row is not None,
                 # guard if user object doesn't have `level` attribute
                 'can_access': getattr(request.user, 'level', 1) >= getattr(quiz, 'min_level_required', 1),
             }
 
-            if quiz.id in user_attempts:
-                best_attempt = QuizAttempt.objects.filter(
-                    user=request.user,
-                    quiz=quiz,
-                    is_completed=True
-                ).order_by('-score', 'time_taken_seconds').first()
-                progress_info['best_score'] = best_attempt.score if best_attempt else 0
+            if row is not None:
+                progress_info['best_score'] = row.best_score
+                progress_info['best_time_seconds'] = row.best_time_seconds
+                progress_info['attempts'] = row.attempts_completed
 
             quiz_progress.append(progress_info)
 
@@ -109,12 +116,14 @@ def start_quiz(request, quiz_id):
         return redirect(reverse('quizzes:detail', kwargs={'quiz_id': quiz_id}))
 
     # Create new attempt
-    attempt = QuizAttempt.objects.create(
-        user=request.user,
-        quiz=quiz,
-        total_questions=quiz.get_questions_count() if hasattr(quiz, 'get_questions_count') else quiz.questions.count(),
-        started_at=timezone.now()
-    )
+    with transaction.atomic():
+        attempt = QuizAttempt.objects.create(
+            user=request.user,
+            quiz=quiz,
+            total_questions=len(compiled_quiz(quiz)),
+            started_at=timezone.now()
+        )
+        QuizStats.add(quiz.id, attempts_started=1)
 
     return redirect(reverse('quizzes:take_quiz', kwargs={'attempt_id': attempt.id}))
 
@@ -123,16 +132,14 @@ def start_quiz(request, quiz_id):
 def take_quiz(request, attempt_id):
     """Render the quiz-taking page with questions and already answered state."""
     attempt = get_object_or_404(
-        QuizAttempt,
+        QuizAttempt.objects.select_related('quiz'),
         id=attempt_id,
         user=request.user,
         is_completed=False
     )
 
-    # Load questions related to the quiz
-    # Assumes Quiz model has related_name 'questions'
-    questions_qs = attempt.quiz.questions.prefetch_related('answers').all()
-    questions = list(questions_qs)
+    # Compiled content is cached per quiz version, so this normally hits no tables
+    questions = list(compiled_quiz(attempt.quiz).questions)
 
     if getattr(attempt.quiz, 'randomize_questions', False):
         random.shuffle(questions)
@@ -150,6 +157,33 @@ def take_quiz(request, attempt_id):
     return render(request, 'quizzes/take_quiz.html', context)
 
 
+def _grade_answer(content, question, answer_id, text_answer):
+    """
+    Grade one response against the compiled answer key.
+    Returns (selected_answer, is_correct, error) where error is a JsonResponse for invalid input.
+    """
+    selected_answer = None
+    is_correct = False
+
+    # Determine correctness depending on question type
+    if question.question_type in ['multiple_choice', 'true_false']:
+        if not answer_id:
+            return None, False, JsonResponse({'error': 'Missing answer_id for this question'}, status=400)
+        selected_answer = content.answer(question.id, answer_id)
+        if selected_answer is None:
+            return None, False, JsonResponse({'error': 'Answer not found for this question'}, status=404)
+        is_correct = selected_answer.is_correct
+    elif question.question_type == 'fill_blank':
+        correct_text = content.correct_text(question.id)
+        # if no correct answer defined, treat as incorrect
+        is_correct = correct_text is not None and (text_answer or '').lower().strip() == correct_text.lower().strip()
+    else:
+        # fallback for other question types (mark incorrect)
+        is_correct = False
+
+    return selected_answer, is_correct, None
+
+
 @login_required
 @require_POST
 def submit_answer(request, attempt_id):
@@ -159,7 +193,7 @@ def submit_answer(request, attempt_id):
     Returns JSON: { is_correct, is_complete, explanation?, redirect_url? }
     """
     attempt = get_object_or_404(
-        QuizAttempt,
+        QuizAttempt.objects.select_related('quiz'),
         id=attempt_id,
         user=request.user,
         is_completed=False
@@ -178,55 +212,42 @@ def submit_answer(request, attempt_id):
     if not question_id:
         return JsonResponse({'error': 'Missing question_id'}, status=400)
 
-    question = get_object_or_404(Question, id=question_id, quiz=attempt.quiz)
-
-    # Prevent duplicate answers (race-safe with transaction)
-    if UserAnswer.objects.filter(attempt=attempt, question=question).exists():
-        return JsonResponse({'error': 'Question already answered'}, status=400)
-
-    selected_answer = None
-    is_correct = False
-
-    # Determine correctness depending on question type
-    if question.question_type in ['multiple_choice', 'true_false']:
-        if not answer_id:
-            return JsonResponse({'error': 'Missing answer_id for this question'}, status=400)
-        selected_answer = get_object_or_404(Answer, id=answer_id, question=question)
-        is_correct = bool(selected_answer.is_correct)
-    elif question.question_type == 'fill_blank':
-        # assume question.get_correct_answer() returns an Answer-like object or text
-        correct = None
-        if hasattr(question, 'get_correct_answer'):
-            correct = question.get_correct_answer()
-        if correct:
-            # support both Answer-like or plain text
-            correct_text = getattr(correct, 'text', correct)
-            is_correct = text_answer.lower().strip() == str(correct_text).lower().strip()
-        else:
-            # if no correct answer defined, treat as incorrect
-            is_correct = False
-    else:
-        # fallback for other question types (mark incorrect)
-        is_correct = False
+    content = compiled_quiz(attempt.quiz)
+    question = content.question(question_id)
+    if question is None:
+        return JsonResponse({'error': 'Question not found in this quiz'}, status=404)
 
-    # Save answer and update attempt atomically
-    with transaction.atomic():
-        user_answer = UserAnswer.objects.create(
-            attempt=attempt,
-            question=question,
-            selected_answer=selected_answer,
-            text_answer=text_answer,
-            is_correct=is_correct
-        )
+    selected_answer, is_correct, error = _grade_answer(content, question, answer_id, text_answer)
+    if error is not None:
+        return error
 
-        if is_correct:
-            # ensure field exists on model
-            attempt.correct_answers = getattr(attempt, 'correct_answers', 0) + 1
-            attempt.save(update_fields=['correct_answers'])
+    # One conditional update and one insert: the unique (attempt, question)
+    # constraint rejects duplicates and rolls the counters back, and F()
+    # keeps concurrent submissions from losing an increment
+    try:
+        with transaction.atomic():
+            updated = QuizAttempt.objects.filter(pk=attempt.pk, is_completed=False).update(
+                answered_count=F('answered_count') + 1,
+                correct_answers=F('correct_answers') + int(is_correct),
+            )
+            if not updated:
+                return JsonResponse({'error': 'Quiz attempt already completed'}, status=400)
+            UserAnswer.objects.create(
+                attempt=attempt,
+                question_id=question.id,
+                selected_answer_id=selected_answer.id if selected_answer else None,
+                text_answer=text_answer,
+                is_correct=is_correct
+            )
+            # Read back while our update holds the row, so of two concurrent
+            # last answers exactly one sees the attempt complete
+            total_answered = QuizAttempt.objects.filter(pk=attempt.pk).values_list(
+                'answered_count', flat=True
+            ).get()
+    except IntegrityError:
+        return JsonResponse({'error': 'Question already answered'}, status=400)
 
-    # Check completion
-    total_answered = UserAnswer.objects.filter(attempt=attempt).count()
-    is_complete = total_answered >= (attempt.total_questions or (attempt.quiz.get_questions_count() if hasattr(attempt.quiz, 'get_questions_count') else attempt.quiz.questions.count()))
+    is_complete = total_answered >= (attempt.total_questions or len(content))
 
     response_data = {
         'is_correct': is_correct,
@@ -241,93 +262,102 @@ def submit_answer(request, attempt_id):
     return JsonResponse(response_data)
 
 
+@login_required
+@require_POST
+def submit_quiz(request, attempt_id):
+    """
+    Submit every answer of an attempt in one request and complete it.
+    Expects JSON body: { answers: [{ question_id, answer_id?, text_answer? }, ...] }.
+    Questions already answered keep their recorded answer; unanswered ones count as incorrect.
+    Returns JSON: { results: [{ question_id, is_correct, explanation }], score, redirect_url }
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except (ValueError, json.JSONDecodeError):
+        return HttpResponseBadRequest('Invalid JSON')
+
+    responses = data.get('answers') if isinstance(data, dict) else None
+    if not isinstance(responses, list):
+        return JsonResponse({'error': 'Missing answers list'}, status=400)
+
+    with transaction.atomic():
+        # Lock the attempt so a concurrent submit or completion waits for this one
+        attempt = get_object_or_404(
+            QuizAttempt.objects.select_for_update(of=('self',)).select_related('quiz'),
+            id=attempt_id,
+            user=request.user,
+            is_completed=False
+        )
+        content = compiled_quiz(attempt.quiz)
+        show_explanations = getattr(attempt.quiz, 'show_correct_answers', False)
+        answered = dict(UserAnswer.objects.filter(attempt=attempt).values_list('question_id', 'is_correct'))
+
+        # Grade everything in memory before writing anything
+        user_answers = []
+        results = []
+        seen = set()
+        for response in responses:
+            if not isinstance(response, dict) or not response.get('question_id'):
+                return JsonResponse({'error': 'Missing question_id'}, status=400)
+            question = content.question(response['question_id'])
+            if question is None:
+                return JsonResponse({'error': 'Question not found in this quiz'}, status=404)
+            if question.id in seen:
+                return JsonResponse({'error': 'Question answered twice'}, status=400)
+            seen.add(question.id)
+
+            if question.id in answered:
+                is_correct = answered[question.id]
+            else:
+                text_answer = response.get('text_answer', '')
+                selected_answer, is_correct, error = _grade_answer(content, question, response.get('answer_id'), text_answer)
+                if error is not None:
+                    return error
+                user_answers.append(UserAnswer(
+                    attempt=attempt,
+                    question_id=question.id,
+                    selected_answer_id=selected_answer.id if selected_answer else None,
+                    text_answer=text_answer,
+                    is_correct=is_correct
+                ))
+            results.append({
+                'question_id': question.id,
+                'is_correct': is_correct,
+                'explanation': question.explanation if show_explanations else '',
+            })
+
+        UserAnswer.objects.bulk_create(user_answers)
+        QuizAttempt.objects.filter(pk=attempt.pk).update(
+            answered_count=F('answered_count') + len(user_answers),
+            correct_answers=F('correct_answers') + sum(answer.is_correct for answer in user_answers),
+        )
+        _finish_attempt(request, attempt)
+
+    return JsonResponse({
+        'results': results,
+        'score': attempt.score,
+        'redirect_url': reverse('quizzes:complete', kwargs={'attempt_id': attempt.id}),
+    })
+
+
+def _finish_attempt(request, attempt):
+    """Complete an open attempt and announce a level-up"""
+    result = complete_attempt(attempt)
+    if result.leveled_up:
+        messages.success(request, f"Congratulations! You leveled up to level {result.level}!")
+    return result
+
+
 @login_required
 def complete_quiz(request, attempt_id):
     """Finish attempt (if not already finished), award tokens/XP and present results."""
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id, user=request.user)
+    attempt = get_object_or_404(QuizAttempt.objects.select_related('quiz'), id=attempt_id, user=request.user)
 
     if not attempt.is_completed:
-        with transaction.atomic():
-            # Ensure calculate_score exists; otherwise compute safe fallback
-            if hasattr(attempt, 'calculate_score'):
-                attempt.calculate_score()
-            else:
-                # fallback: compute percent using correct answers / total_questions
-                correct = getattr(attempt, 'correct_answers', UserAnswer.objects.filter(attempt=attempt, is_correct=True).count())
-                total = attempt.total_questions or (attempt.quiz.get_questions_count() if hasattr(attempt.quiz, 'get_questions_count') else attempt.quiz.questions.count())
-                attempt.score = round((correct / total) * 100, 1) if total else 0
-
-            attempt.is_completed = True
-            attempt.completed_at = timezone.now()
-
-            # Calculate time taken if started_at exists
-            if getattr(attempt, 'started_at', None):
-                time_taken = (attempt.completed_at - attempt.started_at).total_seconds()
-                attempt.time_taken_seconds = int(time_taken)
-            else:
-                attempt.time_taken_seconds = getattr(attempt, 'time_taken_seconds', 0)
-
-            # Award tokens/bonuses
-            base_tokens = getattr(attempt.quiz, 'base_tokens_reward', 0)
-            bonus_tokens = 0
-
-            if hasattr(attempt, 'is_perfect_score') and attempt.is_perfect_score():
-                bonus_tokens += getattr(attempt.quiz, 'perfect_score_bonus', 0)
-
-            if hasattr(attempt, 'get_time_bonus_tokens'):
-                try:
-                    bonus_tokens += int(attempt.get_time_bonus_tokens())
-                except Exception:
-                    # if method exists but fails, ignore bonus
-                    pass
-
-            total_tokens = base_tokens + bonus_tokens
-            attempt.tokens_earned = total_tokens
-            attempt.experience_gained = total_tokens  # can be changed if desired
-
-            attempt.save()
-
-            # Try awarding tokens; if award_tokens fails, log message (award_tokens should handle exceptions)
-            try:
-                success, msg = award_tokens(
-                    user=request.user,
-                    source='quiz_completion',
-                    amount=total_tokens,
-                    description=f"Completed quiz: {attempt.quiz.title}",
-                    quiz_id=attempt.quiz.id
-                )
-            except Exception:
-                success, msg = False, 'Failed to award tokens'
-
-            # Add experience to user (if method exists)
-            leveled_up = False
-            if hasattr(request.user, 'add_experience'):
-                try:
-                    leveled_up = request.user.add_experience(attempt.experience_gained)
-                except Exception:
-                    leveled_up = False
-
-            # Update user profile safely
-            profile, created = UserProfile.objects.get_or_create(user=request.user)
-            profile.quizzes_completed = getattr(profile, 'quizzes_completed', 0) + 1
-            profile.total_quiz_score = getattr(profile, 'total_quiz_score', 0) + getattr(attempt, 'score', 0)
-            try:
-                profile.average_quiz_score = profile.total_quiz_score / profile.quizzes_completed
-            except Exception:
-                profile.average_quiz_score = getattr(profile, 'average_quiz_score', 0)
-            # update_streak might be optional
-            if hasattr(profile, 'update_streak'):
-                try:
-                    profile.update_streak()
-                except Exception:
-                    pass
-            profile.save()
-
-            if leveled_up:
-                messages.success(request, f"Congratulations! You leveled up to level {getattr(request.user, 'level', '?')}!")
+        _finish_attempt(request, attempt)
 
     # Collect answers for review
-    user_answers = UserAnswer.objects.filter(attempt=attempt).select_related('question', 'selected_answer').order_by('id')
+    user_answers = attempt_answers(attempt)
 
     context = {
         'attempt': attempt,
@@ -342,19 +372,23 @@ def complete_quiz(request, attempt_id):
 def quiz_leaderboard(request, quiz_id):
     """Display leaderboard for a specific quiz."""
     quiz = get_object_or_404(Quiz, id=quiz_id, is_active=True)
+    period = request.GET.get('period', 'all_time')
+    if period not in QUIZ_PERIODS:
+        period = 'all_time'
+    period_start, _ = period_bounds(period)
+    entries = board_rows(quiz, period, period_start)
 
-    top_attempts = QuizAttempt.objects.filter(
-        quiz=quiz,
-        is_completed=True
-    ).select_related('user').order_by('-score', 'time_taken_seconds')[:20]
+    page = queryset_page(entries.select_related('user'), request.GET.get('after'), size=20)
 
-    user_best = None
+    user_entry = None
     if request.user.is_authenticated:
-        user_best = QuizAttempt.objects.filter(
-            quiz=quiz,
-            user=request.user,
-            is_completed=True
-        ).order_by('-score', 'time_taken_seconds').first()
+        user_entry = entries.filter(user=request.user).first()
 
-    context = {'quiz': quiz, 'top_attempts': top_attempts, 'user_best': user_best}
+    context = {
+        'quiz': quiz,
+        'period': period,
+        'top_entries': page.entries,
+        'next_cursor': page.next_cursor,
+        'user_entry': user_entry,
+    }
     return render(request, 'quizzes/leaderboard.html', context)
@@ -9,6 +9,9 @@ from .models import (
     TokenEarningRule, DailyTokenLimit
 )
 from accounts.models import User
+from leaderboards.activity import record_activity
+from leaderboards.ranking import TOKEN_METRICS, schedule_user_update
+from leaderboards.seasons import credit_season_activity
 
 @login_required
 def token_dashboard(request):
@@ -99,6 +102,8 @@ def purchase_reward(request, reward_id):
             if reward.stock_quantity is not None:
                 reward.stock_quantity -= 1
                 reward.save()
+            
+            schedule_user_update(request.user, TOKEN_METRICS)
         
         messages.success(request, f"Successfully purchased {reward.name}!")
         return redirect('rewards:my_rewards')
@@ -179,5 +184,9 @@ def award_tokens(user, source, amount, description="", **kwargs):
         
         # Update daily limit
         daily_limit.add_tokens(amount)
+        record_activity(user, tokens_earned=amount)
+        credit_season_activity(user, source, amount)
+        
+        schedule_user_update(user, TOKEN_METRICS)
     
     return True, f"Earned {amount} eco-tokens!"